@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+"""嵌入向量缓存：按 (嵌入模型, 规范化文本哈希) 将向量持久化到本地 SQLite"""
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "vector_db/embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))  # 内存中缓存的查询向量数
+
+# 超出上限时一次淘汰到上限的这个比例，避免每次写入都触发淘汰
+EVICTION_TARGET_RATIO = 0.9
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：统一 Unicode 形式并合并空白，仅空白不同的文本共享缓存"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model_name: str, text: str) -> str:
+    """计算缓存键"""
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    磁盘嵌入向量缓存
+    向量以 float32 存储；按最近使用时间淘汰，条目数不超过 max_entries。
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        批量读取缓存，并刷新命中条目的最近使用时间
+        :param keys: 缓存键列表
+        :return: 命中的 键 -> 向量
+        """
+        unique_keys = list(dict.fromkeys(keys))
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            # SQLite 单条语句的参数个数有限，分批查询
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(unique_keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """批量写入缓存，超出容量时按最近使用时间淘汰"""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """删除最久未使用的条目，直到条目数降到上限的 EVICTION_TARGET_RATIO"""
+        excess = self._count - int(self.max_entries * EVICTION_TARGET_RATIO)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+        self._count -= excess
+        self.evictions += excess
+        logging.info(f"嵌入缓存淘汰 {excess} 条，剩余 {self._count} 条")
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._count = 0
+
+    def stats(self) -> Dict:
+        """缓存统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._count,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带缓存的嵌入模型包装
+    只对未命中缓存的文本调用底层模型，同一批次中重复的文本也只嵌入一次。
+    查询向量另有一层进程内 LRU，重复的检索查询不必访问磁盘缓存。
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache: Optional[EmbeddingCache] = None,
+                 query_cache_size: int = QUERY_EMBEDDING_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+        self.query_cache_size = query_cache_size
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_lock = threading.Lock()
+        self.query_hits = 0
+        self.query_misses = 0
+
+    def _get_query(self, key: str) -> Optional[List[float]]:
+        with self._query_lock:
+            vector = self._query_cache.get(key)
+            if vector is None:
+                self.query_misses += 1
+                return None
+            self._query_cache.move_to_end(key)
+            self.query_hits += 1
+            return vector
+
+    def _put_query(self, key: str, vector: List[float]):
+        if self.query_cache_size <= 0:
+            return
+        with self._query_lock:
+            self._query_cache[key] = vector
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+
+    def _lookup(self, texts: List[str]) -> Tuple[List[str], Dict[str, List[float]], List[str]]:
+        """查询缓存，返回 (各文本的键, 命中的向量, 需要嵌入的去重文本)"""
+        keys = [cache_key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(keys)
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return keys, found, list(missing.values())
+
+    def _store(self, keys: List[str], found: Dict[str, List[float]],
+               missing_texts: List[str], vectors: List[List[float]]) -> List[List[float]]:
+        new_items = {
+            cache_key(self.model_name, text): vector
+            for text, vector in zip(missing_texts, vectors)
+        }
+        self.cache.put_many(new_items)
+        found.update(new_items)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None or not texts:
+            return self.embeddings.embed_documents(texts)
+        keys, found, missing_texts = self._lookup(texts)
+        vectors = self.embeddings.embed_documents(missing_texts) if missing_texts else []
+        return self._store(keys, found, missing_texts, vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model_name, text)
+        vector = self._get_query(key)
+        if vector is None:
+            vector = self.embed_documents([text])[0]
+            self._put_query(key, vector)
+        return vector
+
+    async def aembed_documents_with_stats(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """
+        异步嵌入并返回本次命中缓存的文本数，供导入任务统计
+        :return: (向量列表, 命中数)
+        """
+        if self.cache is None or not texts:
+            return await self.embeddings.aembed_documents(texts), 0
+        keys, found, missing_texts = await asyncio.to_thread(self._lookup, texts)
+        vectors = await self.embeddings.aembed_documents(missing_texts) if missing_texts else []
+        hits = sum(1 for key in keys if key in found)
+        return await asyncio.to_thread(self._store, keys, found, missing_texts, vectors), hits
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, _ = await self.aembed_documents_with_stats(texts)
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model_name, text)
+        vector = self._get_query(key)
+        if vector is None:
+            vector = (await self.aembed_documents([text]))[0]
+            self._put_query(key, vector)
+        return vector
+
+    def query_cache_stats(self) -> Dict:
+        """查询向量内存缓存统计"""
+        with self._query_lock:
+            lookups = self.query_hits + self.query_misses
+            return {
+                "entries": len(self._query_cache),
+                "max_entries": self.query_cache_size,
+                "hits": self.query_hits,
+                "misses": self.query_misses,
+                "hit_rate": round(self.query_hits / lookups, 4) if lookups else None
+            }
+
+
+def create_embedding_cache() -> Optional[EmbeddingCache]:
+    """按环境变量创建缓存，未启用或无法打开时返回 None（直接调用嵌入模型）"""
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    try:
+        return EmbeddingCache()
+    except Exception as e:
+        logging.warning(f"嵌入缓存不可用，将直接调用嵌入模型: {str(e)}")
+        return None
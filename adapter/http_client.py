@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+"""OpenAI 兼容接口的共享 HTTP 客户端：连接池与 keep-alive、分阶段超时、带抖动的重试，以及连接池使用统计"""
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+OPENAI_HTTP_MAX_CONNECTIONS = int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "64"))  # 连接池最大连接数
+OPENAI_HTTP_MAX_KEEPALIVE = int(os.getenv("OPENAI_HTTP_MAX_KEEPALIVE", "32"))  # 保持空闲的最大连接数
+OPENAI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_HTTP_KEEPALIVE_EXPIRY", "60"))  # 空闲连接保留时间（秒）
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "false").lower() == "true"  # 需要安装 h2，未安装时使用 HTTP/1.1
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "120"))  # 两次读取之间的最长等待，流式回复按块计算
+OPENAI_WRITE_TIMEOUT = float(os.getenv("OPENAI_WRITE_TIMEOUT", "30"))
+OPENAI_POOL_TIMEOUT = float(os.getenv("OPENAI_POOL_TIMEOUT", "30"))  # 等待连接池空出连接的最长时间
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))  # 首次重试的退避上限（秒），之后逐次翻倍
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "8"))
+
+# 服务端限流或暂时不可用，请求未被处理，可以安全重试
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+# 请求未发出（连接失败），或复用的空闲连接已被服务端关闭、没有收到任何响应
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+
+class RetryPolicy:
+    """指数退避 + 全抖动：第 n 次重试等待 [0, min(最大值, 基数 * 2^n)] 内的随机时间，服务端给出 Retry-After 时优先采用"""
+
+    def __init__(self, max_retries: int = OPENAI_MAX_RETRIES, base_delay: float = OPENAI_RETRY_BASE_DELAY,
+                 max_delay: float = OPENAI_RETRY_MAX_DELAY):
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """
+        计算第 attempt 次重试（从 0 开始）前的等待时间
+        :param response: 触发重试的响应，带 Retry-After 头时按其等待（不超过最大值）
+        """
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(max(float(retry_after), 0.0), self.max_delay)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def should_retry(self, attempt: int, response: Optional[httpx.Response] = None) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return response is None or response.status_code in RETRY_STATUS_CODES
+
+
+class PoolStats:
+    """请求统计：进行中的请求数（含等待连接的请求，响应体读完或关闭才算结束）、峰值、重试与失败次数"""
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.retries = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def retried(self):
+        with self._lock:
+            self.retries += 1
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "max_connections": self.max_connections,
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "retries": self.retries,
+                "failures": self.failures
+            }
+
+
+def pool_usage(transport, stats: PoolStats) -> Dict:
+    """
+    连接池使用情况：在请求统计之外加上底层连接池（httpcore）中的连接数
+    utilization 为占用中的连接数 / 最大连接数；waiting 为正在等待空闲连接的请求数（排队即出现队头等待）
+    取不到底层连接池时按进行中的请求数估算
+    """
+    usage = stats.to_dict()
+    pool = getattr(transport, "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is None:
+        busy = min(usage["in_flight"], stats.max_connections)
+    else:
+        connections = list(connections)
+        idle = sum(1 for connection in connections if connection.is_idle())
+        busy = len(connections) - idle
+        usage.update({"connections": len(connections), "idle_connections": idle})
+    usage["busy_connections"] = busy
+    usage["waiting"] = max(usage["in_flight"] - busy, 0)
+    usage["utilization"] = round(busy / stats.max_connections, 4) if stats.max_connections else None
+    return usage
+
+
+class _TrackedStream(httpx.SyncByteStream):
+    """响应体包装：关闭时（读完或提前关闭）结束请求计数"""
+
+    def __init__(self, stream: httpx.SyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            try:
+                self._stream.close()
+            finally:
+                self._on_close()
+
+
+class _AsyncTrackedStream(httpx.AsyncByteStream):
+    """异步响应体包装：关闭时结束请求计数"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        if not self._closed:
+            self._closed = True
+            try:
+                await self._stream.aclose()
+            finally:
+                self._on_close()
+
+
+class RetryTransport(httpx.BaseTransport):
+    """在连接池传输层之上按重试策略重试，并统计连接池使用情况"""
+
+    def __init__(self, transport: httpx.HTTPTransport, policy: RetryPolicy, stats: PoolStats):
+        self.transport = transport
+        self.policy = policy
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            self.stats.started()
+            try:
+                response = self.transport.handle_request(request)
+            except RETRY_EXCEPTIONS as e:
+                self.stats.finished()
+                if not self.policy.should_retry(attempt):
+                    self.stats.failed()
+                    raise
+                delay = self.policy.delay(attempt)
+                logging.warning(f"请求 {request.url} 失败（{type(e).__name__}），{delay:.2f}s 后第 {attempt + 1} 次重试")
+            except BaseException:
+                self.stats.finished()
+                self.stats.failed()
+                raise
+            else:
+                if not self.policy.should_retry(attempt, response):
+                    response.stream = _TrackedStream(response.stream, self.stats.finished)
+                    return response
+                # 读完（很短的）错误响应体再关闭，连接可以放回连接池复用
+                response.read()
+                response.close()
+                self.stats.finished()
+                delay = self.policy.delay(attempt, response)
+                logging.warning(f"请求 {request.url} 返回 {response.status_code}，{delay:.2f}s 后第 {attempt + 1} 次重试")
+            self.stats.retried()
+            time.sleep(delay)
+            attempt += 1
+
+    def stats_dict(self) -> Dict:
+        return pool_usage(self.transport, self.stats)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """RetryTransport 的异步版本"""
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport, policy: RetryPolicy, stats: PoolStats):
+        self.transport = transport
+        self.policy = policy
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            self.stats.started()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except RETRY_EXCEPTIONS as e:
+                self.stats.finished()
+                if not self.policy.should_retry(attempt):
+                    self.stats.failed()
+                    raise
+                delay = self.policy.delay(attempt)
+                logging.warning(f"请求 {request.url} 失败（{type(e).__name__}），{delay:.2f}s 后第 {attempt + 1} 次重试")
+            except BaseException:
+                self.stats.finished()
+                self.stats.failed()
+                raise
+            else:
+                if not self.policy.should_retry(attempt, response):
+                    response.stream = _AsyncTrackedStream(response.stream, self.stats.finished)
+                    return response
+                await response.aread()
+                await response.aclose()
+                self.stats.finished()
+                delay = self.policy.delay(attempt, response)
+                logging.warning(f"请求 {request.url} 返回 {response.status_code}，{delay:.2f}s 后第 {attempt + 1} 次重试")
+            self.stats.retried()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats_dict(self) -> Dict:
+        return pool_usage(self.transport, self.stats)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def _http2_available() -> bool:
+    """HTTP/2 依赖 h2 包，启用但未安装时退回 HTTP/1.1"""
+    if not OPENAI_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logging.warning("OPENAI_HTTP2 已启用但未安装 h2（pip install httpx[http2]），使用 HTTP/1.1")
+        return False
+
+
+def create_http_clients(max_connections: int = OPENAI_HTTP_MAX_CONNECTIONS,
+                        max_keepalive: int = OPENAI_HTTP_MAX_KEEPALIVE,
+                        policy: Optional[RetryPolicy] = None) -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    创建共享的同步与异步 HTTP 客户端
+    :param max_connections: 连接池最大连接数
+    :param max_keepalive: 保持空闲的最大连接数
+    :param policy: 重试策略，默认按环境变量配置
+    :return: (同步客户端, 异步客户端)
+    """
+    policy = policy or RetryPolicy()
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=OPENAI_HTTP_KEEPALIVE_EXPIRY
+    )
+    timeout = httpx.Timeout(
+        connect=OPENAI_CONNECT_TIMEOUT,
+        read=OPENAI_READ_TIMEOUT,
+        write=OPENAI_WRITE_TIMEOUT,
+        pool=OPENAI_POOL_TIMEOUT
+    )
+    http2 = _http2_available()
+
+    sync_client = httpx.Client(
+        transport=RetryTransport(httpx.HTTPTransport(limits=limits, http2=http2), policy, PoolStats(max_connections)),
+        timeout=timeout
+    )
+    async_client = httpx.AsyncClient(
+        transport=AsyncRetryTransport(
+            httpx.AsyncHTTPTransport(limits=limits, http2=http2), policy, PoolStats(max_connections)
+        ),
+        timeout=timeout
+    )
+    return sync_client, async_client
+
+
+def client_pool_stats(client) -> Dict:
+    """客户端连接池统计（客户端未使用本模块的传输层时返回空字典）"""
+    transport = getattr(client, "_transport", None)
+    return transport.stats_dict() if hasattr(transport, "stats_dict") else {}
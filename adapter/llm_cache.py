@@ -0,0 +1,351 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from adapter.embedding_cache import EVICTION_TARGET_RATIO
+
+"""大模型响应缓存：按 (模型, 调用参数, 规范化消息) 缓存辅助调用的回复，内存 LRU + 本地 SQLite 两级"""
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "vector_db/llm_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+LLM_CACHE_MEMORY_SIZE = int(os.getenv("LLM_CACHE_MEMORY_SIZE", "256"))  # 内存中缓存的回复数
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))  # 回复的默认保留时间（秒），0 表示不过期
+# 启用缓存的调用点，逗号分隔；可写成 名称:秒数 为该调用点单独指定保留时间
+LLM_CACHE_SITES = os.getenv("LLM_CACHE_SITES", "chat_title,code_review,question_generation:3600")
+
+# 命中缓存时按流式接口回放，每个片段的字符数
+REPLAY_CHUNK_CHARS = 16
+
+
+def parse_cache_sites(value: str) -> Dict[str, Optional[int]]:
+    """解析调用点配置，返回 调用点 -> 保留时间（None 表示使用默认值）"""
+    sites: Dict[str, Optional[int]] = {}
+    for item in value.split(","):
+        name, _, ttl = item.strip().partition(":")
+        if name:
+            sites[name] = int(ttl) if ttl else None
+    return sites
+
+
+def normalize_message_text(text: str) -> str:
+    """
+    规范化消息文本：统一 Unicode 形式与换行符，去掉行尾空白和首尾空行
+    行首缩进保留（代码审查等提示词中的缩进有意义）
+    """
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n")
+    return "\n".join(line.rstrip() for line in text.strip("\n").split("\n")).strip("\n")
+
+
+def _message_key(message: BaseMessage) -> Dict[str, Any]:
+    content = message.content
+    if isinstance(content, str):
+        content = normalize_message_text(content)
+    item = {"type": message.type, "content": content}
+    if getattr(message, "tool_calls", None):
+        item["tool_calls"] = [
+            {"name": call["name"], "args": call["args"]} for call in message.tool_calls
+        ]
+    return item
+
+
+def response_cache_key(model_params: Dict[str, Any], messages: List[BaseMessage]) -> str:
+    """
+    计算缓存键
+    :param model_params: 模型标识与调用参数（模型名、温度、stop 等）
+    :param messages: 消息列表
+    :return: 十六进制摘要
+    """
+    payload = json.dumps(
+        {"model": model_params, "messages": [_message_key(message) for message in messages]},
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    两级大模型响应缓存
+    内存 LRU 存放最近使用的回复；SQLite 持久化，进程重启后仍可命中，按最近使用时间淘汰。
+    每条回复带过期时间，过期后视为未命中。命中情况按调用点统计。
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 memory_size: int = LLM_CACHE_MEMORY_SIZE):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.memory_size = memory_size
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, site TEXT NOT NULL, response TEXT NOT NULL, "
+            "expires_at REAL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._site_stats: Dict[str, Dict[str, int]] = {}
+
+    def _record(self, site: str, hit: bool):
+        stats = self._site_stats.setdefault(site, {"hits": 0, "misses": 0})
+        stats["hits" if hit else "misses"] += 1
+
+    def get(self, key: str, site: str = "default") -> Optional[Dict[str, Any]]:
+        """
+        读取缓存的回复，先查内存再查磁盘
+        :return: 回复（content 与 response_metadata），未命中或已过期时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and (entry["expires_at"] is None or entry["expires_at"] > now):
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                self._record(site, True)
+                return entry["response"]
+
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                if row is not None:
+                    # 已过期，顺手删除
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self._count -= 1
+                self._memory.pop(key, None)
+                self.misses += 1
+                self._record(site, False)
+                return None
+
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            response = json.loads(row[0])
+            self._remember(key, response, row[1])
+            self.disk_hits += 1
+            self._record(site, True)
+            return response
+
+    def put(self, key: str, response: Dict[str, Any], site: str = "default", ttl: Optional[int] = LLM_CACHE_TTL):
+        """
+        写入回复，超出容量时按最近使用时间淘汰
+        :param ttl: 保留时间（秒），0 或 None 表示不过期
+        """
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            exists = self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, site, response, expires_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, site, json.dumps(response, ensure_ascii=False), expires_at, now)
+            )
+            if not exists:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+            self._remember(key, response, expires_at)
+
+    def _remember(self, key: str, response: Dict[str, Any], expires_at: Optional[float]):
+        if self.memory_size <= 0:
+            return
+        self._memory[key] = {"response": response, "expires_at": expires_at}
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """删除最久未使用的条目，直到条目数降到上限的 EVICTION_TARGET_RATIO"""
+        excess = self._count - int(self.max_entries * EVICTION_TARGET_RATIO)
+        keys = [row[0] for row in self._conn.execute(
+            "SELECT key FROM responses ORDER BY last_used LIMIT ?", (excess,)
+        )]
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in keys])
+        for key in keys:
+            self._memory.pop(key, None)
+        self._count -= len(keys)
+        self.evictions += len(keys)
+        logging.info(f"大模型响应缓存淘汰 {len(keys)} 条，剩余 {self._count} 条")
+
+    def clear(self, site: Optional[str] = None):
+        """清空缓存，指定调用点时只清除该调用点的回复"""
+        with self._lock:
+            if site is None:
+                self._conn.execute("DELETE FROM responses")
+            else:
+                self._conn.execute("DELETE FROM responses WHERE site = ?", (site,))
+            self._conn.commit()
+            self._memory.clear()
+            self._count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> Dict:
+        """缓存统计"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": self._count,
+                "max_entries": self.max_entries,
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "sites": {site: dict(stats) for site, stats in self._site_stats.items()}
+            }
+
+
+class CachedChatModel(BaseChatModel):
+    """
+    带响应缓存的聊天模型包装
+    命中时直接返回缓存的回复；通过 stream/astream 调用时缓存的回复按片段回放，
+    未命中时转发给底层模型（流式调用边转发边累积），完整回复生成后写入缓存。
+    回调事件只由包装层发出，底层模型的调用不再重复上报。
+    只缓存纯文本回复，带工具调用的回复不缓存。
+    """
+
+    model: BaseChatModel
+    response_cache: Any  # LLMResponseCache
+    site: str = "default"  # 调用点名称，用于按调用点统计与清除
+    ttl: Optional[int] = LLM_CACHE_TTL
+    cache: bool = False  # 不使用 LangChain 的全局缓存
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.model._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model._identifying_params, "site": self.site}
+
+    def _key(self, messages: List[BaseMessage], stop: Optional[List[str]], **kwargs: Any) -> str:
+        params = {
+            "type": self.model._llm_type,
+            "params": self.model._identifying_params,
+            "stop": stop,
+            "kwargs": kwargs
+        }
+        return response_cache_key(params, messages)
+
+    @staticmethod
+    def _to_response(message: BaseMessage) -> Optional[Dict[str, Any]]:
+        if getattr(message, "tool_calls", None) or not isinstance(message.content, str):
+            return None
+        return {"content": message.content, "response_metadata": message.response_metadata or {}}
+
+    @staticmethod
+    def _from_response(response: Dict[str, Any]) -> ChatResult:
+        message = AIMessage(
+            content=response["content"],
+            response_metadata={**response.get("response_metadata", {}), "cache_hit": True}
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    @staticmethod
+    def _replay(response: Dict[str, Any]) -> Iterator[ChatGenerationChunk]:
+        content = response["content"]
+        for start in range(0, len(content), REPLAY_CHUNK_CHARS):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=content[start:start + REPLAY_CHUNK_CHARS]))
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="", response_metadata={**response.get("response_metadata", {}), "cache_hit": True}
+        ))
+
+    def _store(self, key: str, message: BaseMessage):
+        response = self._to_response(message)
+        if response is not None:
+            self.response_cache.put(key, response, self.site, self.ttl)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages, stop, **kwargs)
+        response = self.response_cache.get(key, self.site)
+        if response is not None:
+            return self._from_response(response)
+        message = self.model.invoke(messages, stop=stop, **kwargs)
+        self._store(key, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                         **kwargs: Any) -> ChatResult:
+        key = self._key(messages, stop, **kwargs)
+        response = await asyncio.to_thread(self.response_cache.get, key, self.site)
+        if response is not None:
+            return self._from_response(response)
+        message = await self.model.ainvoke(messages, stop=stop, **kwargs)
+        await asyncio.to_thread(self._store, key, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        key = self._key(messages, stop, **kwargs)
+        response = self.response_cache.get(key, self.site)
+        if response is not None:
+            yield from self._replay(response)
+            return
+        full = None
+        for chunk in self.model.stream(messages, stop=stop, **kwargs):
+            full = chunk if full is None else full + chunk
+            yield ChatGenerationChunk(message=chunk)
+        if full is not None:
+            self._store(key, full)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        key = self._key(messages, stop, **kwargs)
+        response = await asyncio.to_thread(self.response_cache.get, key, self.site)
+        if response is not None:
+            for chunk in self._replay(response):
+                yield chunk
+            return
+        full = None
+        async for chunk in self.model.astream(messages, stop=stop, **kwargs):
+            full = chunk if full is None else full + chunk
+            yield ChatGenerationChunk(message=chunk)
+        if full is not None:
+            await asyncio.to_thread(self._store, key, full)
+
+
+def create_llm_cache() -> Optional[LLMResponseCache]:
+    """按环境变量创建缓存，未启用或无法打开时返回 None（直接调用模型）"""
+    if not LLM_CACHE_ENABLED:
+        return None
+    try:
+        return LLMResponseCache()
+    except Exception as e:
+        logging.warning(f"大模型响应缓存不可用，将直接调用模型: {str(e)}")
+        return None
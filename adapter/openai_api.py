@@ -2,6 +2,10 @@ import os
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
+from adapter.embedding_cache import CachedEmbeddings, create_embedding_cache
+from adapter.http_client import client_pool_stats, create_http_clients
+from adapter.llm_cache import LLM_CACHE_SITES, LLM_CACHE_TTL, CachedChatModel, create_llm_cache, parse_cache_sites
+
 """OpenAI API适配器"""
 
 # 加载.env文件中的环境变量
@@ -15,20 +19,65 @@ openai_api_base = os.getenv("OPENAI_API_BASE")
 os.environ["OPENAI_API_KEY"] = openai_api_key
 os.environ["OPENAI_API_BASE"] = openai_api_base
 
+# 聊天与嵌入共用的 HTTP 客户端：连接池、keep-alive 与超时由客户端统一配置，
+# 重试在客户端传输层按带抖动的退避策略进行，SDK 自身不再重试
+http_client, http_async_client = create_http_clients()
+
 # 初始化ChatOpenAI模型
 model = ChatOpenAI(
     model=os.getenv("OPENAI_MODEL_NAME", "glm-4"),
     streaming=True,
-    temperature=0.7
+    temperature=0.7,
+    http_client=http_client,
+    http_async_client=http_async_client,
+    timeout=http_client.timeout,
+    max_retries=0
 )
 
+# 大模型响应缓存，供提示词经常完全相同的辅助调用（标题、代码审查、出题）使用
+llm_cache = create_llm_cache()
+llm_cache_sites = parse_cache_sites(LLM_CACHE_SITES)
+
+def cached_model(site: str):
+    """
+    获取调用点使用的模型：调用点在 LLM_CACHE_SITES 中启用时返回带响应缓存的包装，否则返回原模型
+    :param site: 调用点名称
+    """
+    if llm_cache is None or site not in llm_cache_sites:
+        return model
+    ttl = llm_cache_sites[site]
+    return CachedChatModel(
+        model=model,
+        response_cache=llm_cache,
+        site=site,
+        ttl=LLM_CACHE_TTL if ttl is None else ttl
+    )
+
 # 初始化OpenAI嵌入模型
-embeddings = OpenAIEmbeddings(
-    model=os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"),
+embedding_model_name = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+openai_embeddings = OpenAIEmbeddings(
+    model=embedding_model_name,
     openai_api_key=openai_api_key,
-    openai_api_base=openai_api_base
+    openai_api_base=openai_api_base,
+    http_client=http_client,
+    http_async_client=http_async_client,
+    request_timeout=http_client.timeout,
+    max_retries=0
 )
 
+# 带磁盘缓存的嵌入模型，相同文本不会重复调用嵌入接口
+embedding_cache = create_embedding_cache()
+embeddings = CachedEmbeddings(openai_embeddings, embedding_model_name, embedding_cache)
+
+def http_pool_stats():
+    """共享 HTTP 客户端的连接池使用情况"""
+    return {"sync": client_pool_stats(http_client), "async": client_pool_stats(http_async_client)}
+
+async def close_http_clients():
+    """关闭共享 HTTP 客户端（应用关闭时调用）"""
+    http_client.close()
+    await http_async_client.aclose()
+
 if __name__ == "__main__":
     doc = "如何学好编程？"
     vec = embeddings.embed_documents([doc])
@@ -0,0 +1,48 @@
+"""
+分块基准：按字符切分（原 CharacterTextSplitter(chunk_size=1000)）与按 token、结构切分的文本块 token 数分布和速度
+用法（在项目根目录）：
+    python benchmarks/bench_chunking.py
+"""
+import logging
+import os
+import statistics
+import sys
+import time
+
+from langchain_core.documents import Document
+from langchain_text_splitters import CharacterTextSplitter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.chunking import CHUNK_SIZE_TOKENS, Chunker, token_length  # noqa: E402
+
+
+if __name__ == "__main__":
+    # 按字符切分时超长段落会逐个打印警告
+    logging.getLogger("langchain_text_splitters").setLevel(logging.ERROR)
+
+    sections = []
+    for index in range(300):
+        sections.append(
+            f"## 第 {index} 节\n\n"
+            + "这是一段用于测试的中文正文，包含若干句子。" * (5 + index % 40)
+            + "\n\n"
+            + "Plain English sentences follow the Chinese paragraph. " * (3 + index % 25)
+            + "\n\n```python\ndef handler_%d(value):\n    return value * %d\n```\n\n" % (index, index)
+        )
+    documents = [Document(page_content="".join(sections[start:start + 30]), metadata={"source": "bench.md"})
+                 for start in range(0, len(sections), 30)]
+
+    def report(name, split):
+        started = time.perf_counter()
+        chunks = list(split(documents))
+        elapsed = time.perf_counter() - started
+        tokens = [token_length(chunk.page_content) for chunk in chunks]
+        print(f"{name}: {len(chunks)} 块，token 数 平均 {statistics.mean(tokens):.0f} / 最大 {max(tokens)}，"
+              f"超过 {CHUNK_SIZE_TOKENS} 的块 {sum(1 for count in tokens if count > CHUNK_SIZE_TOKENS)}，"
+              f"耗时 {elapsed:.2f}s")
+
+    character_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+    report("按字符切分", lambda docs: (chunk for doc in docs for chunk in character_splitter.split_documents([doc])))
+    report("按 token 切分（Markdown）", Chunker("markdown").iter_chunks)
+    report("按 token 切分（普通文本）", Chunker("text").iter_chunks)
@@ -0,0 +1,34 @@
+"""
+代码分析微基准：修改大文件中的一个函数后重新分析，对比整体解析的耗时
+用法（在项目根目录）：
+    python benchmarks/bench_code_analysis.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.tools.code_analysis import CodeAnalysis, analyze_code  # noqa: E402
+
+
+if __name__ == "__main__":
+    source = "\n\n".join(
+        f"def handler_{i}(request, value={i}):\n"
+        f"    \"\"\"处理请求 {i}\"\"\"\n"
+        f"    result = [item * {i} for item in request]\n"
+        f"    return result\n"
+        for i in range(2000)
+    )
+    edited = source.replace("item * 1000 ", "item * 1001 ")
+
+    started = time.perf_counter()
+    CodeAnalysis(edited, incremental=False)
+    full = time.perf_counter() - started
+
+    analyze_code(source)
+    started = time.perf_counter()
+    analysis = analyze_code(edited)
+    incremental = time.perf_counter() - started
+
+    print(f"代码块: {len(analysis.blocks)}，整体解析: {full * 1000:.1f}ms，增量解析: {incremental * 1000:.1f}ms")
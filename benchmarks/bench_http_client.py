@@ -0,0 +1,142 @@
+"""
+共享 HTTP 客户端基准：对比每次请求新建客户端与共享连接池客户端，并演示 503 重试与连接池统计
+用法（在项目根目录）：
+    python benchmarks/bench_http_client.py
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adapter.http_client import (AsyncRetryTransport, PoolStats, RetryPolicy, client_pool_stats,  # noqa: E402
+                                 create_http_clients)
+
+
+def _start_stub_server(latency: float, fail_first: int = 0):
+    """
+    启动本地 OpenAI 兼容接口桩服务（HTTP/1.1 keep-alive），返回 (服务, 地址, 统计)
+    统计中的 connections 为服务端接受的 TCP 连接数；前 fail_first 个请求返回 503
+    """
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    counters = {"connections": 0, "requests": 0}
+    lock = threading.Lock()
+    body = json.dumps({
+        "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+    }).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            with lock:
+                counters["connections"] += 1
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("content-length", 0)))
+            with lock:
+                counters["requests"] += 1
+                failing = counters["requests"] <= fail_first
+            time.sleep(latency)
+            if failing:
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 256  # 默认监听队列只有 5，并发新建连接时会被重置
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions", counters
+
+
+def benchmark(requests: int = 300, concurrency: int = 32, latency: float = 0.02):
+    """
+    对比每次请求新建客户端（无连接复用）与共享连接池客户端，并演示 503 重试与连接池统计
+    :param requests: 请求数
+    :param concurrency: 并发请求数
+    :param latency: 桩服务每个请求的处理时间（秒）
+    """
+    import statistics
+    from concurrent.futures import ThreadPoolExecutor
+
+    payload = {"model": "stub", "messages": [{"role": "user", "content": "hi"}]}
+
+    def run(label, send):
+        server, url, counters = _start_stub_server(latency)
+        latencies = []
+
+        def one(_):
+            started = time.perf_counter()
+            send(url)
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, range(requests)))
+        elapsed = time.perf_counter() - started
+        server.shutdown()
+        latencies.sort()
+        print(f"{label}: {requests / elapsed:.0f} 请求/秒，p50 {statistics.median(latencies) * 1000:.1f}ms，"
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms，服务端 TCP 连接 {counters['connections']} 个")
+
+    def unpooled(url):
+        with httpx.Client(timeout=10) as client:
+            client.post(url, json=payload).raise_for_status()
+
+    run("每次新建客户端", unpooled)
+
+    sync_client, _ = create_http_clients(max_connections=concurrency, max_keepalive=concurrency)
+    run("共享连接池客户端", lambda url: sync_client.post(url, json=payload).raise_for_status())
+    print(f"同步客户端统计: {client_pool_stats(sync_client)}")
+
+    # 异步客户端：并发数超过连接池上限时排队等待连接，前几个请求返回 503 后按抖动退避重试
+    async def run_async():
+        server, url, counters = _start_stub_server(latency, fail_first=5)
+        client = httpx.AsyncClient(transport=AsyncRetryTransport(
+            httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=8, max_keepalive_connections=8)),
+            RetryPolicy(max_retries=3, base_delay=0.05, max_delay=0.5), PoolStats(8)
+        ))
+        peak = 0
+
+        async def sample():
+            nonlocal peak
+            while True:
+                peak = max(peak, client_pool_stats(client)["utilization"])
+                await asyncio.sleep(0.005)
+
+        sampler = asyncio.create_task(sample())
+        responses = await asyncio.gather(*[client.post(url, json=payload) for _ in range(64)])
+        sampler.cancel()
+        print(f"异步客户端（连接上限 8，64 个并发请求，前 5 个返回 503）: "
+              f"成功 {sum(response.status_code == 200 for response in responses)} 个，"
+              f"服务端 TCP 连接 {counters['connections']} 个，峰值利用率 {peak:.2f}，统计: {client_pool_stats(client)}")
+        await client.aclose()
+        server.shutdown()
+
+    asyncio.run(run_async())
+    sync_client.close()
+
+
+if __name__ == "__main__":
+    benchmark()
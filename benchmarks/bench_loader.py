@@ -0,0 +1,46 @@
+"""
+文档加载内存基准：不同大小的 CSV 文件下，一次性加载与流式加载的峰值内存（RSS）
+用法（在项目根目录）：
+    python benchmarks/bench_loader.py
+"""
+import csv
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.loader import csv_loader, stream_csv  # noqa: E402
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--measure":
+        mode, path = sys.argv[2], sys.argv[3]
+        if mode == "load":
+            docs = csv_loader(path)
+        else:
+            for _ in stream_csv(path):
+                pass
+        # Linux 下 ru_maxrss 的单位为 KB
+        print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for rows in (50_000, 200_000, 800_000):
+            path = os.path.join(temp_dir, f"bench_{rows}.csv")
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["id", "title", "content"])
+                for i in range(rows):
+                    writer.writerow([i, f"标题 {i}", "这是一段用于测试的正文内容。" * 5])
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            peaks = {}
+            for mode in ("load", "stream"):
+                output = subprocess.run(
+                    [sys.executable, __file__, "--measure", mode, path],
+                    capture_output=True, text=True, check=True
+                ).stdout
+                peaks[mode] = int(output.strip()) / 1024
+            print(f"文件 {size_mb:.1f}MB：一次性加载峰值 {peaks['load']:.0f}MB，流式加载峰值 {peaks['stream']:.0f}MB")
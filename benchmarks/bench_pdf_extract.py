@@ -0,0 +1,69 @@
+"""
+PDF 并行提取基准：在数百页的样本上比较顺序提取与不同进程数的并行提取
+用法（在项目根目录）：
+    python benchmarks/bench_pdf_extract.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.pdf_extract import PDF_PARALLEL_MIN_PAGES, iter_page_texts, shutdown_pools  # noqa: E402
+
+
+def _write_fixture(path: str, pages: int, lines_per_page: int = 40):
+    """生成多页纯文本 PDF 作为基准样本"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in range(pages):
+        lines = "".join(
+            f"(Page {page} line {line}: the quick brown fox jumps over the lazy dog) Tj T* "
+            for line in range(lines_per_page)
+        )
+        content = f"BT /F1 10 Tf 12 TL 40 800 Td {lines}ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+if __name__ == "__main__":
+    # 基准：在数百页的样本上比较顺序提取与不同进程数的并行提取
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fixture = os.path.join(temp_dir, "manual.pdf")
+        _write_fixture(fixture, pages=400)
+
+        started = time.perf_counter()
+        baseline = [text for _, _, text in iter_page_texts(fixture, workers=1)]
+        sequential = time.perf_counter() - started
+        print(f"页数: {len(baseline)}，顺序提取: {sequential:.2f}s")
+
+        for workers in sorted({2, 4, os.cpu_count() or 1} - {1}):
+            # 先预热进程池，只统计提取耗时
+            list(iter_page_texts(fixture, workers=workers, pages_per_shard=PDF_PARALLEL_MIN_PAGES))
+            started = time.perf_counter()
+            texts = [text for _, _, text in iter_page_texts(fixture, workers=workers)]
+            elapsed = time.perf_counter() - started
+            assert texts == baseline, "并行提取结果与顺序提取不一致"
+            print(f"{workers} 个进程: {elapsed:.2f}s，加速比 {sequential / elapsed:.2f}x")
+
+    shutdown_pools()
@@ -0,0 +1,123 @@
+"""
+检索重排离线评估：召回率不下降的前提下减少放入提示词的 token 数
+用法（在项目根目录）：
+    python benchmarks/bench_rerank.py                       # 合成数据：对比重排前后的召回率与 token 数
+    python benchmarks/bench_rerank.py --eval cases.jsonl --db-path vector_db/user_1/python --collection knowledge_base
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict
+
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.rerank import RerankConfig, Reranker, evaluate, load_rerank_config  # noqa: E402
+
+
+def _print_evaluation(name: str, result: Dict):
+    print(f"{name}: 召回率 {result['recall']}，平均 {result['avg_chunks']} 个文本块，"
+          f"平均 {result['avg_tokens']} tokens")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="离线评估检索重排：召回率不下降的前提下减少放入提示词的 token 数")
+    parser.add_argument("--eval", metavar="FILE", help="评估用例（JSONL，每行 {\"query\": ..., \"expected\": [...]}）")
+    parser.add_argument("--db-path", help="集合数据库路径")
+    parser.add_argument("--collection", help="集合名称")
+    args = parser.parse_args()
+
+    if args.eval:
+        # 真实集合：同一集合分别不启用与启用重排检索，不使用结果缓存
+        from utils.tools.retriever import HybridRetriever
+        from utils.vectorstore import (
+            get_collection, get_collection_lexical_index, open_vectorstore, scope_filter
+        )
+
+        with open(args.eval, "r", encoding="utf-8") as f:
+            cases = [json.loads(line) for line in f if line.strip()]
+        config = load_rerank_config(args.db_path).updated(enabled=True)
+        retriever = HybridRetriever(
+            vectorstore=open_vectorstore(args.db_path, args.collection),
+            lexical_index=get_collection_lexical_index(args.db_path, args.collection),
+            vector_filter=scope_filter(args.db_path, args.collection)
+        )
+        _print_evaluation("不重排", evaluate(retriever, cases))
+        retriever.reranker = Reranker(config, get_collection(args.db_path, args.collection))
+        _print_evaluation(f"重排 {config.to_dict()}", evaluate(retriever, cases))
+    else:
+        # 合成数据：每个查询有 2 个相关文本块，候选中混有相关文本块的近似重复副本与无关文本块，
+        # 向量为带噪声的主题向量，模拟导入时保存的嵌入
+        random.seed(0)
+        dimension = 256
+        topics = [[random.gauss(0, 1) for _ in range(dimension)] for _ in range(200)]
+
+        def noisy(vector, scale):
+            return [value + random.gauss(0, scale) for value in vector]
+
+        class MemoryCollection:
+            """按ID读取向量的内存集合"""
+
+            def __init__(self):
+                self.vectors = {}
+
+            def get(self, ids, include):
+                return {"ids": ids, "embeddings": [self.vectors[doc_id] for doc_id in ids]}
+
+        collection = MemoryCollection()
+        cases = []
+        for index in range(300):
+            topic = topics[index % len(topics)]
+            keyword = f"func_{index}"
+            body = "，".join(random.choice(["说明", "示例", "参数", "返回值", "注意事项"]) for _ in range(60))
+            relevant = [
+                (f"{keyword} 的用法（第 {part} 部分）：{body}", noisy(topic, 0.6)) for part in (1, 2)
+            ]
+            candidates = [relevant[0]]
+            # 相关文本块的近似重复副本（重叠切分或重复上传产生）
+            candidates.append((relevant[0][0] + "。", noisy(relevant[0][1], 0.05)))
+            candidates.append(relevant[1])
+            candidates.append((relevant[1][0] + "。", noisy(relevant[1][1], 0.05)))
+            for other in random.sample(range(len(topics)), 6):
+                candidates.append((f"func_{other + 1000} 的说明：{body}", noisy(topics[other], 0.6)))
+            # 打乱检索排名，相关文本块不一定排在最前
+            head, tail = candidates[:4], candidates[4:]
+            random.shuffle(tail)
+            candidates = tail[:1] + head + tail[1:]
+            ids = [f"{index}-{position}" for position in range(len(candidates))]
+            for doc_id, (_, vector) in zip(ids, candidates):
+                collection.vectors[doc_id] = vector
+            cases.append({
+                "query": f"{keyword} 怎么用",
+                "query_embedding": noisy(topic, 0.3),
+                "documents": [Document(page_content=text) for text, _ in candidates],
+                "ids": ids,
+                "expected": [text for text, _ in relevant]
+            })
+
+        class CandidateRetriever:
+            """直接返回预置候选的检索器，reranker 为 None 时取前 k 个（即当前的检索结果）"""
+
+            def __init__(self, k, reranker=None):
+                self.k = k
+                self.reranker = reranker
+                self.cases = {case["query"]: case for case in cases}
+
+            def invoke(self, query):
+                case = self.cases[query]
+                documents = [Document(page_content=d.page_content) for d in case["documents"]]
+                if self.reranker is None:
+                    return documents[:self.k]
+                return self.reranker.rerank(query, documents, case["ids"], self.k, case["query_embedding"])
+
+        _print_evaluation("不重排（前 5 个）", evaluate(CandidateRetriever(5), cases))
+        for budget in (1200, 600):
+            config = RerankConfig(enabled=True, token_budget=budget)
+            started = time.perf_counter()
+            result = evaluate(CandidateRetriever(5, Reranker(config, collection)), cases)
+            elapsed = (time.perf_counter() - started) / len(cases) * 1000
+            _print_evaluation(f"重排（预算 {budget} tokens，每次 {elapsed:.1f}ms）", result)
@@ -0,0 +1,91 @@
+"""
+知识库存储模式基准：对比目录模式与共享模式在大量集合下的打开耗时、峰值内存与文件句柄数
+用法（在项目根目录）：
+    python benchmarks/bench_storage_mode.py 10000
+"""
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import chromadb
+
+
+def _measure(mode: str, root: str, collections: int, dimension: int):
+    """在子进程中执行：打开全部集合并各检索一次，输出 耗时(秒) 峰值内存(KB) 打开的文件数"""
+    query = [random.random() for _ in range(dimension)]
+    started = time.perf_counter()
+    if mode == "directory":
+        for index in range(collections):
+            client = chromadb.PersistentClient(path=os.path.join(root, f"kb_{index}"))
+            client.get_collection("knowledge").query(query_embeddings=[query], n_results=3)
+    else:
+        collection = chromadb.PersistentClient(path=root).get_collection("shared")
+        for index in range(collections):
+            collection.query(
+                query_embeddings=[query], n_results=3,
+                where={"$and": [{"kb_tenant": f"user_{index % 100}"}, {"kb_collection": f"kb_{index}"}]}
+            )
+    elapsed = time.perf_counter() - started
+    open_files = len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else -1
+    print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, open_files)
+
+
+def benchmark(collections: int, chunks_per_collection: int = 20, dimension: int = 256):
+    """
+    对比目录模式与共享模式在大量集合下的打开耗时、峰值内存与文件句柄数
+    每种模式先构建数据，再在新的子进程中打开全部集合并各检索一次。
+    """
+    random.seed(0)
+
+    def vectors():
+        return [[random.random() for _ in range(dimension)] for _ in range(chunks_per_collection)]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory_root = os.path.join(temp_dir, "directory")
+        shared_root = os.path.join(temp_dir, "shared")
+
+        for index in range(collections):
+            client = chromadb.PersistentClient(path=os.path.join(directory_root, f"kb_{index}"))
+            client.get_or_create_collection("knowledge").add(
+                ids=[f"{index}-{i}" for i in range(chunks_per_collection)],
+                embeddings=vectors(),
+                documents=[f"文本块 {i}" for i in range(chunks_per_collection)]
+            )
+        shared = chromadb.PersistentClient(path=shared_root).get_or_create_collection("shared")
+        for start in range(0, collections, 100):
+            batch = range(start, min(start + 100, collections))
+            shared.add(
+                ids=[f"{index}-{i}" for index in batch for i in range(chunks_per_collection)],
+                embeddings=[vector for _ in batch for vector in vectors()],
+                documents=[f"文本块 {i}" for _ in batch for i in range(chunks_per_collection)],
+                metadatas=[{"kb_tenant": f"user_{index % 100}", "kb_collection": f"kb_{index}"}
+                           for index in batch for _ in range(chunks_per_collection)]
+            )
+
+        for mode, root in (("directory", directory_root), ("shared", shared_root)):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--measure", mode, root,
+                 str(collections), str(dimension)],
+                capture_output=True, text=True, check=True
+            ).stdout.split()
+            elapsed, peak_kb, open_files = float(output[0]), int(output[1]), int(output[2])
+            files = sum(len(names) for _, _, names in os.walk(root))
+            print(f"{mode}: {collections} 个集合，打开并检索 {elapsed:.1f}s，峰值内存 {peak_kb / 1024:.0f}MB，"
+                  f"打开的文件句柄 {open_files}，磁盘文件 {files} 个")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比 N 个集合下两种知识库存储模式的开销")
+    parser.add_argument("collections", type=int, nargs="?", default=1000, help="集合数")
+    parser.add_argument("--measure", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        _measure(args.measure[0], args.measure[1], int(args.measure[2]), int(args.measure[3]))
+    else:
+        benchmark(args.collections)
@@ -8,7 +8,7 @@ from database.models.python_test import (
     PythonQuestionCreate, PythonQuestionResponse,
     PythonTestSessionCreate, PythonTestSessionResponse,
     PythonSubmissionCreate, PythonSubmissionResponse,
-    TestReportResponse
+    TestReportResponse, get_session_submissions
 )
 
 # 将所有需要创建表的模型列在这里，方便应用启动时一次性创建
@@ -109,4 +109,18 @@ class TestReportResponse(PydanticBaseModel):
     difficulty_analysis: Dict[str, Any]
     skill_assessment: Dict[str, Any]
     recommendations: List[str]
-    detailed_results: List[Dict[str, Any]]
\ No newline at end of file
+    detailed_results: List[Dict[str, Any]]
+
+def get_session_submissions(session_id):
+    """
+    获取测试会话的所有提交记录，并通过联表一次性带出对应题目。
+    返回的每条提交记录中 submission.question_id 即为已加载的 PythonQuestion，
+    访问其字段不会再触发额外查询。
+    """
+    return (
+        PythonSubmission
+        .select(PythonSubmission, PythonQuestion)
+        .join(PythonQuestion)
+        .where(PythonSubmission.session_id == session_id)
+        .order_by(PythonSubmission.id)
+    )
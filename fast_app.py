@@ -9,6 +9,10 @@ import uvicorn
 from database.db import db
 from database.models import MODELS
 from routes import api_router
+from adapter.openai_api import close_http_clients
+from utils.question_bank import question_bank
+from utils.ingestion import ingestion_manager
+from utils.pdf_extract import shutdown_pools
 
 # 初始化 FastAPI 应用
 app = FastAPI(
@@ -64,5 +68,25 @@ def on_startup():
     logging.info("Tables created successfully.")
     db.close()
 
+@app.on_event("startup")
+async def start_question_bank():
+    # 启动题库后台补充任务
+    question_bank.start()
+
+@app.on_event("shutdown")
+async def stop_question_bank():
+    await question_bank.stop()
+
+@app.on_event("shutdown")
+async def stop_ingestion_jobs():
+    # 取消未完成的知识库导入任务，关闭 PDF 提取进程池
+    await ingestion_manager.stop()
+    shutdown_pools()
+
+@app.on_event("shutdown")
+async def close_openai_clients():
+    # 关闭大模型接口的共享 HTTP 连接池
+    await close_http_clients()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
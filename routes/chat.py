@@ -1,16 +1,25 @@
 import logging
 import json
 import os
-from fastapi import APIRouter, Depends, Request, HTTPException, Path, UploadFile, File
+from fastapi import APIRouter, Depends, Request, HTTPException, Path
 from fastapi.responses import StreamingResponse
 from datetime import datetime
 from pydantic import ValidationError, BaseModel, Field
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 from database.models.message import Message, MessageCreate, MessageResponse, Chat
 from database.db import db
 from routes.auth import get_current_user
+from adapter.openai_api import cached_model, http_pool_stats, llm_cache
 from utils.multi_agent import chat_with_multi_agent_original, stream_chat_with_multi_agent
+from utils.semantic_cache import semantic_cache
+from utils.upload import MCP_CONFIG_MAX_BYTES, UploadError, receive_upload
+
+# MCP配置文件目录
+MCP_CONFIG_DIR = "./mcp_configs"
+
+# 生成标题使用的模型（同一条消息的标题请求命中响应缓存）
+title_model = cached_model("chat_title")
 
 router = APIRouter()
 
@@ -21,6 +30,7 @@ class ChatRequest(BaseModel):
     message: str
     role: str = "user"
     collection_name: Optional[str] = None  # 知识库集合名称，可选
+    collection_names: Optional[List[str]] = None  # 同时检索的多个知识库集合名称，可选，优先于 collection_name
 
 @router.post("/chat", response_model=MessageResponse)
 async def api_chat(request: Request, current_user = Depends(get_current_user)):
@@ -69,7 +79,8 @@ async def api_chat(request: Request, current_user = Depends(get_current_user)):
             data.user_id,
             user_id=str(current_user.id),
             collection_name=data.collection_name,
-            mcp_config_path=mcp_config_path
+            mcp_config_path=mcp_config_path,
+            collection_names=data.collection_names
         )
 
         # 保存用户消息到数据库
@@ -166,7 +177,8 @@ async def api_chat_stream(request: Request, current_user = Depends(get_current_u
                     data.user_id,
                     user_id=str(current_user.id),
                     collection_name=data.collection_name,
-                    mcp_config_path=mcp_config_path
+                    mcp_config_path=mcp_config_path,
+                    collection_names=data.collection_names
                 ):
                     # 处理不同类型的数据
                     if chunk.startswith("[MODEL_RESPONSE]"):
@@ -275,36 +287,56 @@ async def api_chat_stream(request: Request, current_user = Depends(get_current_u
         raise HTTPException(status_code=500, detail=f"处理请求失败: {str(e)}")
 
 
-@router.post("/mcp/upload")
-async def upload_mcp_config(file: UploadFile = File(...), user_id: str = None, current_user = Depends(get_current_user)):
-    """上传MCP配置文件"""
+@router.post(
+    "/mcp/upload",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {"file": {"type": "string", "format": "binary"}}
+                    }
+                }
+            }
+        }
+    }
+)
+async def upload_mcp_config(request: Request, user_id: str = None, current_user = Depends(get_current_user)):
+    """上传MCP配置文件（流式接收，超过 MCP_CONFIG_MAX_BYTES 时立即返回 413）"""
+    upload = None
     try:
         if not user_id:
             raise HTTPException(status_code=400, detail="必须提供用户ID")
 
-        # 验证文件类型
-        if not file.filename.endswith('.json'):
-            raise HTTPException(status_code=400, detail="只支持JSON文件")
-
-        # 保存文件
-        mcp_config_path = f"./mcp_configs/user_{user_id}.json"
-
-        # 读取文件内容
-        content = await file.read()
+        # 接收文件到配置目录，验证通过后再替换原配置，不会留下写了一半的配置文件
+        try:
+            upload = await receive_upload(request, MCP_CONFIG_DIR, ["json"], MCP_CONFIG_MAX_BYTES)
+        except UploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
 
         # 验证JSON格式
         try:
-            json.loads(content)
-        except json.JSONDecodeError:
+            with open(upload.file.path, "rb") as f:
+                json.load(f)
+        except (json.JSONDecodeError, UnicodeDecodeError):
             raise HTTPException(status_code=400, detail="文件内容不是有效的JSON格式")
 
         # 保存文件
-        with open(mcp_config_path, "wb") as f:
-            f.write(content)
+        mcp_config_path = f"{MCP_CONFIG_DIR}/user_{user_id}.json"
+        os.replace(upload.file.path, mcp_config_path)
 
         return {"message": "MCP配置文件上传成功", "path": mcp_config_path}
 
+    except HTTPException:
+        if upload is not None:
+            upload.discard()
+        raise
     except Exception as e:
+        if upload is not None:
+            upload.discard()
         logging.exception(f"上传MCP配置文件时出错: {e}")
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
@@ -346,7 +378,7 @@ async def generate_title(chat_id: int, current_user: dict = Depends(get_current_
     # 使用LLM生成标题
     prompt = f"请根据以下内容，为这段对话生成一个简洁的标题，不超过10个字。内容：'{first_ai_message.message}'"
     try:
-        response = await model.ainvoke(prompt)
+        response = await title_model.ainvoke(prompt)
         new_title = response.content.strip().strip('"“”')
     except Exception as e:
         logging.error(f"调用LLM生成标题失败: {e}")
@@ -356,4 +388,17 @@ async def generate_title(chat_id: int, current_user: dict = Depends(get_current_
     chat.title = new_title
     chat.save()
 
-    return {"title": new_title}
\ No newline at end of file
+    return {"title": new_title}
+
+@router.get("/chat/cache/stats")
+async def get_chat_cache_stats(current_user = Depends(get_current_user)):
+    """聊天相关缓存的命中情况：辅助调用的大模型响应缓存，以及语义缓存的命中率与节省的 token 数"""
+    return {
+        "llm_cache": llm_cache.stats() if llm_cache else None,
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None
+    }
+
+@router.get("/llm/pool/stats")
+async def get_llm_pool_stats(current_user = Depends(get_current_user)):
+    """大模型与嵌入接口共享 HTTP 连接池的使用情况：占用连接数、排队请求数、利用率与重试次数"""
+    return http_pool_stats()
\ No newline at end of file
@@ -1,23 +1,37 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+import asyncio
 import os
 import shutil
-import uuid
 from typing import List, Optional
 import logging
 
 from routes.auth import get_current_user
-from utils.vectorstore import create_vector_db, merge_collections
-from utils.loader import text_loader, pdf_loader, csv_loader
+from adapter.openai_api import embedding_cache, embeddings
+from utils.chunking import load_chunking_config
+from utils.ingestion import ingestion_manager
+from utils.lexical_index import drop_lexical_indexes
+from utils.maintenance import maintenance_manager
+from utils.rerank import load_rerank_config, save_rerank_config
+from utils.retrieval_cache import retrieval_cache
+from utils.tools.retriever import release_retrievers
+from utils.upload import KNOWLEDGE_UPLOAD_MAX_BYTES, UploadError, receive_upload
+from utils.vectorstore import collection_stats, delete_source, drop_collection, load_manifest
+from utils.loader import stream_text, stream_pdf, stream_csv
 from database.models.user import User
 
 router = APIRouter()
 
-# 允许的文件类型及其对应的加载器
+# 允许的文件类型及其对应的流式加载器（Markdown 和代码文件按文本读取，分块时按各自结构切分）
 file_loaders = {
-    "txt": text_loader,
-    "pdf": pdf_loader,
-    "csv": csv_loader
+    "txt": stream_text,
+    "md": stream_text,
+    "py": stream_text,
+    "js": stream_text,
+    "ts": stream_text,
+    "pdf": stream_pdf,
+    "csv": stream_csv
 }
 
 # 临时文件存储路径
@@ -29,67 +43,129 @@ os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
 KNOWLEDGE_BASE_DIR = "vector_db"
 os.makedirs(KNOWLEDGE_BASE_DIR, exist_ok=True)
 
-@router.post("/upload")
+def _optional_int_field(fields, name):
+    """解析可选的整数表单字段"""
+    value = fields.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPException(
+            status_code=422,
+            detail=f"表单字段 {name} 必须是整数"
+        )
+
+@router.post(
+    "/upload",
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file", "collection_name"],
+                        "properties": {
+                            "file": {"type": "string", "format": "binary"},
+                            "collection_name": {"type": "string"},
+                            "chunk_size": {"type": "integer"},
+                            "chunk_overlap": {"type": "integer"}
+                        }
+                    }
+                }
+            }
+        }
+    }
+)
 async def upload_knowledge_file(
-    file: UploadFile = File(...),
-    collection_name: str = Form(...),
+    request: Request,
     current_user: User = Depends(get_current_user)
 ):
     """
     上传文件到知识库
+    请求体按块流式接收：文件直接写入临时目录并同时计算摘要，超过 KNOWLEDGE_UPLOAD_MAX_BYTES 时立即返回 413，
+    写入的文件直接交给流式加载器读取，摘要随任务传递（内容未变的同名文件据此跳过，不再重新读取计算）。
+    文件保存后提交后台导入任务并立即返回任务ID，通过 /jobs/{job_id} 查询进度
+    集合中已有同名文件时替换该文件：只嵌入内容变化的文本块，并删除新版本中已不存在的文本块
+    同一集合已有导入任务时新任务排队，前面的任务结束后才开始；集合正在压缩索引时返回 409
+    表单字段:
     - file: 要上传的文件
     - collection_name: 知识库集合名称
+    - chunk_size: 文本块最大 token 数，可选，指定后保存为该集合的分块配置
+    - chunk_overlap: 相邻文本块重叠的 token 数，可选，指定后保存为该集合的分块配置
     """
+    upload = None
     try:
-        # 检查文件类型
-        file_ext = file.filename.split('.')[-1].lower()
-        if file_ext not in file_loaders:
+        # 流式接收文件（临时文件在导入任务结束后删除），文件类型在接收内容前检查
+        try:
+            upload = await receive_upload(request, TEMP_UPLOAD_DIR, file_loaders.keys(), KNOWLEDGE_UPLOAD_MAX_BYTES)
+        except UploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        uploaded = upload.file
+
+        collection_name = upload.fields.get("collection_name")
+        if not collection_name:
+            raise HTTPException(
+                status_code=422,
+                detail="缺少表单字段: collection_name"
+            )
+        # 压缩中的集合不能导入；同一集合的导入任务由导入管理器排队逐个执行
+        if maintenance_manager.has_active_job(current_user.id, collection_name):
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"不支持的文件类型: {file_ext}。支持的类型: {', '.join(file_loaders.keys())}"
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"知识库集合 {collection_name} 正在压缩索引，请稍后再上传"
             )
+        chunk_size = _optional_int_field(upload.fields, "chunk_size")
+        chunk_overlap = _optional_int_field(upload.fields, "chunk_overlap")
         
         # 用户特定的知识库路径
         user_kb_dir = os.path.join(KNOWLEDGE_BASE_DIR, f"user_{current_user.id}")
         os.makedirs(user_kb_dir, exist_ok=True)
+        db_path = os.path.join(user_kb_dir, collection_name)
         
-        # 保存临时文件
-        temp_file_path = os.path.join(TEMP_UPLOAD_DIR, f"{uuid.uuid4()}.{file_ext}")
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # 在集合已保存的分块配置上覆盖本次指定的参数
+        chunking = None
+        if chunk_size is not None or chunk_overlap is not None:
+            try:
+                chunking = load_chunking_config(db_path).updated(chunk_size, chunk_overlap)
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"分块参数无效: {str(e)}"
+                )
         
-        # 确定存储路径和集合名称
-        db_path = os.path.join(user_kb_dir, collection_name)
+        # 已存在的集合会在导入时合并新数据
+        is_new_collection = not os.path.exists(db_path)
         
-        # 检查是否已存在该集合
-        if os.path.exists(db_path):
-            # 如果存在，合并新数据
-            merge_collections(
-                base_db_path=db_path,
-                new_data_path=temp_file_path,
-                loader=file_loaders[file_ext],
-                collection_name=collection_name
-            )
-            message = f"文件 {file.filename} 已成功合并到知识库 {collection_name}"
-        else:
-            # 创建新的知识库
-            create_vector_db(
-                data_path=temp_file_path,
-                db_path=db_path,
-                loader=file_loaders[file_ext],
-                collection_name=collection_name
-            )
-            message = f"文件 {file.filename} 已成功上传到新知识库 {collection_name}"
+        job = ingestion_manager.submit(
+            user_id=current_user.id,
+            collection_name=collection_name,
+            filename=uploaded.filename,
+            file_path=uploaded.path,
+            db_path=db_path,
+            loader=file_loaders[uploaded.extension],
+            chunking=chunking,
+            digest=uploaded.digest
+        )
         
-        # 清理临时文件
-        os.remove(temp_file_path)
+        if is_new_collection:
+            message = f"文件 {uploaded.filename} 已提交，正在导入新知识库 {collection_name}"
+        else:
+            message = f"文件 {uploaded.filename} 已提交，正在合并到知识库 {collection_name}"
         
-        return {"status": "success", "message": message}
+        return {"status": "accepted", "job_id": job.job_id, "message": message}
     
+    except HTTPException:
+        # 未提交任务时删除已接收的文件
+        if upload is not None:
+            upload.discard()
+        raise
     except Exception as e:
         # 确保清理临时文件
-        if 'temp_file_path' in locals() and os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        if upload is not None:
+            upload.discard()
         
         logging.error(f"知识库上传失败: {str(e)}")
         raise HTTPException(
@@ -97,9 +173,211 @@ async def upload_knowledge_file(
             detail=f"上传失败: {str(e)}"
         )
 
+@router.get("/jobs")
+async def get_ingestion_jobs(current_user: User = Depends(get_current_user)):
+    """获取当前用户的知识库导入任务及进度，以及嵌入缓存的整体命中情况"""
+    jobs = ingestion_manager.list_jobs(current_user.id)
+    return {
+        "jobs": [job.progress() for job in jobs],
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """获取导入任务进度：已写入的文本块数、吞吐量（块/秒）和预计剩余时间"""
+    job = ingestion_manager.get_job(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"导入任务 {job_id} 不存在"
+        )
+    return job.progress()
+
+@router.get("/cache/stats")
+async def get_cache_stats(current_user: User = Depends(get_current_user)):
+    """知识库相关缓存的命中情况：文本块嵌入缓存、查询向量缓存和检索结果缓存"""
+    return {
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "query_embedding_cache": embeddings.query_cache_stats(),
+        "retrieval_cache": retrieval_cache.stats() if retrieval_cache else None
+    }
+
+@router.get("/collections/{collection_name}/chunking")
+async def get_collection_chunking(
+    collection_name: str,
+    current_user: User = Depends(get_current_user)
+):
+    """获取知识库集合的分块配置（未设置过时返回默认配置）"""
+    db_path = os.path.join(KNOWLEDGE_BASE_DIR, f"user_{current_user.id}", collection_name)
+    return load_chunking_config(db_path).to_dict()
+
+class RerankConfigRequest(BaseModel):
+    """重排配置更新请求，未指定的字段保持不变"""
+    enabled: Optional[bool] = None
+    token_budget: Optional[int] = None
+    mmr_lambda: Optional[float] = None
+    duplicate_threshold: Optional[float] = None
+    lexical_weight: Optional[float] = None
+    min_score_ratio: Optional[float] = None
+
+@router.get("/collections/{collection_name}/rerank")
+async def get_collection_rerank(
+    collection_name: str,
+    current_user: User = Depends(get_current_user)
+):
+    """获取知识库集合的检索重排配置（未设置过时返回默认配置）"""
+    db_path = os.path.join(KNOWLEDGE_BASE_DIR, f"user_{current_user.id}", collection_name)
+    return load_rerank_config(db_path).to_dict()
+
+@router.put("/collections/{collection_name}/rerank")
+async def update_collection_rerank(
+    collection_name: str,
+    request: RerankConfigRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    更新知识库集合的检索重排配置
+    - enabled: 是否启用重排
+    - token_budget: 检索结果的 token 总数上限
+    - mmr_lambda: MMR 中相关性的权重（0~1），越小越偏向多样性
+    - duplicate_threshold: 与已选文本块的相似度达到该值时视为重复（0~1）
+    - lexical_weight: 相关性中查询词覆盖率的权重（0~1）
+    - min_score_ratio: 相关性低于最佳文本块该比例时丢弃（0~1）
+    """
+    db_path = os.path.join(KNOWLEDGE_BASE_DIR, f"user_{current_user.id}", collection_name)
+    if not os.path.exists(db_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"知识库集合 {collection_name} 不存在"
+        )
+    try:
+        config = load_rerank_config(db_path).updated(**request.model_dump(exclude_unset=True))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"重排参数无效: {str(e)}"
+        )
+    save_rerank_config(db_path, config)
+    # 句柄池中的检索器按旧配置创建，移除后下次检索按新配置重新创建
+    release_retrievers(db_path)
+    return config.to_dict()
+
+@router.get("/collections/{collection_name}/documents")
+async def get_collection_documents(
+    collection_name: str,
+    current_user: User = Depends(get_current_user)
+):
+    """获取知识库集合中已导入的文件（来自导入清单）"""
+    db_path = os.path.join(KNOWLEDGE_BASE_DIR, f"user_{current_user.id}", collection_name)
+    if not os.path.exists(db_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"知识库集合 {collection_name} 不存在"
+        )
+    manifest = await asyncio.to_thread(load_manifest, db_path)
+    return {"documents": [{"source": source, **entry} for source, entry in manifest.items()]}
+
+@router.delete("/collections/{collection_name}/documents/{source:path}")
+async def delete_collection_document(
+    collection_name: str,
+    source: str,
+    current_user: User = Depends(get_current_user)
+):
+    """从知识库集合中删除一个文件的全部文本块，其余文件不受影响"""
+    db_path = os.path.join(KNOWLEDGE_BASE_DIR, f"user_{current_user.id}", collection_name)
+    if not os.path.exists(db_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"知识库集合 {collection_name} 不存在"
+        )
+    
+    # 导入或压缩中的集合不能删除文件
+    if ingestion_manager.has_active_job(current_user.id, collection_name) \
+            or maintenance_manager.has_active_job(current_user.id, collection_name):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"知识库集合 {collection_name} 正在导入文件或压缩索引，请稍后再删除"
+        )
+    
+    if source not in await asyncio.to_thread(load_manifest, db_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"知识库集合 {collection_name} 中没有文件 {source}"
+        )
+    
+    try:
+        await asyncio.to_thread(delete_source, db_path, source, collection_name)
+    except Exception as e:
+        logging.error(f"删除知识库文件失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"删除知识库文件失败: {str(e)}"
+        )
+    return {"status": "success", "message": f"文件 {source} 已从知识库集合 {collection_name} 中删除"}
+
+@router.get("/collections/{collection_name}/stats")
+async def get_collection_stats(
+    collection_name: str,
+    current_user: User = Depends(get_current_user)
+):
+    """获取知识库集合的统计：文件数、文本块数、字节数、嵌入模型、版本、最近导入时间与索引碎片程度"""
+    db_path = os.path.join(KNOWLEDGE_BASE_DIR, f"user_{current_user.id}", collection_name)
+    if not os.path.exists(db_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"知识库集合 {collection_name} 不存在"
+        )
+    return await asyncio.to_thread(collection_stats, db_path, collection_name)
+
+@router.post("/collections/{collection_name}/compact", status_code=status.HTTP_202_ACCEPTED)
+async def compact_knowledge_collection(
+    collection_name: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    压缩知识库集合的索引（删除或覆盖文件后回收空间）
+    任务在后台运行并立即返回任务ID，通过 /maintenance/{job_id} 查询结果
+    """
+    db_path = os.path.join(KNOWLEDGE_BASE_DIR, f"user_{current_user.id}", collection_name)
+    if not os.path.exists(db_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"知识库集合 {collection_name} 不存在"
+        )
+    if maintenance_manager.has_active_job(current_user.id, collection_name):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"知识库集合 {collection_name} 正在压缩索引"
+        )
+    job = maintenance_manager.submit(current_user.id, collection_name, db_path)
+    return {"status": "accepted", "job_id": job.job_id}
+
+@router.get("/maintenance/{job_id}")
+async def get_maintenance_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """获取索引压缩任务的状态与压缩前后的统计"""
+    job = maintenance_manager.get_job(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"索引压缩任务 {job_id} 不存在"
+        )
+    return job.progress()
+
 @router.get("/collections")
-async def get_knowledge_collections(current_user: User = Depends(get_current_user)):
-    """获取当前用户的所有知识库集合"""
+async def get_knowledge_collections(
+    with_stats: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取当前用户的所有知识库集合
+    - with_stats: 为 true 时同时返回每个集合的统计（来自导入清单，不扫描索引）
+    """
     try:
         # 用户特定的知识库路径
         user_kb_dir = os.path.join(KNOWLEDGE_BASE_DIR, f"user_{current_user.id}")
@@ -111,6 +389,12 @@ async def get_knowledge_collections(current_user: User = Depends(get_current_use
         collections = [d for d in os.listdir(user_kb_dir) 
                       if os.path.isdir(os.path.join(user_kb_dir, d))]
         
+        if with_stats:
+            stats = [
+                await asyncio.to_thread(collection_stats, os.path.join(user_kb_dir, name), name)
+                for name in collections
+            ]
+            return {"collections": collections, "stats": stats}
         return {"collections": collections}
     
     except Exception as e:
@@ -138,7 +422,24 @@ async def delete_knowledge_collection(
                 detail=f"知识库集合 {collection_name} 不存在"
             )
         
-        # 删除集合目录
+        # 导入中的集合不能删除
+        if ingestion_manager.has_active_job(current_user.id, collection_name):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"知识库集合 {collection_name} 正在导入文件，请稍后再删除"
+            )
+        
+        # 压缩中的集合不能删除
+        if maintenance_manager.has_active_job(current_user.id, collection_name):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"知识库集合 {collection_name} 正在压缩索引，请稍后再删除"
+            )
+        
+        # 释放检索器句柄、删除共享存储中的向量与全文索引、关闭全文索引连接后删除集合目录
+        release_retrievers(collection_path)
+        drop_collection(collection_path, collection_name)
+        drop_lexical_indexes(collection_path)
         shutil.rmtree(collection_path)
         
         return {"status": "success", "message": f"知识库集合 {collection_name} 已成功删除"}
@@ -1,6 +1,5 @@
 import logging
 import json
-import random
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional, Dict, Any
 from datetime import datetime
@@ -10,52 +9,65 @@ from database.models.python_test import (
     PythonQuestionCreate, PythonQuestionResponse,
     PythonTestSessionCreate, PythonTestSessionResponse,
     PythonSubmissionCreate, PythonSubmissionResponse,
-    TestReportResponse
+    TestReportResponse, get_session_submissions
 )
 from database.models.user import User
 from routes.auth import get_current_user
 from utils.tools.python_tester import PythonTestRunner
 from utils.python_review_agent import review_python_code, generate_python_session_report
-from utils.python_question_generator import generate_python_questions
+from utils.question_bank import question_bank
 
 router = APIRouter()
 
 # 注意：题目现在由智能体动态生成，不再使用硬编码数据
 
+def _build_session_data_for_agent(submissions: List[PythonSubmission]) -> List[Dict[str, Any]]:
+    """将联表查询得到的提交记录整理为智能体分析用的会话数据"""
+    session_data = []
+    for sub in submissions:
+        review_data = json.loads(sub.review_result) if sub.review_result else {}
+        session_data.append({
+            "question_title": sub.question_id.title,
+            "difficulty": sub.question_id.difficulty,
+            "user_code": sub.user_code,
+            "score": sub.score,
+            "passed": sub.is_passed,
+            "review_result": review_data
+        })
+    return session_data
+
+def _build_detailed_result(submission: PythonSubmission) -> Dict[str, Any]:
+    """构建单条提交的详细结果"""
+    test_data = json.loads(submission.test_results) if submission.test_results else {}
+    review_data = json.loads(submission.review_result) if submission.review_result else {}
+    return {
+        "question_title": submission.question_id.title,
+        "difficulty": submission.question_id.difficulty,
+        "score": submission.score,
+        "passed": submission.is_passed,
+        "test_passed": test_data.get("passed_tests", 0),
+        "test_total": test_data.get("total_tests", 0),
+        "user_code": submission.user_code,
+        "skill_level": review_data.get("skill_level", "未知"),
+        "strengths": review_data.get("strengths", []),
+        "improvements": review_data.get("weaknesses", [])
+    }
+
 @router.post("/init-questions")
 async def init_default_questions(current_user: User = Depends(get_current_user)):
-    """使用智能体初始化默认题目"""
+    """初始化题库：必要时写入备用题目，并唤醒后台任务补充智能生成的题目"""
     try:
         # 检查是否已有题目
-        existing_count = PythonQuestion.select().count()
+        existing_count = PythonQuestion.select().where(PythonQuestion.is_active == True).count()
         if existing_count >= 5:
+            question_bank.request_replenish()
             return {"message": f"题目已存在 {existing_count} 道，跳过初始化"}
         
-        # 使用智能体生成题目
-        logging.info("开始使用智能体生成Python题目...")
-        questions = await generate_python_questions()
-        
-        # 保存题目到数据库
-        created_count = 0
-        for question_data in questions:
-            try:
-                PythonQuestion.create(
-                    title=question_data.get("title", "未命名题目"),
-                    description=question_data.get("description", ""),
-                    difficulty=question_data.get("difficulty", 1),
-                    example_input=question_data.get("example_input", ""),
-                    example_output=question_data.get("example_output", ""),
-                    test_cases=json.dumps([]),  # 空的测试用例
-                    template_code=question_data.get("template_code", "")
-                )
-                created_count += 1
-                logging.info(f"创建题目: {question_data.get('title')}")
-                
-            except Exception as e:
-                logging.error(f"保存题目失败: {e}")
-                continue
+        # 先写入备用题目保证可以立即开始测试，智能生成的题目由后台补充
+        created = question_bank.seed_fallback_questions()
+        question_bank.request_replenish()
         
-        return {"message": f"成功创建 {created_count} 道智能生成的题目"}
+        return {"message": f"成功创建 {len(created)} 道基础题目，智能生成的题目将在后台补充"}
         
     except Exception as e:
         logging.exception(f"初始化题目失败: {e}")
@@ -63,41 +75,21 @@ async def init_default_questions(current_user: User = Depends(get_current_user))
 
 @router.post("/regenerate-questions")
 async def regenerate_questions(current_user: User = Depends(get_current_user)):
-    """重新生成所有题目（替换现有题目）"""
+    """重新生成所有题目（下线现有题目，由后台任务重新补充题库）"""
     try:
-        # 删除现有题目
-        deleted_count = PythonQuestion.delete().execute()
-        logging.info(f"删除了 {deleted_count} 道旧题目")
+        # 下线现有题目（软删除，保留历史提交关联的题目）
+        deleted_count = question_bank.deactivate_all()
+        logging.info(f"下线了 {deleted_count} 道旧题目")
         
-        # 使用智能体生成新题目
-        logging.info("开始重新生成Python题目...")
-        questions = await generate_python_questions()
-        
-        # 保存题目到数据库
-        created_count = 0
-        for question_data in questions:
-            try:
-                PythonQuestion.create(
-                    title=question_data.get("title", "未命名题目"),
-                    description=question_data.get("description", ""),
-                    difficulty=question_data.get("difficulty", 1),
-                    example_input=question_data.get("example_input", ""),
-                    example_output=question_data.get("example_output", ""),
-                    test_cases=json.dumps([]),  # 空的测试用例
-                    template_code=question_data.get("template_code", "")
-                )
-                created_count += 1
-                logging.info(f"创建新题目: {question_data.get('title')}")
-                
-            except Exception as e:
-                logging.error(f"保存题目失败: {e}")
-                continue
+        # 写入备用题目保证题库可用，并唤醒后台任务重新生成
+        created = question_bank.seed_fallback_questions()
+        question_bank.request_replenish()
         
         return {
-            "message": f"成功重新生成 {created_count} 道题目",
+            "message": "已重置题库，新题目正在后台生成",
             "deleted": deleted_count,
-            "created": created_count,
-            "questions": [{"title": q.get("title"), "difficulty": q.get("difficulty")} for q in questions]
+            "created": len(created),
+            "questions": [{"title": q.title, "difficulty": q.difficulty} for q in created]
         }
         
     except Exception as e:
@@ -179,26 +171,9 @@ async def create_test_session(
     """创建新的Python测试会话"""
     try:
         # 随机选择5道题目，难度分布：1道难度1，2道难度2，1道难度3，1道难度4
+        # 从内存索引中无放回抽题，再按主键确认抽中的题目仍然有效，耗时与题库规模无关
         difficulty_distribution = [1, 2, 2, 3, 4]
-        selected_questions = []
-        
-        for difficulty in difficulty_distribution:
-            questions = list(PythonQuestion.select().where(
-                (PythonQuestion.difficulty == difficulty) & 
-                (PythonQuestion.is_active == True)
-            ))
-            
-            if questions:
-                selected_question = random.choice(questions)
-                selected_questions.append(selected_question.id)
-        
-        if len(selected_questions) < 5:
-            # 如果某些难度的题目不够，随机补充
-            all_questions = list(PythonQuestion.select().where(PythonQuestion.is_active == True))
-            while len(selected_questions) < 5 and len(all_questions) > len(selected_questions):
-                question = random.choice(all_questions)
-                if question.id not in selected_questions:
-                    selected_questions.append(question.id)
+        selected_questions = await question_bank.sample_questions(difficulty_distribution)
         
         # 创建测试会话
         session = PythonTestSession.create(
@@ -325,25 +300,10 @@ async def submit_code(
             # 完成测试，使用智能体生成报告
             total_score = session.total_score + final_score
             
-            # 准备智能体分析用的数据
-            session_data_for_agent = []
-            all_submissions = list(PythonSubmission.select().where(
-                PythonSubmission.session_id == session.id
-            )) + [submission]  # 包含当前提交
-            
-            for sub in all_submissions:
-                sub_question = PythonQuestion.get_by_id(sub.question_id.id)
-                review_data = json.loads(sub.review_result) if sub.review_result else {}
-                
-                session_data_for_agent.append({
-                    "question_title": sub_question.title,
-                    "difficulty": sub_question.difficulty,
-                    "user_code": sub.user_code,
-                    "score": sub.score,
-                    "passed": sub.is_passed,
-                    "review_result": review_data
-                })
-            
+            # 准备智能体分析用的数据（当前提交已入库，联表查询会一并返回）
+            all_submissions = list(get_session_submissions(session.id))
+            session_data_for_agent = _build_session_data_for_agent(all_submissions)
+
             # 生成最终报告
             try:
                 report = await generate_python_session_report(session_data_for_agent)
@@ -370,8 +330,8 @@ async def submit_code(
         
         return PythonSubmissionResponse(
             id=submission.id,
-            session_id=submission.session_id.id,
-            question_id=submission.question_id.id,
+            session_id=submission.session_id_id,
+            question_id=submission.question_id_id,
             user_code=submission.user_code,
             execution_result=basic_result.get("output", "") or basic_result.get("error", "执行完成"),
             test_results={"message": "已完成智能体评估", "score": final_score},
@@ -403,30 +363,17 @@ async def get_test_report(
         if session.status != 'completed':
             raise HTTPException(status_code=400, detail="测试尚未完成")
         
+        # 一次联表查询获取所有提交及其题目，供后续各处复用
+        submissions = list(get_session_submissions(session_id))
+        
         # 获取智能体生成的报告 
         ai_report = json.loads(session.report) if session.report else {}
         
         # 如果智能体报告为空或不完整，重新生成
         if not ai_report or "overall_skill_level" not in ai_report:
             try:
-                # 重新获取会话数据并生成报告
-                all_submissions = list(PythonSubmission.select().where(PythonSubmission.session_id == session_id))
-                session_data_for_agent = []
-                
-                for sub in all_submissions:
-                    sub_question = PythonQuestion.get_by_id(sub.question_id.id)
-                    review_data = json.loads(sub.review_result) if sub.review_result else {}
-                    
-                    session_data_for_agent.append({
-                        "question_title": sub_question.title,
-                        "difficulty": sub_question.difficulty,
-                        "user_code": sub.user_code,
-                        "score": sub.score,
-                        "passed": sub.is_passed,
-                        "review_result": review_data
-                    })
-                
-                # 重新生成报告
+                # 基于已加载的会话数据重新生成报告
+                session_data_for_agent = _build_session_data_for_agent(submissions)
                 ai_report = await generate_python_session_report(session_data_for_agent)
                 
                 # 更新数据库
@@ -439,7 +386,6 @@ async def get_test_report(
                 ai_report = {"overall_skill_level": "中级", "detailed_feedback": "报告生成中遇到问题"}
         
         # 获取基础统计数据
-        submissions = list(PythonSubmission.select().where(PythonSubmission.session_id == session_id))
         total_questions = len(submissions)
         passed_questions = sum(1 for s in submissions if s.is_passed)
         total_score = sum(s.score for s in submissions)
@@ -448,8 +394,7 @@ async def get_test_report(
         # 生成基础难度分析数据
         difficulty_stats = {}
         for submission in submissions:
-            question = PythonQuestion.get_by_id(submission.question_id.id)
-            difficulty = question.difficulty
+            difficulty = submission.question_id.difficulty
             if difficulty not in difficulty_stats:
                 difficulty_stats[difficulty] = {
                     "attempted": 0,
@@ -507,23 +452,7 @@ async def get_test_report(
         
         # 构建详细结果
         for submission in submissions:
-            question = PythonQuestion.get_by_id(submission.question_id.id)
-            test_data = json.loads(submission.test_results) if submission.test_results else {}
-            review_data = json.loads(submission.review_result) if submission.review_result else {}
-            
-            detailed_result = {
-                "question_title": question.title,
-                "difficulty": question.difficulty,
-                "score": submission.score,
-                "passed": submission.is_passed,
-                "test_passed": test_data.get("passed_tests", 0),
-                "test_total": test_data.get("total_tests", 0),
-                "user_code": submission.user_code,
-                "skill_level": review_data.get("skill_level", "未知"),
-                "strengths": review_data.get("strengths", []),
-                "improvements": review_data.get("weaknesses", [])
-            }
-            report_data["detailed_results"].append(detailed_result)
+            report_data["detailed_results"].append(_build_detailed_result(submission))
         
         return TestReportResponse(**report_data)
     except HTTPException:
@@ -535,8 +464,8 @@ async def get_test_report(
 async def generate_test_report(session_id: int, user_id: int) -> Dict[str, Any]:
     """生成基础测试报告（备用函数）"""
     try:
-        # 获取所有提交记录
-        submissions = list(PythonSubmission.select().where(PythonSubmission.session_id == session_id))
+        # 获取所有提交记录（联表带出题目）
+        submissions = list(get_session_submissions(session_id))
         
         if not submissions:
             raise ValueError("没有找到提交记录")
@@ -552,11 +481,7 @@ async def generate_test_report(session_id: int, user_id: int) -> Dict[str, Any]:
         detailed_results = []
         
         for submission in submissions:
-            question = PythonQuestion.get_by_id(submission.question_id.id)
-            test_data = json.loads(submission.test_results) if submission.test_results else {}
-            review_data = json.loads(submission.review_result) if submission.review_result else {}
-            
-            difficulty = question.difficulty
+            difficulty = submission.question_id.difficulty
             if difficulty not in difficulty_stats:
                 difficulty_stats[difficulty] = {"attempted": 0, "passed": 0, "scores": []}
             
@@ -566,18 +491,7 @@ async def generate_test_report(session_id: int, user_id: int) -> Dict[str, Any]:
             difficulty_stats[difficulty]["scores"].append(submission.score)
             
             # 详细结果
-            detailed_results.append({
-                "question_title": question.title,
-                "difficulty": difficulty,
-                "score": submission.score,
-                "passed": submission.is_passed,
-                "test_passed": test_data.get("passed_tests", 0),
-                "test_total": test_data.get("total_tests", 0),
-                "user_code": submission.user_code,
-                "skill_level": review_data.get("skill_level", "未知"),
-                "strengths": review_data.get("strengths", []),
-                "improvements": review_data.get("weaknesses", [])
-            })
+            detailed_results.append(_build_detailed_result(submission))
         
         # 简化的技能评估（主要基于测试通过率和智能体评估）
         if average_score >= 80:
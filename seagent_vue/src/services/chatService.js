@@ -119,7 +119,7 @@ export const sendMessage = async (chatId, userId, message, role = 'user', collec
 
 // 发送消息到指定对话（改进的流式模式，支持打字机效果）
 export const sendStreamMessage = async (
-  { chatId, userId, message, role = 'user', collection_name = null },
+  { chatId, userId, message, role = 'user', collection_name = null, collection_names = null },
   callbacks
 ) => {
   const { onMessage, onToolCall, onDone, onError, onTyping } = callbacks || {};
@@ -130,6 +130,8 @@ export const sendStreamMessage = async (
     role,
     user_id: String(userId),
     ...(collection_name && { collection_name }),
+    // 同时检索多个知识库
+    ...(collection_names && collection_names.length && { collection_names }),
   };
 
   try {
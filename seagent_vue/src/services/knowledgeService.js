@@ -23,6 +23,17 @@ export const uploadKnowledgeFile = async (file, collectionName) => {
   }
 };
 
+// 查询知识库导入任务进度
+export const getIngestionJob = async (jobId) => {
+  try {
+    const response = await api.get(`/knowledge/jobs/${jobId}`);
+    return response;
+  } catch (error) {
+    console.error('获取导入进度失败:', error);
+    throw error;
+  }
+};
+
 // 获取知识库集合列表
 export const getKnowledgeCollections = async () => {
   try {
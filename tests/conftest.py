@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# 仓库根目录加入导入路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 应用模块导入时读取的环境变量（未设置时使用）
+TEST_ENVIRON = {
+    "OPENAI_API_KEY": "test",
+    "OPENAI_API_BASE": "http://127.0.0.1:9/v1",
+    "DB_PATH": ":memory:",
+}
+
+
+@pytest.fixture(scope="session", autouse=True)
+def isolated_workdir(tmp_path_factory):
+    """
+    应用模块导入时会读取环境变量并在当前目录下创建向量库等目录，测试期间切换到临时目录并补齐环境变量，
+    结束后恢复工作目录与环境变量，临时目录由 pytest 按保留策略清理。
+    依赖这些前提的应用模块在测试函数或夹具中导入，不在测试模块顶层导入（收集阶段早于本夹具）。
+    """
+    with pytest.MonkeyPatch.context() as patch:
+        for name, value in TEST_ENVIRON.items():
+            if name not in os.environ:
+                patch.setenv(name, value)
+        patch.chdir(tmp_path_factory.mktemp("workdir"))
+        yield
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+
+class _FakeRetriever:
+    def __init__(self, name, release=None):
+        self.lexical_index = SimpleNamespace(path=f"/kb/{name}", collection_name=name)
+        self.release = release
+        self.calls = 0
+
+    def invoke(self, query):
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait(5)
+        return [Document(page_content=f"{self.lexical_index.collection_name}: {query}",
+                         metadata={"relevance_score": 0.5})]
+
+
+def _federated(*retrievers):
+    from utils.tools.retriever import FederatedRetriever
+
+    return FederatedRetriever(
+        retrievers=[(retriever.lexical_index.collection_name, retriever) for retriever in retrievers],
+        latency_budget=0.05
+    )
+
+
+def test_timed_out_collection_is_skipped_until_it_finishes():
+    from utils.tools.retriever import _stragglers
+
+    release = threading.Event()
+    fast, slow = _FakeRetriever("fast"), _FakeRetriever("slow", release)
+    retriever = _federated(fast, slow)
+
+    for _ in range(3):
+        documents = retriever.invoke("问题")
+        assert [document.metadata["collection"] for document in documents] == ["fast"]
+    # 慢集合只占用一个线程，后续检索不再向它提交
+    assert slow.calls == 1
+
+    release.set()
+    for _ in range(100):
+        if not _stragglers.busy(("/kb/slow", "slow")):
+            break
+        threading.Event().wait(0.01)
+    assert len(retriever.invoke("问题")) == 2
+    assert slow.calls == 2
+
+
+def test_async_search_registers_stragglers():
+    from utils.tools.retriever import _stragglers
+
+    release = threading.Event()
+    fast, slow = _FakeRetriever("fast-async"), _FakeRetriever("slow-async", release)
+    retriever = _federated(fast, slow)
+
+    documents = asyncio.run(retriever.ainvoke("问题"))
+    assert [document.metadata["collection"] for document in documents] == ["fast-async"]
+    assert _stragglers.busy(("/kb/slow-async", "slow-async"))
+    asyncio.run(retriever.ainvoke("问题"))
+    assert slow.calls == 1
+    release.set()
@@ -0,0 +1,31 @@
+import asyncio
+
+
+def test_jobs_for_one_collection_run_one_at_a_time(tmp_path, monkeypatch):
+    from utils.ingestion import IngestionManager, JOB_COMPLETED
+
+    running = {}
+    peak = {}
+
+    async def ingest(self, job):
+        running[job.db_path] = running.get(job.db_path, 0) + 1
+        peak[job.db_path] = max(peak.get(job.db_path, 0), running[job.db_path])
+        await asyncio.sleep(0.01)
+        running[job.db_path] -= 1
+
+    monkeypatch.setattr(IngestionManager, "_ingest", ingest)
+
+    async def run():
+        manager = IngestionManager()
+        jobs = [
+            manager.submit(1, name, f"{i}.txt", str(tmp_path / f"{i}.txt"), str(tmp_path / name), loader=None)
+            for i, name in enumerate(["a", "a", "a", "b"])
+        ]
+        await asyncio.gather(*manager._tasks)
+        return manager, jobs
+
+    manager, jobs = asyncio.run(run())
+    assert all(job.status == JOB_COMPLETED for job in jobs)
+    assert peak == {str(tmp_path / "a"): 1, str(tmp_path / "b"): 1}
+    manager._prune()
+    assert manager._collection_locks == {}
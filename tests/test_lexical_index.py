@@ -0,0 +1,45 @@
+import threading
+import time
+
+from utils.lexical_index import LexicalIndex
+
+
+class _SlowCollection:
+    """分页返回文本块、每页都较慢的集合"""
+
+    def __init__(self, total: int):
+        self.ids = [f"chunk-{i}" for i in range(total)]
+        self.calls = 0
+
+    def get(self, include, limit, offset):
+        self.calls += 1
+        time.sleep(0.01)
+        ids = self.ids[offset:offset + limit]
+        return {"ids": ids, "documents": [f"装饰器 示例 {i}" for i in ids], "metadatas": [{} for _ in ids]}
+
+
+def test_concurrent_ensure_synced_rebuilds_once_and_never_exposes_partial_index(tmp_path):
+    collection = _SlowCollection(1200)
+    indexes = [LexicalIndex(str(tmp_path), "kb") for _ in range(4)]
+    counts = []
+    stop = threading.Event()
+
+    def observe():
+        reader = LexicalIndex(str(tmp_path), "kb")
+        while not stop.is_set():
+            counts.append(reader.count())
+
+    observer = threading.Thread(target=observe)
+    observer.start()
+    threads = [threading.Thread(target=index.ensure_synced, args=(collection,)) for index in indexes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    observer.join()
+
+    # 每页 500 个文本块：三页数据加一次空页
+    assert collection.calls == 4
+    assert set(counts) <= {0, 1200}
+    assert all(index.count() == 1200 for index in indexes)
@@ -0,0 +1,52 @@
+import pytest
+
+from utils.mmap_store import MmapVectorStore
+
+
+def _store(tmp_path):
+    store = MmapVectorStore(str(tmp_path), "test")
+    store.upsert(["a", "b"], [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]], ["旧内容 a", "内容 b"], [{}, {}])
+    return store
+
+
+def test_failed_upsert_keeps_old_row_searchable(tmp_path, monkeypatch):
+    store = _store(tmp_path)
+
+    def fail(*args, **kwargs):
+        raise OSError("磁盘已满")
+
+    monkeypatch.setattr(MmapVectorStore, "_write_at", staticmethod(fail))
+    with pytest.raises(OSError):
+        store.upsert(["a"], [[0.0, 0.0, 1.0]], ["新内容 a"], [{}])
+
+    assert store.get(ids=["a"])["documents"] == ["旧内容 a"]
+    results = store.search_by_vector([1.0, 0.0, 0.0], k=1)
+    assert [document.page_content for document, _ in results] == ["旧内容 a"]
+
+
+def test_interrupted_delete_keeps_row_searchable(tmp_path, monkeypatch):
+    store = _store(tmp_path)
+    delete_rows = MmapVectorStore._delete_rows
+
+    def interrupted(self, rows):
+        # 行已从 SQLite 中删除、提交前被中断
+        delete_rows(self, rows)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(MmapVectorStore, "_delete_rows", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        store.delete(ids=["b"])
+
+    results = store.search_by_vector([0.0, 1.0, 0.0], k=1)
+    assert [document.page_content for document, _ in results] == ["内容 b"]
+
+
+def test_upsert_and_delete_tombstone_old_rows(tmp_path):
+    store = _store(tmp_path)
+    store.upsert(["a"], [[0.0, 0.0, 1.0]], ["新内容 a"], [{}])
+    store.delete(ids=["b"])
+
+    assert store.count() == 1
+    assert [document.page_content for document, _ in store.search_by_vector([1.0, 0.0, 0.0], k=3)] == ["新内容 a"]
+    store._refresh(store._committed_rows(), store._generation())
+    assert list(store._scales[:2]) == [0.0, 0.0]
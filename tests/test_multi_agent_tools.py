@@ -0,0 +1,13 @@
+def test_default_knowledge_tool_is_resolved_per_request(monkeypatch):
+    import utils.multi_agent as multi_agent
+
+    calls = []
+    monkeypatch.setattr(multi_agent, "get_retriever_tool",
+                        lambda path, collection_name: calls.append((path, collection_name)) or object())
+
+    first = multi_agent.get_knowledge_retriever_tool()
+    second = multi_agent.get_knowledge_retriever_tool(user_id=1, collection_names=["不存在的集合"])
+
+    default = (multi_agent.DEFAULT_KNOWLEDGE_PATH, multi_agent.COLLECTION_NAME)
+    assert calls == [default, default]
+    assert first is not second
@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import pytest
+from peewee import SqliteDatabase
+
+REVIEW = {"quality_score": 8, "skill_level": "中级", "strengths": ["结构清晰"], "weaknesses": [], "suggestions": ["补充注释"]}
+REPORT = {"overall_skill_level": "中级", "skill_score": 80, "difficulty_performance": {}, "learning_path": []}
+
+
+@pytest.fixture
+def python_test():
+    import routes.python_test as python_test
+
+    return python_test
+
+
+@pytest.fixture
+def test_db(python_test, monkeypatch):
+    from database.models.python_test import PythonQuestion, PythonSubmission, PythonTestSession
+    from database.models.user import User
+
+    async def review_python_code(*args, **kwargs):
+        return dict(REVIEW)
+
+    async def generate_python_session_report(session_data):
+        return dict(REPORT)
+
+    monkeypatch.setattr(python_test, "review_python_code", review_python_code)
+    monkeypatch.setattr(python_test, "generate_python_session_report", generate_python_session_report)
+
+    models = [User, PythonQuestion, PythonTestSession, PythonSubmission]
+    database = SqliteDatabase(":memory:")
+    with database.bind_ctx(models):
+        database.create_tables(models)
+        yield database
+    database.close()
+
+
+def _create_session(size: int):
+    """创建一个共 size 道题、已提交前 size - 1 道的测试会话，返回 (用户, 会话, 最后一道题)"""
+    from database.models.python_test import PythonQuestion, PythonSubmission, PythonTestSession
+    from database.models.user import User
+
+    user = User.create(user_id=f"user-{size}", user_password="x", email=f"user-{size}@example.com")
+    questions = [
+        PythonQuestion.create(title=f"题目 {i}", description="描述", difficulty=i % 3 + 1, test_cases="[]")
+        for i in range(size)
+    ]
+    session = PythonTestSession.create(
+        user_id=user, questions=json.dumps([q.id for q in questions]), current_question_index=size - 1
+    )
+    for question in questions[:-1]:
+        PythonSubmission.create(
+            session_id=session, question_id=question, user_code="print(1)",
+            test_results=json.dumps({"score": 80}), review_result=json.dumps(REVIEW), score=80, is_passed=True
+        )
+    return user, session, questions[-1]
+
+
+def _count_statements(database, call) -> int:
+    statements = []
+    database.connection().set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        database.connection().set_trace_callback(None)
+    return len(statements)
+
+
+def _report_query_counts(python_test, database, size: int):
+    from database.models.python_test import PythonSubmissionCreate, PythonTestSession
+
+    user, session, last_question = _create_session(size)
+    submission = PythonSubmissionCreate(session_id=session.id, question_id=last_question.id, user_code="print(1)")
+    submit = _count_statements(database, lambda: asyncio.run(python_test.submit_code(submission, current_user=user)))
+    report = _count_statements(database, lambda: asyncio.run(python_test.get_test_report(session.id, current_user=user)))
+    generated = _count_statements(database, lambda: asyncio.run(python_test.generate_test_report(session.id, user.id)))
+    assert PythonTestSession.get_by_id(session.id).status == "completed"
+    return submit, report, generated
+
+
+def test_report_query_count_is_independent_of_submission_count(python_test, test_db):
+    assert _report_query_counts(python_test, test_db, 1) == _report_query_counts(python_test, test_db, 8)
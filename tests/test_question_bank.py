@@ -0,0 +1,53 @@
+import pytest
+from peewee import SqliteDatabase
+
+
+@pytest.fixture
+def test_db():
+    from database.models.python_test import PythonQuestion
+
+    database = SqliteDatabase(":memory:")
+    with database.bind_ctx([PythonQuestion]):
+        database.create_tables([PythonQuestion])
+        yield database
+    database.close()
+
+
+def _create_questions(count: int, difficulty: int):
+    from database.models.python_test import PythonQuestion
+
+    return [
+        PythonQuestion.create(title=f"难度{difficulty} 题目 {i}", description="描述", difficulty=difficulty, test_cases="[]")
+        for i in range(count)
+    ]
+
+
+def test_sample_skips_questions_deactivated_by_another_worker(test_db):
+    from database.models.python_test import PythonQuestion
+    from utils.question_bank import QuestionBank
+
+    bank = QuestionBank()
+    questions = _create_questions(3, 1) + _create_questions(3, 2)
+    bank.index.load()
+
+    # 其他工作进程下线了全部题目并写入了新题目，本进程的索引仍是旧的
+    PythonQuestion.update(is_active=False).execute()
+    fresh = _create_questions(2, 1) + _create_questions(2, 2)
+
+    selected = bank._sample_active([1, 2, 2])
+    assert len(selected) == 3
+    assert set(selected) <= {question.id for question in fresh}
+    assert not set(selected) & {question.id for question in questions}
+
+
+def test_id_pool_sample_near_pool_size():
+    from utils.question_bank import _IdPool
+
+    pool = _IdPool()
+    for item_id in range(1000):
+        pool.add(item_id)
+
+    picked = pool.sample(999, {0, 1})
+    assert len(picked) == 998
+    assert len(set(picked)) == 998
+    assert not {0, 1} & set(picked)
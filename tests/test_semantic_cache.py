@@ -0,0 +1,36 @@
+import time
+
+from utils.semantic_cache import SemanticCache, cache_scope
+
+
+def test_expired_nearest_entry_does_not_hide_valid_one(monkeypatch):
+    cache = SemanticCache(threshold=0.9, ttl=60)
+    cache.store("scope", "旧问题", [1.0, 0.0], "旧回答", 10)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 50)
+    cache.store("scope", "新问题", [0.95, 0.3], "新回答", 10)
+
+    # 旧条目与查询完全相同但已过期，应命中次相似的有效条目
+    monkeypatch.setattr(time, "time", lambda: now + 100)
+    hit = cache.lookup("scope", [1.0, 0.0])
+    assert hit is not None and hit.answer == "新回答"
+    assert cache.stats()["entries"] == 1
+
+
+def test_scope_key_removed_with_its_last_entry():
+    cache = SemanticCache(max_entries=1)
+    cache.store("v1", "问题", [1.0, 0.0], "回答", 1)
+    cache.lookup("v1", [1.0, 0.0])
+    cache.store("v2", "问题", [1.0, 0.0], "回答", 1)
+
+    assert set(cache._matrices) <= {"v2"}
+    assert cache.stats()["scopes"] == 1
+    assert cache.lookup("v1", [1.0, 0.0]) is None
+
+
+def test_scope_depends_on_tool_set():
+    collections = [("/kb", "knowledge_base", "1")]
+    base = cache_scope("prompt", collections, [("knowledge_base", "检索知识库")])
+    with_mcp = cache_scope("prompt", collections, [("knowledge_base", "检索知识库"), ("weather", "查询天气")])
+    assert base != with_mcp
+    assert base == cache_scope("prompt", collections, [("knowledge_base", "检索知识库")])
@@ -0,0 +1,59 @@
+import asyncio
+import re
+
+import pytest
+from langchain_core.messages import AIMessage
+
+REVIEW = {"skill_level": "中级", "strengths": ["结构清晰" * 20] * 3, "weaknesses": ["缺少注释" * 20] * 3}
+
+
+class _RecordingModel:
+    def __init__(self):
+        self.requests = []
+
+    async def ainvoke(self, messages):
+        self.requests.append(messages[-1]["content"])
+        return AIMessage(content='{"overall_skill_level": "中级"}')
+
+
+@pytest.fixture
+def review_agent():
+    import utils.python_review_agent as review_agent
+
+    return review_agent
+
+
+def _reduce_summaries(review_agent, monkeypatch, size):
+    model = _RecordingModel()
+    monkeypatch.setattr(review_agent, "model", model)
+    session_data = [
+        {"question_title": f"题目 {i}", "difficulty": i % 5 + 1, "score": 80, "passed": True, "review_result": REVIEW}
+        for i in range(size)
+    ]
+
+    asyncio.run(review_agent.python_review_agent._generate_map_reduce_report(session_data))
+
+    assert len(model.requests) == 1
+    request = model.requests[0]
+    summaries = request.split("**各题目评估摘要：**\n", 1)[1].split("\n\n请综合以上摘要给出", 1)[0]
+    assert len(request) - len(summaries) < 2000
+    return summaries
+
+
+@pytest.mark.parametrize("size", [1, 10, 100, 500])
+def test_reduce_summaries_stay_within_budget(review_agent, monkeypatch, size):
+    summaries = _reduce_summaries(review_agent, monkeypatch, size)
+    assert len(summaries) <= review_agent.SESSION_REPORT_MAX_CHARS
+
+    # 逐题列出的摘要标题行完整，且至少保留最小长度
+    headers = re.findall(r"^题目 \d+: 题目 \d+（难度 \d/5，得分 80，通过）$", summaries, flags=re.MULTILINE)
+    assert 1 <= len(headers) <= review_agent.SESSION_REPORT_MAX_CHARS // review_agent.SESSION_REPORT_SUMMARY_MIN_CHARS
+
+
+def test_long_sessions_aggregate_the_rest_by_difficulty(review_agent, monkeypatch):
+    summaries = _reduce_summaries(review_agent, monkeypatch, 500)
+    aggregated = re.findall(r"^其余难度 (\d)/5 的 (\d+) 题：通过 \2 题，平均得分 80", summaries, flags=re.MULTILINE)
+    headers = re.findall(r"^题目 \d+: ", summaries, flags=re.MULTILINE)
+
+    assert sorted(difficulty for difficulty, _ in aggregated) == ["1", "2", "3", "4", "5"]
+    assert len(headers) + sum(int(count) for _, count in aggregated) == 500
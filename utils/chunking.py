@@ -0,0 +1,173 @@
+"""
+文本分块
+
+按 token 数而不是字符数切分文本块，并针对不同文件结构选择切分边界：
+Markdown 按标题/段落、代码按类/函数定义、CSV 每行一块（超长行再按字段切分）、
+普通文本按段落/句子。分块大小与重叠按集合配置，保存在集合目录下。
+"""
+
+import json
+import logging
+import os
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
+
+# 加载环境变量
+load_dotenv()
+
+CHUNK_SIZE_TOKENS = int(os.getenv("CHUNK_SIZE_TOKENS", "400"))  # 每个文本块的最大 token 数
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))  # 相邻文本块重叠的 token 数
+CHUNK_TOKEN_ENCODING = os.getenv("CHUNK_TOKEN_ENCODING", "cl100k_base")  # 计算 token 数使用的编码
+
+# 集合目录下保存分块配置的文件名
+CHUNKING_CONFIG_FILENAME = "chunking.json"
+
+# 文件扩展名 -> 结构类型
+FILE_KINDS = {
+    "md": "markdown",
+    "markdown": "markdown",
+    "py": "python",
+    "js": "js",
+    "ts": "ts",
+    "csv": "csv",
+}
+
+# 普通文本的切分边界：段落、换行、中英文句末标点、空格
+TEXT_SEPARATORS = ["\n\n", "\n", "。", "！", "？", ". ", "! ", "? ", "；", "; ", "，", ", ", " ", ""]
+
+# CSV 行的切分边界：每个字段占一行（"列名: 值"）
+CSV_SEPARATORS = ["\n", " ", ""]
+
+_LANGUAGES = {
+    "markdown": Language.MARKDOWN,
+    "python": Language.PYTHON,
+    "js": Language.JS,
+    "ts": Language.TS,
+}
+
+_encoding = None
+
+
+def _get_encoding():
+    """获取 tiktoken 编码，未安装时返回 None（按字符估算）"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(CHUNK_TOKEN_ENCODING)
+        except Exception as e:
+            logging.warning(f"tiktoken 不可用，按字符数估算 token 数: {str(e)}")
+            _encoding = False
+    return _encoding or None
+
+
+def token_length(text: str) -> int:
+    """
+    计算文本的 token 数
+    tiktoken 不可用时估算：非 ASCII 字符（如汉字）每个约 1 个 token，ASCII 字符约 4 个一个 token
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+class ChunkingConfig:
+    """集合的分块配置（单位为 token）"""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE_TOKENS, chunk_overlap: int = CHUNK_OVERLAP_TOKENS):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size 必须大于 0")
+        if chunk_overlap < 0 or chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap 必须大于等于 0 且小于 chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def updated(self, chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None) -> "ChunkingConfig":
+        """返回覆盖了指定字段的新配置"""
+        return ChunkingConfig(
+            chunk_size=self.chunk_size if chunk_size is None else chunk_size,
+            chunk_overlap=self.chunk_overlap if chunk_overlap is None else chunk_overlap
+        )
+
+    def to_dict(self) -> Dict[str, int]:
+        return {"chunk_size": self.chunk_size, "chunk_overlap": self.chunk_overlap}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ChunkingConfig":
+        return cls(
+            chunk_size=data.get("chunk_size", CHUNK_SIZE_TOKENS),
+            chunk_overlap=data.get("chunk_overlap", CHUNK_OVERLAP_TOKENS)
+        )
+
+
+def load_chunking_config(db_path: str) -> ChunkingConfig:
+    """读取集合的分块配置，不存在时使用默认配置"""
+    config_path = os.path.join(db_path, CHUNKING_CONFIG_FILENAME)
+    if not os.path.exists(config_path):
+        return ChunkingConfig()
+    with open(config_path, "r", encoding="utf-8") as f:
+        return ChunkingConfig.from_dict(json.load(f))
+
+
+def save_chunking_config(db_path: str, config: ChunkingConfig):
+    """保存集合的分块配置"""
+    os.makedirs(db_path, exist_ok=True)
+    config_path = os.path.join(db_path, CHUNKING_CONFIG_FILENAME)
+    temp_path = f"{config_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(config.to_dict(), f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, config_path)
+
+
+def file_kind(filename: str) -> str:
+    """根据文件扩展名判断结构类型，未知类型按普通文本处理"""
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    return FILE_KINDS.get(extension, "text")
+
+
+class Chunker:
+    """
+    按结构类型与 token 长度切分文档
+    逐个文档切分，输入可以是流式加载器返回的生成器。
+    """
+
+    def __init__(self, kind: str = "text", config: Optional[ChunkingConfig] = None):
+        self.kind = kind
+        self.config = config or ChunkingConfig()
+
+        if kind in _LANGUAGES:
+            separators = RecursiveCharacterTextSplitter.get_separators_for_language(_LANGUAGES[kind])
+            is_separator_regex = True
+        else:
+            separators = CSV_SEPARATORS if kind == "csv" else TEXT_SEPARATORS
+            is_separator_regex = False
+
+        self._splitter = RecursiveCharacterTextSplitter(
+            separators=separators,
+            is_separator_regex=is_separator_regex,
+            chunk_size=self.config.chunk_size,
+            chunk_overlap=self.config.chunk_overlap,
+            length_function=token_length
+        )
+
+    def split(self, document: Document) -> List[Document]:
+        """切分单个文档"""
+        # CSV 每行本身就是一个完整记录，不超长时保持原样
+        if self.kind == "csv" and token_length(document.page_content) <= self.config.chunk_size:
+            return [document]
+        return self._splitter.split_documents([document])
+
+    def iter_chunks(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """逐个文档切分并生成文本块"""
+        for document in documents:
+            yield from self.split(document)
+
+
+def chunker_for_file(filename: str, config: Optional[ChunkingConfig] = None) -> Chunker:
+    """根据文件名选择分块器"""
+    return Chunker(file_kind(filename), config)
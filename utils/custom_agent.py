@@ -22,8 +22,8 @@ from utils.tools.code_reviewer import (
     best_practices_advisor
 )
 
-# 默认知识库工具 - 只作为备用
-default_retriever_tool = get_retriever_tool(path="./vector_db/know_db")
+# 默认知识库路径，检索工具在每次请求时从检索器池获取
+DEFAULT_KNOWLEDGE_PATH = "./vector_db/know_db"
 
 # 基础工具集，不包含知识库检索工具
 base_tools = [
@@ -73,10 +73,10 @@ def get_agent_executor(user_id=None, collection_name=None):
             retriever_tool = get_retriever_tool(path=user_kb_path, collection_name=collection_name)
         else:
             # 用户特定知识库不存在，使用默认知识库
-            retriever_tool = default_retriever_tool
+            retriever_tool = get_retriever_tool(path=DEFAULT_KNOWLEDGE_PATH)
     else:
         # 没有指定用户ID或集合名称，使用默认知识库
-        retriever_tool = default_retriever_tool
+        retriever_tool = get_retriever_tool(path=DEFAULT_KNOWLEDGE_PATH)
 
     # 合并工具
     tools = base_tools + [retriever_tool]
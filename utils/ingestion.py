@@ -0,0 +1,364 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+from dotenv import load_dotenv
+
+from adapter.openai_api import embeddings
+from utils.chunking import ChunkingConfig, chunker_for_file, load_chunking_config, save_chunking_config
+from utils.loader import LoadProgress
+from utils.vectorstore import (
+    iter_chunks, iter_changed_chunks, iter_batches, get_collection, get_collection_lexical_index, file_digest,
+    load_manifest, record_ingestion, is_unchanged, source_chunk_ids, delete_stale_chunks
+)
+
+logging.basicConfig(level=logging.INFO)
+
+# 加载环境变量
+load_dotenv()
+
+# 知识库导入配置
+INGESTION_EMBED_BATCH_SIZE = int(os.getenv("INGESTION_EMBED_BATCH_SIZE", "64"))  # 单次嵌入请求的文本块数
+INGESTION_EMBED_CONCURRENCY = int(os.getenv("INGESTION_EMBED_CONCURRENCY", "4"))  # 并发嵌入请求上限
+INGESTION_JOB_TTL = int(os.getenv("INGESTION_JOB_TTL", "3600"))  # 已结束任务的保留时间（秒）
+
+# 任务状态
+JOB_PENDING = "pending"
+JOB_LOADING = "loading"
+JOB_EMBEDDING = "embedding"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED)
+
+# 队列结束标记
+_DONE = object()
+
+
+class IngestionJob:
+    """单个文件的知识库导入任务"""
+
+    def __init__(self, user_id: int, collection_name: str, filename: str,
+                 file_path: str, db_path: str, loader: Callable[..., Iterator[Any]],
+                 chunking: Optional[ChunkingConfig] = None, digest: Optional[str] = None):
+        self.job_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.collection_name = collection_name
+        self.filename = filename
+        self.file_path = file_path
+        self.db_path = db_path
+        self.loader = loader
+        self.chunking = chunking  # 为 None 时使用集合保存的分块配置
+        self.digest = digest  # 文件内容摘要，上传时已边接收边计算；为 None 时导入前读取文件计算
+
+        self.status = JOB_PENDING
+        self.error: Optional[str] = None
+        self.load_progress = LoadProgress()
+        self.total_chunks: Optional[int] = None  # 文件读取完毕后才确定
+        self.produced_chunks = 0
+        self.embedded_chunks = 0
+        self.written_chunks = 0
+        self.cache_hits = 0  # 命中嵌入缓存、无需调用嵌入接口的文本块数
+        self.cache_misses = 0
+        self.skipped = False  # 内容与已导入版本相同，未重新导入
+        self.reused_chunks = 0  # 替换同名文件时内容未变、沿用的文本块数
+        self.deleted_chunks = 0  # 替换同名文件时删除的旧文本块数
+
+        self.created_at = time.time()
+        self.embedding_started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def progress(self) -> Dict[str, Any]:
+        """
+        任务进度
+        :return: 包含状态、已写入块数、嵌入缓存命中数、吞吐量（块/秒）和预计剩余时间（秒）的字典
+        """
+        # 流式加载时总块数未知，按已读取的文件比例估算
+        estimated_total = self.total_chunks
+        if estimated_total is None and self.load_progress.fraction > 0:
+            estimated_total = max(self.produced_chunks, round(self.produced_chunks / self.load_progress.fraction))
+
+        chunks_per_second = None
+        eta_seconds = None
+        if self.embedding_started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.embedding_started_at
+            if elapsed > 0 and self.written_chunks:
+                chunks_per_second = round(self.written_chunks / elapsed, 2)
+                if estimated_total is not None and not self.finished:
+                    eta_seconds = round(max(0, estimated_total - self.written_chunks) / chunks_per_second, 1)
+        if self.status == JOB_COMPLETED:
+            eta_seconds = 0
+
+        return {
+            "job_id": self.job_id,
+            "collection_name": self.collection_name,
+            "filename": self.filename,
+            "status": self.status,
+            "skipped": self.skipped,
+            "chunking": self.chunking.to_dict() if self.chunking else None,
+            "error": self.error,
+            "total_chunks": self.total_chunks,
+            "estimated_total_chunks": estimated_total,
+            "load_fraction": round(self.load_progress.fraction, 4),
+            "embedded_chunks": self.embedded_chunks,
+            "written_chunks": self.written_chunks,
+            "reused_chunks": self.reused_chunks,
+            "deleted_chunks": self.deleted_chunks,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "chunks_per_second": chunks_per_second,
+            "eta_seconds": eta_seconds,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+class IngestionManager:
+    """
+    知识库导入任务管理
+    上传接口只保存文件并提交任务，加载、拆分、嵌入和写入在后台进行：
+    加载与拆分放到线程中执行，文本块按批次经过并发受限的嵌入请求后由单个写入协程写入Chroma，
+    各阶段之间通过有界队列衔接，嵌入与写入可以重叠进行。
+    同一集合的任务按提交顺序逐个执行（替换同名文件时需要先读取旧文本块再删除，并发执行会互相遗漏），
+    排队中的任务保持 pending 状态；不同集合的任务并行执行。
+    """
+
+    def __init__(self,
+                 batch_size: int = INGESTION_EMBED_BATCH_SIZE,
+                 concurrency: int = INGESTION_EMBED_CONCURRENCY,
+                 job_ttl: int = INGESTION_JOB_TTL):
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.job_ttl = job_ttl
+
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        # 集合目录 -> 导入锁，同一集合同一时间只有一个任务在导入
+        self._collection_locks: Dict[str, asyncio.Lock] = {}
+
+    # ---------- 任务管理 ----------
+
+    def submit(self, user_id: int, collection_name: str, filename: str,
+               file_path: str, db_path: str, loader: Callable[..., Iterator[Any]],
+               chunking: Optional[ChunkingConfig] = None, digest: Optional[str] = None) -> IngestionJob:
+        """
+        提交导入任务（需在事件循环中调用），立即返回
+        :param loader: 流式加载器，以 (文件路径, LoadProgress) 调用并逐个生成文档
+        :param chunking: 分块配置，指定时保存为集合的分块配置；默认使用集合已保存的配置
+        :param digest: 文件内容的 sha256 摘要，已知时不再读取文件计算
+        :return: 新建的任务
+        """
+        self._prune()
+        job = IngestionJob(user_id, collection_name, filename, file_path, db_path, loader, chunking, digest)
+        self._jobs[job.job_id] = job
+
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        logging.info(f"知识库导入任务已提交: {job.job_id} ({filename} -> {collection_name})")
+        return job
+
+    def get_job(self, job_id: str, user_id: int) -> Optional[IngestionJob]:
+        """获取用户自己的任务，不存在或不属于该用户时返回 None"""
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def list_jobs(self, user_id: int) -> List[IngestionJob]:
+        """列出用户的任务，最新的在前"""
+        self._prune()
+        jobs = [job for job in self._jobs.values() if job.user_id == user_id]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def has_active_job(self, user_id: int, collection_name: str) -> bool:
+        """集合是否有尚未结束的导入任务"""
+        return any(
+            job.user_id == user_id and job.collection_name == collection_name and not job.finished
+            for job in self._jobs.values()
+        )
+
+    async def stop(self):
+        """取消所有进行中的任务"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _prune(self):
+        """清理超过保留时间的已结束任务"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.job_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        # 没有未结束任务（含排队中）的集合不再保留锁
+        active_paths = {os.path.abspath(job.db_path) for job in self._jobs.values() if not job.finished}
+        for path in [path for path in self._collection_locks if path not in active_paths]:
+            del self._collection_locks[path]
+
+    def _collection_lock(self, db_path: str) -> asyncio.Lock:
+        return self._collection_locks.setdefault(os.path.abspath(db_path), asyncio.Lock())
+
+    # ---------- 导入流水线 ----------
+
+    async def _run(self, job: IngestionJob):
+        try:
+            async with self._collection_lock(job.db_path):
+                await self._ingest(job)
+            job.status = JOB_COMPLETED
+            logging.info(f"知识库导入任务完成: {job.job_id}，共写入 {job.written_chunks} 个文本块")
+        except asyncio.CancelledError:
+            job.status = JOB_FAILED
+            job.error = "任务已取消"
+            raise
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(e)
+            logging.error(f"知识库导入任务失败: {job.job_id}，{str(e)}")
+        finally:
+            job.finished_at = time.time()
+            if os.path.exists(job.file_path):
+                os.remove(job.file_path)
+
+    async def _ingest(self, job: IngestionJob):
+        job.status = JOB_LOADING
+        if job.chunking is None:
+            job.chunking = await asyncio.to_thread(load_chunking_config, job.db_path)
+        else:
+            await asyncio.to_thread(save_chunking_config, job.db_path, job.chunking)
+        chunking = job.chunking.to_dict()
+
+        digest = job.digest or await asyncio.to_thread(file_digest, job.file_path)
+        manifest_entry = (await asyncio.to_thread(load_manifest, job.db_path)).get(job.filename)
+        if is_unchanged(manifest_entry, digest, chunking):
+            # 同名文件内容与分块配置都未变，整个文件跳过
+            job.skipped = True
+            job.total_chunks = manifest_entry.get("chunks", 0)
+            job.written_chunks = job.total_chunks
+            return
+
+        collection = await asyncio.to_thread(get_collection, job.db_path, job.collection_name)
+        lexical_index = await asyncio.to_thread(
+            get_collection_lexical_index, job.db_path, job.collection_name
+        )
+        await asyncio.to_thread(lexical_index.ensure_synced, collection)
+        # 同名文件内容或分块配置已变化时差量替换：ID（由内容决定）已存在的文本块沿用，不重新嵌入
+        existing_ids = await asyncio.to_thread(source_chunk_ids, collection, job.filename)
+
+        # 流式加载、按文件结构与 token 数拆分并以原始文件名作为来源计算确定性ID，
+        # 文本块按批次生成，不会全部驻留内存
+        chunker = chunker_for_file(job.filename, job.chunking)
+        current_ids = set()
+        chunk_batches = iter_batches(
+            iter_changed_chunks(
+                iter_chunks(job.loader(job.file_path, job.load_progress), job.filename, chunker),
+                existing_ids, current_ids
+            ),
+            self.batch_size
+        )
+        try:
+            await self._embed_and_write(job, collection, lexical_index, chunk_batches)
+        finally:
+            try:
+                chunk_batches.close()
+            except ValueError:
+                # 任务取消时生成器可能仍在线程中执行，由其结束后回收
+                pass
+        # 新文本块全部写入后再删除新版本中已不存在的旧文本块，替换过程中检索不会出现空档
+        job.reused_chunks = len(current_ids) - job.written_chunks
+        job.deleted_chunks = await asyncio.to_thread(
+            delete_stale_chunks, collection, lexical_index, existing_ids - current_ids
+        )
+        await asyncio.to_thread(
+            record_ingestion, job.db_path, job.filename, digest, len(current_ids), chunking,
+            os.path.getsize(job.file_path)
+        )
+
+    async def _embed_and_write(self, job: IngestionJob, collection, lexical_index,
+                               chunk_batches: Iterator[List[Any]]):
+        """
+        嵌入文本块并以确定性ID写入集合与全文索引（upsert，重复写入同一文本块不会产生重复数据）
+        生成器在线程中逐批推进，加载、嵌入与写入重叠进行。
+        """
+        job.status = JOB_EMBEDDING
+        job.embedding_started_at = time.time()
+
+        # 有界队列提供背压：嵌入领先写入的批次数受限，内存占用不随文件大小增长
+        batches: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        embedded: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def produce():
+            while True:
+                batch = await asyncio.to_thread(next, chunk_batches, None)
+                if batch is None:
+                    break
+                job.produced_chunks += len(batch)
+                await batches.put(batch)
+            job.total_chunks = job.produced_chunks
+            for _ in range(self.concurrency):
+                await batches.put(_DONE)
+
+        async def embed():
+            while True:
+                batch = await batches.get()
+                if batch is _DONE:
+                    await embedded.put(_DONE)
+                    return
+                batch_chunks = [chunk for chunk, _ in batch]
+                batch_ids = [doc_id for _, doc_id in batch]
+                vectors, hits = await embeddings.aembed_documents_with_stats(
+                    [chunk.page_content for chunk in batch_chunks]
+                )
+                job.embedded_chunks += len(batch_chunks)
+                job.cache_hits += hits
+                job.cache_misses += len(batch_chunks) - hits
+                await embedded.put((batch_chunks, batch_ids, vectors))
+
+        async def write():
+            remaining_workers = self.concurrency
+            while remaining_workers:
+                item = await embedded.get()
+                if item is _DONE:
+                    remaining_workers -= 1
+                    continue
+                batch, batch_ids, vectors = item
+                documents = [chunk.page_content for chunk in batch]
+                metadatas = [chunk.metadata for chunk in batch]
+                await asyncio.to_thread(
+                    collection.upsert,
+                    ids=batch_ids,
+                    embeddings=vectors,
+                    documents=documents,
+                    metadatas=metadatas
+                )
+                await asyncio.to_thread(lexical_index.upsert, batch_ids, documents, metadatas)
+                job.written_chunks += len(batch)
+
+        await _run_stages([produce(), *(embed() for _ in range(self.concurrency)), write()])
+
+
+async def _run_stages(coroutines):
+    """并发运行流水线各阶段，任一阶段出错时取消其余阶段并抛出该异常"""
+    tasks = [asyncio.create_task(coroutine) for coroutine in coroutines]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+# 全局导入任务管理实例
+ingestion_manager = IngestionManager()
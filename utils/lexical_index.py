@@ -0,0 +1,302 @@
+"""
+集合的本地全文索引
+
+与 Chroma 集合放在同一目录下的 SQLite FTS5 索引，导入时与向量同步写入，用于 BM25 词法检索。
+FTS5 自带的分词器不切分中文，因此写入前先自行分词：英文/数字按单词，中文按相邻二字（bigram），
+查询使用同样的分词方式。
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from typing import Dict, Iterable, List, Tuple
+
+from langchain_core.documents import Document
+
+# 集合目录下的全文索引文件名
+LEXICAL_INDEX_FILENAME = "lexical.sqlite3"
+
+# 英文单词/标识符（含下划线与点号连接的名称）、数字，以及连续的中日韩字符
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+(?:\.[A-Za-z0-9_]+)*|[぀-ヿ㐀-䶿一-鿿가-힯]+")
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+_indexes: Dict[Tuple[str, str], "LexicalIndex"] = {}
+_indexes_lock = threading.Lock()
+# 索引文件路径 -> 同步锁，“是否需要重建”的检查与重建在同一把锁内进行
+_sync_locks: Dict[str, threading.Lock] = {}
+
+
+def _sync_lock(path: str) -> threading.Lock:
+    with _indexes_lock:
+        return _sync_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def analyze(text: str) -> List[str]:
+    """
+    分词：英文单词与标识符转小写，中文按二字切分（单字保留原字）
+    下划线、点号连接的标识符保留为一个词，FTS5 会再拆成短语，查询时按短语匹配。
+    :param text: 文本
+    :return: 词列表（可能重复）
+    """
+    terms = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        token = match.group(0)
+        if not _CJK_PATTERN.match(token):
+            terms.append(token.lower())
+        elif len(token) == 1:
+            terms.append(token)
+        else:
+            terms.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return terms
+
+
+def _match_expression(terms: Iterable[str], operator: str) -> str:
+    """构造 FTS5 查询表达式，每个词加引号避免被解析为查询语法"""
+    return f" {operator} ".join(f'"{term}"' for term in dict.fromkeys(terms))
+
+
+class LexicalIndex:
+    """
+    单个集合的全文索引
+    documents 表保存文本块原文与元数据，documents_fts 表按相同的 rowid 保存分词结果；
+    文本块按 ID upsert，可按来源文件整体删除。
+    """
+
+    def __init__(self, db_path: str, collection_name: str):
+        self.path = os.path.join(db_path, LEXICAL_INDEX_FILENAME)
+        self.collection_name = collection_name
+
+        os.makedirs(db_path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "rowid INTEGER PRIMARY KEY, collection TEXT NOT NULL, id TEXT NOT NULL, "
+            "source TEXT, content TEXT NOT NULL, metadata TEXT NOT NULL, UNIQUE (collection, id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_source ON documents (collection, source)")
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(terms)")
+        # 记录已与向量集合同步过的集合，之后由导入流程增量维护
+        self._conn.execute("CREATE TABLE IF NOT EXISTS synced_collections (collection TEXT PRIMARY KEY)")
+        # 集合版本：每次写入或删除都换成新的随机值，检索结果缓存以此判断是否过期
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS collection_versions (collection TEXT PRIMARY KEY, version TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        """按ID写入文本块，已存在的ID覆盖旧内容"""
+        if not ids:
+            return
+        with self._lock:
+            self._delete_rows(
+                "SELECT rowid FROM documents WHERE collection = ? AND id IN ({})".format(",".join("?" * len(ids))),
+                [self.collection_name, *ids]
+            )
+            self._insert_rows(ids, documents, metadatas)
+            self._bump_version()
+            self._conn.commit()
+
+    def _insert_rows(self, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        for doc_id, content, metadata in zip(ids, documents, metadatas):
+            cursor = self._conn.execute(
+                "INSERT INTO documents (collection, id, source, content, metadata) VALUES (?, ?, ?, ?, ?)",
+                (self.collection_name, doc_id, (metadata or {}).get("source"), content,
+                 json.dumps(metadata or {}, ensure_ascii=False))
+            )
+            self._conn.execute(
+                "INSERT INTO documents_fts (rowid, terms) VALUES (?, ?)",
+                (cursor.lastrowid, " ".join(analyze(content)))
+            )
+
+    def delete_source(self, source: str):
+        """删除某个来源文件的全部文本块"""
+        with self._lock:
+            self._delete_rows(
+                "SELECT rowid FROM documents WHERE collection = ? AND source = ?",
+                [self.collection_name, source]
+            )
+            self._bump_version()
+            self._conn.commit()
+
+    def delete_ids(self, ids: List[str]):
+        """按ID删除文本块"""
+        if not ids:
+            return
+        with self._lock:
+            self._delete_rows(
+                "SELECT rowid FROM documents WHERE collection = ? AND id IN ({})".format(",".join("?" * len(ids))),
+                [self.collection_name, *ids]
+            )
+            self._bump_version()
+            self._conn.commit()
+
+    def clear(self):
+        """清空本集合的索引"""
+        with self._lock:
+            self._delete_rows("SELECT rowid FROM documents WHERE collection = ?", [self.collection_name])
+            self._bump_version()
+            self._conn.commit()
+
+    def _delete_rows(self, select_sql: str, params: List):
+        rowids = [(row[0],) for row in self._conn.execute(select_sql, params).fetchall()]
+        if rowids:
+            self._conn.executemany("DELETE FROM documents_fts WHERE rowid = ?", rowids)
+            self._conn.executemany("DELETE FROM documents WHERE rowid = ?", rowids)
+
+    def _bump_version(self):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO collection_versions (collection, version) VALUES (?, ?)",
+            (self.collection_name, uuid.uuid4().hex)
+        )
+
+    def version(self) -> str:
+        """
+        集合当前版本
+        导入流程写入的每批文本块都会同时写入本索引，版本随之更新，因此版本不变即集合内容未变。
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM collection_versions WHERE collection = ?", (self.collection_name,)
+            ).fetchone()
+        return row[0] if row else ""
+
+    def count(self) -> int:
+        """本集合已索引的文本块数"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM documents WHERE collection = ?", (self.collection_name,)
+            ).fetchone()[0]
+
+    def storage_stats(self) -> Dict:
+        """索引文件统计：文件大小与空闲页占比（删除后未回收的空间）"""
+        with self._lock:
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            freelist_count = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        files = [self.path, f"{self.path}-wal"]
+        return {
+            "bytes": sum(os.path.getsize(path) for path in files if os.path.exists(path)),
+            "free_ratio": round(freelist_count / page_count, 4) if page_count else 0.0
+        }
+
+    def compact(self) -> Dict:
+        """
+        压缩索引文件：合并 FTS5 的分段，VACUUM 回收删除留下的空闲页并截断 WAL
+        VACUUM 在一个事务中重写数据库，读取方始终看到完整的旧版本或新版本。
+        :return: 压缩前后的统计
+        """
+        before = self.storage_stats()
+        with self._lock:
+            self._conn.execute("INSERT INTO documents_fts (documents_fts) VALUES ('optimize')")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"before": before, "after": self.storage_stats()}
+
+    def search(self, query: str, k: int = 5, require_all: bool = False) -> List[Tuple[Document, float]]:
+        """
+        BM25 检索
+        :param query: 查询文本
+        :param k: 返回数量
+        :param require_all: 为 True 时要求文本块包含查询的全部词，否则包含任一词即可
+        :return: (文档, 分数) 列表，分数越大越相关
+        """
+        terms = analyze(query)
+        if not terms:
+            return []
+        expression = _match_expression(terms, "AND" if require_all else "OR")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT d.content, d.metadata, bm25(documents_fts) AS score "
+                "FROM documents_fts JOIN documents d ON d.rowid = documents_fts.rowid "
+                "WHERE documents_fts MATCH ? AND d.collection = ? ORDER BY score LIMIT ?",
+                (expression, self.collection_name, k)
+            ).fetchall()
+        # SQLite 的 bm25() 越小越相关，取负数使分数越大越相关
+        return [
+            (Document(page_content=content, metadata=json.loads(metadata)), -score)
+            for content, metadata, score in rows
+        ]
+
+    def ensure_synced(self, collection):
+        """
+        索引从未与向量集合同步过时（本功能上线前已导入的集合）从集合重建，之后由导入流程增量维护
+        检查与重建在按索引文件加锁的同一临界区内进行，并发调用只会重建一次
+        :param collection: chromadb 集合对象
+        """
+        with _sync_lock(self.path):
+            if not self._is_synced():
+                self._rebuild(collection, only_if_unsynced=True)
+
+    def rebuild_from(self, collection, page_size: int = 500):
+        """
+        从 chromadb 集合重建索引
+        :param collection: chromadb 集合对象
+        :param page_size: 每次从集合读取的文本块数
+        """
+        with _sync_lock(self.path):
+            self._rebuild(collection, page_size)
+
+    def _is_synced(self) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM synced_collections WHERE collection = ?", (self.collection_name,)
+            ).fetchone() is not None
+
+    def _rebuild(self, collection, page_size: int = 500, only_if_unsynced: bool = False):
+        """
+        在一个写事务中清空并重建索引，同时持有实例锁：本进程的检索等待重建完成，
+        其他进程在提交前只能读到旧索引，都不会读到只建了一半的索引
+        :param only_if_unsynced: 取得写锁后再检查一次，其他进程已经重建过时不再重建
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if only_if_unsynced and self._conn.execute(
+                    "SELECT 1 FROM synced_collections WHERE collection = ?", (self.collection_name,)
+                ).fetchone():
+                    self._conn.rollback()
+                    return
+                self._delete_rows("SELECT rowid FROM documents WHERE collection = ?", [self.collection_name])
+                offset = 0
+                while True:
+                    page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+                    if not page["ids"]:
+                        break
+                    self._insert_rows(page["ids"], page["documents"],
+                                      [metadata or {} for metadata in page["metadatas"]])
+                    offset += len(page["ids"])
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO synced_collections (collection) VALUES (?)", (self.collection_name,)
+                )
+                self._bump_version()
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        logging.info(f"已重建全文索引: {self.path} ({self.collection_name})，共 {offset} 个文本块")
+
+
+def get_lexical_index(db_path: str, collection_name: str) -> LexicalIndex:
+    """获取集合的全文索引（同一集合共享一个实例）"""
+    key = (os.path.abspath(db_path), collection_name)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = LexicalIndex(db_path, collection_name)
+            _indexes[key] = index
+        return index
+
+
+def drop_lexical_indexes(db_path: str):
+    """关闭某个集合目录下的全文索引连接（删除集合目录前调用）"""
+    prefix = os.path.abspath(db_path)
+    with _indexes_lock:
+        for key in [key for key in _indexes if key[0] == prefix]:
+            _indexes.pop(key)._conn.close()
+        _sync_locks.pop(os.path.join(prefix, LEXICAL_INDEX_FILENAME), None)
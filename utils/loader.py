@@ -1,5 +1,17 @@
+import codecs
+import csv
+import io
+import os
+from typing import Iterator, Optional
+
 from langchain_community.document_loaders import TextLoader, PyPDFLoader
 from langchain_community.document_loaders.csv_loader import CSVLoader
+from langchain_core.documents import Document
+
+from utils.pdf_extract import iter_page_texts
+
+# 流式读取文本文件时每次读取的字节数
+TEXT_STREAM_BLOCK_SIZE = 1024 * 1024
 
 
 def text_loader(url):
@@ -21,3 +33,99 @@ def pdf_loader(url):
     loader = PyPDFLoader(url)
     docs = loader.load_and_split()
     return docs
+
+
+class LoadProgress:
+    """流式加载进度，fraction 为已读取部分占整个文件的比例（0~1）"""
+
+    def __init__(self):
+        self.fraction = 0.0
+
+
+class _CountingFile:
+    """包装二进制文件，统计已读取的字节数"""
+
+    def __init__(self, raw, size: int, progress: Optional[LoadProgress]):
+        self._raw = raw
+        self._size = size
+        self._progress = progress
+        self._read = 0
+
+    def _count(self, data):
+        self._read += len(data)
+        if self._progress is not None and self._size:
+            self._progress.fraction = min(1.0, self._read / self._size)
+        return data
+
+    def read(self, size=-1):
+        return self._count(self._raw.read(size))
+
+    def read1(self, size=-1):
+        return self._count(self._raw.read1(size))
+
+    def readinto(self, buffer):
+        count = self._raw.readinto(buffer)
+        self._count(buffer[:count] if count else b"")
+        return count
+
+    def readable(self):
+        return True
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+def stream_text(url, progress: Optional[LoadProgress] = None) -> Iterator[Document]:
+    """
+    流式文本加载器：按块读取文件，在段落边界处切开，逐块生成文档
+    内存占用与块大小相关，与文件大小无关。
+    :param url: 文件路径
+    :param progress: 加载进度，可选
+    """
+    size = os.path.getsize(url)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    with open(url, "rb") as f:
+        reader = _CountingFile(f, size, progress)
+        while True:
+            block = reader.read(TEXT_STREAM_BLOCK_SIZE)
+            pending += decoder.decode(block, final=not block)
+            if not block:
+                break
+            # 保留最后一个段落分隔符之后的内容，与下一块拼接，避免段落被切断
+            boundary = pending.rfind("\n\n")
+            if boundary > 0:
+                yield Document(page_content=pending[:boundary], metadata={"source": url})
+                pending = pending[boundary + 2:]
+    if pending:
+        yield Document(page_content=pending, metadata={"source": url})
+
+
+def stream_csv(url, progress: Optional[LoadProgress] = None) -> Iterator[Document]:
+    """
+    流式 CSV 加载器：逐行生成文档，内容格式与 CSVLoader 相同（每列一行 "列名: 值"）
+    :param url: 文件路径
+    :param progress: 加载进度，可选
+    """
+    size = os.path.getsize(url)
+    with open(url, "rb") as raw:
+        text = io.TextIOWrapper(_CountingFile(raw, size, progress), encoding="utf-8", newline="")
+        for row_index, row in enumerate(csv.DictReader(text)):
+            content = "\n".join(
+                f"{key.strip() if key is not None else key}: "
+                f"{value.strip() if isinstance(value, str) else ','.join(map(str.strip, value)) if isinstance(value, list) else value}"
+                for key, value in row.items()
+            )
+            yield Document(page_content=content, metadata={"source": url, "row": row_index})
+
+
+def stream_pdf(url, progress: Optional[LoadProgress] = None) -> Iterator[Document]:
+    """
+    流式 PDF 加载器：按页码顺序逐页生成文档，页数较多时由进程池并行提取
+    :param url: 文件路径
+    :param progress: 加载进度，可选
+    """
+    for page_index, total_pages, text in iter_page_texts(url):
+        if progress is not None and total_pages:
+            progress.fraction = min(1.0, (page_index + 1) / total_pages)
+        yield Document(page_content=text, metadata={"source": url, "page": page_index})
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+from utils.ingestion import FINISHED_STATUSES, INGESTION_JOB_TTL, JOB_COMPLETED, JOB_FAILED, JOB_PENDING
+from utils.vectorstore import compact_collection
+
+logging.basicConfig(level=logging.INFO)
+
+# 任务状态（其余状态与导入任务相同）
+JOB_RUNNING = "running"
+
+
+class MaintenanceJob:
+    """单个集合的索引压缩任务"""
+
+    def __init__(self, user_id: int, collection_name: str, db_path: str):
+        self.job_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.collection_name = collection_name
+        self.db_path = db_path
+
+        self.status = JOB_PENDING
+        self.error: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None  # 各索引压缩前后的统计
+
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "collection_name": self.collection_name,
+            "status": self.status,
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+class MaintenanceManager:
+    """
+    索引维护任务管理
+    压缩接口提交任务后立即返回，压缩在后台线程中进行；新文件写完后才在一个事务中切换，
+    压缩期间检索与导入照常进行（写入会等待压缩的写事务结束）。同一集合同时只运行一个压缩任务。
+    """
+
+    def __init__(self, job_ttl: int = INGESTION_JOB_TTL):
+        self.job_ttl = job_ttl
+        self._jobs: Dict[str, MaintenanceJob] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(self, user_id: int, collection_name: str, db_path: str) -> MaintenanceJob:
+        """提交压缩任务（需在事件循环中调用），立即返回"""
+        self._prune()
+        job = MaintenanceJob(user_id, collection_name, db_path)
+        self._jobs[job.job_id] = job
+
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        logging.info(f"索引压缩任务已提交: {job.job_id} ({collection_name})")
+        return job
+
+    def get_job(self, job_id: str, user_id: int) -> Optional[MaintenanceJob]:
+        """获取用户自己的任务，不存在或不属于该用户时返回 None"""
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def list_jobs(self, user_id: int) -> List[MaintenanceJob]:
+        """列出用户的任务，最新的在前"""
+        self._prune()
+        jobs = [job for job in self._jobs.values() if job.user_id == user_id]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def has_active_job(self, user_id: int, collection_name: str) -> bool:
+        """集合是否有尚未结束的压缩任务"""
+        return any(
+            job.user_id == user_id and job.collection_name == collection_name and not job.finished
+            for job in self._jobs.values()
+        )
+
+    def _prune(self):
+        """清理超过保留时间的已结束任务"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.job_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _run(self, job: MaintenanceJob):
+        job.status = JOB_RUNNING
+        try:
+            job.result = await asyncio.to_thread(compact_collection, job.db_path, job.collection_name)
+            job.status = JOB_COMPLETED
+            logging.info(f"索引压缩任务完成: {job.job_id}")
+        except asyncio.CancelledError:
+            job.status = JOB_FAILED
+            job.error = "任务已取消"
+            raise
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(e)
+            logging.error(f"索引压缩任务失败: {job.job_id}，{str(e)}")
+        finally:
+            job.finished_at = time.time()
+
+
+# 全局索引维护任务管理实例
+maintenance_manager = MaintenanceManager()
@@ -0,0 +1,118 @@
+"""
+知识库存储迁移：目录模式 -> 共享模式
+
+把 vector_db 下每个集合目录中的 Chroma 数据（向量、文本与元数据，不重新嵌入）写入共享 Chroma 实例，
+并在共享全文索引中重建对应集合。集合目录中的导入清单与分块配置保留不动。
+迁移完成并把 CHROMA_STORAGE_MODE 设为 shared 后，可以加 --remove-source 删除旧的 Chroma 文件。
+两种模式的开销对比见 benchmarks/bench_storage_mode.py。
+
+用法:
+    python -m utils.migrate_chroma [--dry-run] [--remove-source]
+"""
+
+import argparse
+import logging
+import os
+import shutil
+from typing import Iterator, Tuple
+
+import chromadb
+
+from utils.lexical_index import LEXICAL_INDEX_FILENAME, drop_lexical_indexes, get_lexical_index
+from utils.vectorstore import PERSIST_DIRECTORY, SHARED_CHROMA_PATH, collection_scope, get_scoped_collection
+
+logging.basicConfig(level=logging.INFO)
+
+# Chroma 目录中的数据库文件名
+CHROMA_SQLITE_FILENAME = "chroma.sqlite3"
+
+# 迁移时每次读取/写入的文本块数
+MIGRATION_PAGE_SIZE = 500
+
+
+def find_directory_collections(root: str = PERSIST_DIRECTORY) -> Iterator[Tuple[str, str]]:
+    """
+    查找目录模式的集合
+    :param root: 知识库根目录
+    :return: 生成 (集合目录, 集合名称)
+    """
+    shared_path = os.path.abspath(SHARED_CHROMA_PATH)
+    for dirpath, dirnames, filenames in os.walk(root):
+        if os.path.abspath(dirpath) == shared_path:
+            dirnames[:] = []
+            continue
+        if CHROMA_SQLITE_FILENAME in filenames:
+            # Chroma 目录下的子目录是 HNSW 段文件，不再向下查找
+            dirnames[:] = []
+            client = chromadb.PersistentClient(path=dirpath)
+            for collection in client.list_collections():
+                yield dirpath, getattr(collection, "name", collection)
+
+
+def migrate_collection(db_path: str, collection_name: str, page_size: int = MIGRATION_PAGE_SIZE) -> int:
+    """
+    把一个目录模式的集合复制到共享实例（按ID upsert，重复执行不会产生重复数据）
+    :return: 复制的文本块数
+    """
+    source = chromadb.PersistentClient(path=db_path).get_collection(collection_name)
+    target = get_scoped_collection(db_path, collection_name)
+
+    offset = 0
+    while True:
+        page = source.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        target.upsert(
+            ids=page["ids"],
+            embeddings=page["embeddings"],
+            documents=page["documents"],
+            metadatas=[metadata or {} for metadata in page["metadatas"]]
+        )
+        offset += len(page["ids"])
+
+    # 共享模式下所有集合共用一个全文索引文件，从共享实例重建本集合
+    tenant, scope = collection_scope(db_path, collection_name)
+    get_lexical_index(SHARED_CHROMA_PATH, f"{tenant}/{scope}").rebuild_from(target)
+    return offset
+
+
+def remove_directory_store(db_path: str):
+    """删除集合目录中的 Chroma 数据与全文索引，保留导入清单与分块配置"""
+    drop_lexical_indexes(db_path)
+    for name in os.listdir(db_path):
+        path = os.path.join(db_path, name)
+        if os.path.isdir(path):
+            # HNSW 段目录
+            shutil.rmtree(path)
+        elif name.startswith(CHROMA_SQLITE_FILENAME) or name.startswith(LEXICAL_INDEX_FILENAME):
+            os.remove(path)
+
+
+def migrate(root: str = PERSIST_DIRECTORY, dry_run: bool = False, remove_source: bool = False):
+    """迁移根目录下的全部集合"""
+    migrated = []
+    for db_path, collection_name in find_directory_collections(root):
+        if dry_run:
+            count = chromadb.PersistentClient(path=db_path).get_collection(collection_name).count()
+            logging.info(f"[dry-run] {db_path} ({collection_name}): {count} 个文本块")
+            continue
+        count = migrate_collection(db_path, collection_name)
+        logging.info(f"已迁移 {db_path} ({collection_name}): {count} 个文本块")
+        migrated.append(db_path)
+
+    if remove_source:
+        # 同一目录可能有多个集合，全部迁移完成后再删除
+        for db_path in dict.fromkeys(migrated):
+            remove_directory_store(db_path)
+            logging.info(f"已删除旧存储: {db_path}")
+    logging.info(f"共迁移 {len(migrated)} 个集合")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把目录模式的知识库集合迁移到共享 Chroma 实例")
+    parser.add_argument("--root", default=PERSIST_DIRECTORY, help="知识库根目录")
+    parser.add_argument("--dry-run", action="store_true", help="只列出将要迁移的集合")
+    parser.add_argument("--remove-source", action="store_true", help="迁移后删除集合目录中的 Chroma 数据")
+    args = parser.parse_args()
+
+    migrate(args.root, dry_run=args.dry_run, remove_source=args.remove_source)
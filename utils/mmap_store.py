@@ -0,0 +1,520 @@
+"""
+量化向量的内存映射存储
+
+Chroma 的 HNSW 索引把 float32 向量整体加载到每个工作进程的内存中，进程打开的集合越多占用越大。
+本模块提供另一种向量存储后端（VECTOR_BACKEND=mmap）：
+- 向量归一化后量化为 int8（每行一个缩放系数）或 float16，按行追加写入集合目录下的定长二进制文件；
+- 检索时以只读方式内存映射该文件，用 NumPy 分块矩阵乘法做暴力检索。映射的页属于操作系统页缓存，
+  多个工作进程打开同一集合时共享同一份物理内存，不计入各进程的私有内存；
+- 文本块ID、原文与元数据保存在同目录的 SQLite 中，删除只把缩放系数置 0（墓碑），不移动向量文件。
+对外同时提供 LangChain VectorStore 接口（检索器使用）与 chromadb 集合的 upsert/get/delete/count 接口
+（导入流程、全文索引重建与重排使用），可直接替换 Chroma。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# 加载环境变量
+load_dotenv()
+
+MMAP_VECTOR_DTYPE = os.getenv("MMAP_VECTOR_DTYPE", "int8")  # 量化类型：int8 或 float16
+MMAP_SEARCH_BLOCK_ROWS = int(os.getenv("MMAP_SEARCH_BLOCK_ROWS", "4096"))  # 检索时每次反量化计算的行数
+
+_DTYPES = {"int8": np.int8, "float16": np.float16}
+
+_stores: Dict[Tuple[str, str], "MmapVectorStore"] = {}
+_stores_lock = threading.Lock()
+
+
+def _where_clause(where: Optional[Dict]) -> Tuple[str, List]:
+    """
+    把 chromadb 风格的元数据过滤条件转换为 SQL 条件
+    支持 {键: 值} 等值条件与 {"$and": [...]} 组合
+    """
+    if not where:
+        return "1", []
+    if "$and" in where:
+        clauses, params = [], []
+        for condition in where["$and"]:
+            clause, condition_params = _where_clause(condition)
+            clauses.append(clause)
+            params.extend(condition_params)
+        return " AND ".join(f"({clause})" for clause in clauses), params
+    clauses, params = [], []
+    for key, value in where.items():
+        if key == "source":
+            clauses.append("source = ?")
+        else:
+            clauses.append("json_extract(metadata, ?) = ?")
+            params.append(f'$."{key}"')
+        params.append(value)
+    return " AND ".join(clauses), params
+
+
+class MmapVectorStore(VectorStore):
+    """
+    单个集合的量化向量存储
+    文件：{集合名}.vectors.bin（量化向量，每行 dimension 个元素）、{集合名}.scales.bin（每行的 float32 缩放系数，
+    0 表示已删除）、{集合名}.rows.sqlite3（行号 -> 文本块ID、原文、元数据，以及维度等元信息）。
+    写入在 SQLite 的写事务中进行，事务同时起到跨进程写锁的作用；读取只认已提交的行。
+    压缩时把有效行写入新一代的向量文件（文件名带代号），随行号重排在同一事务中切换代号，之后删除旧文件。
+    """
+
+    def __init__(self, db_path: str, collection_name: str, embedding: Optional[Embeddings] = None,
+                 dtype: str = MMAP_VECTOR_DTYPE):
+        if dtype not in _DTYPES:
+            raise ValueError(f"不支持的量化类型: {dtype}，可选: {', '.join(_DTYPES)}")
+        os.makedirs(db_path, exist_ok=True)
+        self.db_path = db_path
+        self.collection_name = collection_name
+        self._embedding = embedding
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(db_path, f"{collection_name}.rows.sqlite3"), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            "row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, source TEXT, content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rows_source ON rows (source)")
+        # 已有数据的集合沿用创建时的量化类型
+        self.dtype = self._meta("dtype") or dtype
+        self._mapped_rows = 0
+        self._mapped_generation = 0
+        self._vectors: Optional[np.memmap] = None
+        self._scales: Optional[np.memmap] = None
+
+    # ---------- 元信息 ----------
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def dimension(self) -> Optional[int]:
+        value = self._meta("dimension")
+        return int(value) if value else None
+
+    def _committed_rows(self) -> int:
+        """已提交的行数（向量文件中超出这个行数的部分是未提交或中断的写入）"""
+        return int(self._meta("next_row") or 0)
+
+    def _generation(self) -> int:
+        """当前向量文件的代号，每次压缩加 1"""
+        return int(self._meta("generation") or 0)
+
+    def _paths(self, generation: int) -> Tuple[str, str]:
+        """某一代的 (向量文件, 缩放系数文件) 路径"""
+        suffix = "" if generation == 0 else f".{generation}"
+        return (
+            os.path.join(self.db_path, f"{self.collection_name}.vectors{suffix}.bin"),
+            os.path.join(self.db_path, f"{self.collection_name}.scales{suffix}.bin")
+        )
+
+    @property
+    def vectors_path(self) -> str:
+        return self._paths(self._generation())[0]
+
+    @property
+    def scales_path(self) -> str:
+        return self._paths(self._generation())[1]
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding
+
+    # ---------- 量化 ----------
+
+    def _quantize(self, embeddings) -> Tuple[np.ndarray, np.ndarray]:
+        """归一化并量化，返回 (量化向量, 缩放系数)；归一化后点积即余弦相似度"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            # 全零向量的缩放系数取一个极小值，避免与删除标记 0 混淆
+            scales = np.where(scales == 0, np.finfo(np.float32).tiny, scales).astype(np.float32)
+            quantized = np.rint(vectors / scales[:, None]).astype(np.int8)
+        else:
+            scales = np.ones(len(vectors), dtype=np.float32)
+            quantized = vectors.astype(np.float16)
+        return quantized, scales
+
+    def _dequantize(self, rows: List[int]) -> List[List[float]]:
+        self._refresh(self._committed_rows(), self._generation())
+        return [
+            (self._vectors[row].astype(np.float32) * self._scales[row]).tolist()
+            for row in rows
+        ]
+
+    # ---------- chromadb 集合接口 ----------
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]):
+        """按ID写入文本块，已存在的ID覆盖旧内容（旧行置为删除，新行追加到文件末尾）"""
+        if not ids:
+            return
+        # 同一批次中重复的ID只保留最后一个
+        latest = {doc_id: position for position, doc_id in enumerate(ids)}
+        positions = sorted(latest.values())
+        ids = [ids[position] for position in positions]
+        documents = [documents[position] for position in positions]
+        metadatas = [metadatas[position] or {} for position in positions]
+        quantized, scales = self._quantize([embeddings[position] for position in positions])
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                dimension = self.dimension
+                if dimension is None:
+                    dimension = quantized.shape[1]
+                    self._set_meta("dimension", dimension)
+                    self._set_meta("dtype", self.dtype)
+                elif quantized.shape[1] != dimension:
+                    raise ValueError(f"向量维度 {quantized.shape[1]} 与集合维度 {dimension} 不一致")
+
+                stale = self._rows_for_ids(ids)
+                self._delete_rows(stale)
+                generation = self._generation()
+                start = self._committed_rows()
+                self._write_at(self.vectors_path, start * quantized[0].nbytes, quantized.tobytes())
+                self._write_at(self.scales_path, start * 4, scales.tobytes())
+                self._conn.executemany(
+                    "INSERT INTO rows (row, id, source, content, metadata) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (start + offset, doc_id, metadata.get("source"), content,
+                         json.dumps(metadata, ensure_ascii=False))
+                        for offset, (doc_id, content, metadata) in enumerate(zip(ids, documents, metadatas))
+                    ]
+                )
+                self._set_meta("next_row", start + len(ids))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._tombstone(stale, generation)
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None,
+            include: Iterable[str] = ("metadatas", "documents"), limit: Optional[int] = None,
+            offset: Optional[int] = None) -> Dict[str, Any]:
+        """按ID或元数据条件读取文本块，include 中含 embeddings 时返回反量化后的向量"""
+        clause, params = _where_clause(where)
+        if ids is not None:
+            clause += " AND id IN ({})".format(",".join("?" * len(ids)))
+            params = [*params, *ids]
+        sql = f"SELECT row, id, content, metadata FROM rows WHERE {clause} ORDER BY row"
+        if limit is not None or offset is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = [*params, -1 if limit is None else limit, offset or 0]
+        with self._lock:
+            records = self._conn.execute(sql, params).fetchall()
+            include = list(include)
+            result = {
+                "ids": [record[1] for record in records],
+                "documents": [record[2] for record in records] if "documents" in include else None,
+                "metadatas": [json.loads(record[3]) for record in records] if "metadatas" in include else None,
+                "embeddings": self._dequantize([record[0] for record in records]) if "embeddings" in include else None
+            }
+        return result
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, **kwargs) -> Optional[bool]:
+        """按ID或元数据条件删除文本块，都不指定时清空集合"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if ids is not None:
+                    rows = self._rows_for_ids(ids)
+                else:
+                    clause, params = _where_clause(where)
+                    rows = [row[0] for row in self._conn.execute(f"SELECT row FROM rows WHERE {clause}", params)]
+                self._delete_rows(rows)
+                generation = self._generation()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._tombstone(rows, generation)
+        return True
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def _rows_for_ids(self, ids: List[str]) -> List[int]:
+        rows = []
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            rows.extend(row[0] for row in self._conn.execute(
+                "SELECT row FROM rows WHERE id IN ({})".format(",".join("?" * len(batch))), batch
+            ))
+        return rows
+
+    def _delete_rows(self, rows: List[int]):
+        """从 SQLite 中移除行（在写事务中调用，随事务提交或回滚）"""
+        self._conn.executemany("DELETE FROM rows WHERE row = ?", [(row,) for row in rows])
+
+    def _tombstone(self, rows: List[int], generation: int):
+        """
+        事务提交后把已删除行的缩放系数置 0，检索时直接跳过
+        文件写入无法随事务回滚，所以只在提交后进行；未置 0 的旧行检索时也会因不在 SQLite 中被丢弃，
+        写入失败只记录日志。其他进程已压缩时旧一代文件可能已被删除，同样无需处理。
+        """
+        if not rows:
+            return
+        zero = np.zeros(1, dtype=np.float32).tobytes()
+        try:
+            with open(self._paths(generation)[1], "r+b") as f:
+                for row in rows:
+                    f.seek(row * 4)
+                    f.write(zero)
+        except OSError as e:
+            logging.warning(f"删除标记写入失败: {self.db_path} ({self.collection_name})，{str(e)}")
+
+    @staticmethod
+    def _write_at(path: str, position: int, data: bytes):
+        with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+            f.seek(position)
+            f.write(data)
+
+    # ---------- 检索 ----------
+
+    def _refresh(self, rows: int, generation: int):
+        """
+        已提交的行超出当前映射范围（本进程或其他进程写入了新行）或文件已被压缩替换时重新映射文件
+        """
+        if generation == self._mapped_generation and rows <= self._mapped_rows and self._vectors is not None:
+            return
+        dimension = self.dimension
+        if dimension is None or rows == 0:
+            self._vectors = self._scales = None
+            self._mapped_rows = 0
+            return
+        vectors_path, scales_path = self._paths(generation)
+        self._vectors = np.memmap(vectors_path, dtype=_DTYPES[self.dtype], mode="r", shape=(rows, dimension))
+        self._scales = np.memmap(scales_path, dtype=np.float32, mode="r", shape=(rows,))
+        self._mapped_rows = rows
+        self._mapped_generation = generation
+
+    def search_by_vector(self, embedding: List[float], k: int = 4,
+                         filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """
+        暴力检索余弦相似度最高的 k 个文本块
+        :param embedding: 查询向量
+        :param k: 返回数量
+        :param filter: 元数据过滤条件（chromadb 风格）
+        :return: (文档, 余弦相似度) 列表，分数越大越相关
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        with self._lock:
+            rows = self._committed_rows()
+            generation = self._generation()
+            self._refresh(rows, generation)
+            if self._vectors is None or rows == 0:
+                return []
+            vectors, scales = self._vectors, self._scales
+            allowed = None
+            if filter:
+                clause, params = _where_clause(filter)
+                allowed = np.fromiter(
+                    (row[0] for row in self._conn.execute(f"SELECT row FROM rows WHERE {clause}", params)),
+                    dtype=np.int64
+                )
+
+        # 分块反量化后做矩阵乘法，临时内存只与块大小有关
+        scores = np.empty(rows, dtype=np.float32)
+        for start in range(0, rows, MMAP_SEARCH_BLOCK_ROWS):
+            end = min(start + MMAP_SEARCH_BLOCK_ROWS, rows)
+            scores[start:end] = vectors[start:end].astype(np.float32) @ query
+        scores *= scales
+        scores[scales == 0] = -np.inf
+        if allowed is not None:
+            masked = np.full(rows, -np.inf, dtype=np.float32)
+            masked[allowed] = scores[allowed]
+            scores = masked
+
+        k = min(k, rows)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = [int(row) for row in top if np.isfinite(scores[row])]
+        if not top:
+            return []
+
+        with self._lock:
+            if self._generation() != generation:
+                # 检索期间集合被压缩，行号已重排，按新文件重新检索
+                return self.search_by_vector(embedding, k, filter)
+            records = {
+                row: (content, metadata) for row, content, metadata in self._conn.execute(
+                    "SELECT row, content, metadata FROM rows WHERE row IN ({})".format(",".join("?" * len(top))), top
+                )
+            }
+        # 检索期间被其他线程删除的行不再返回
+        return [
+            (Document(page_content=records[row][0], metadata=json.loads(records[row][1])), float(scores[row]))
+            for row in top if row in records
+        ]
+
+    # ---------- LangChain VectorStore 接口 ----------
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        self.upsert(ids, self._embedding.embed_documents(texts), texts, metadatas or [{} for _ in texts])
+        return ids
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict] = None,
+                          **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, filter=filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.search_by_vector(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Dict] = None,
+                                    **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.search_by_vector(embedding, k, filter)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # 分数本身就是余弦相似度
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   *, db_path: str, collection_name: str, ids: Optional[List[str]] = None,
+                   **kwargs: Any) -> "MmapVectorStore":
+        store = cls(db_path, collection_name, embedding)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+    # ---------- 维护 ----------
+
+    def ensure_imported(self, open_collection: Callable[[], Any], page_size: int = 500):
+        """
+        切换到本后端前已用 Chroma 导入的集合，首次打开时把 Chroma 中的向量复制过来（不重新嵌入），只执行一次
+        :param open_collection: 返回 chromadb 集合的函数，集合不存在时抛出异常
+        """
+        with self._lock:
+            if self._meta("imported"):
+                return
+        try:
+            collection = open_collection()
+        except Exception:
+            collection = None
+        copied = 0
+        while collection is not None:
+            page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=copied)
+            if not page["ids"]:
+                break
+            self.upsert(page["ids"], page["embeddings"], page["documents"], page["metadatas"])
+            copied += len(page["ids"])
+        with self._lock:
+            self._set_meta("imported", "1")
+        if copied:
+            logging.info(f"已从 Chroma 导入向量: {self.db_path} ({self.collection_name})，共 {copied} 个文本块")
+
+    def storage_stats(self) -> Dict[str, Any]:
+        """存储统计：总行数、有效行数、已删除行占比与文件大小"""
+        with self._lock:
+            total = self._committed_rows()
+            live = self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+            files = [*self._paths(self._generation()), os.path.join(self.db_path, f"{self.collection_name}.rows.sqlite3")]
+        return {
+            "backend": "mmap",
+            "dtype": self.dtype,
+            "dimension": self.dimension,
+            "rows": total,
+            "live_rows": live,
+            "dead_ratio": round((total - live) / total, 4) if total else 0.0,
+            "bytes": sum(os.path.getsize(path) for path in files if os.path.exists(path))
+        }
+
+    def compact(self) -> Dict[str, Any]:
+        """
+        压缩：只把有效行复制到新一代文件，在一个写事务中重排行号并切换代号，提交后删除旧文件
+        中途失败时旧文件与 SQLite 都保持原样，只留下未使用的新文件，下次压缩时覆盖。
+        :return: 压缩前后的存储统计
+        """
+        before = self.storage_stats()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                generation = self._generation()
+                rows = [row[0] for row in self._conn.execute("SELECT row FROM rows ORDER BY row")]
+                self._refresh(self._committed_rows(), generation)
+                vectors_path, scales_path = self._paths(generation + 1)
+                with open(vectors_path, "wb") as vectors_file, open(scales_path, "wb") as scales_file:
+                    for start in range(0, len(rows), MMAP_SEARCH_BLOCK_ROWS):
+                        block = rows[start:start + MMAP_SEARCH_BLOCK_ROWS]
+                        vectors_file.write(np.ascontiguousarray(self._vectors[block]).tobytes())
+                        scales_file.write(np.ascontiguousarray(self._scales[block]).tobytes())
+                    vectors_file.flush()
+                    os.fsync(vectors_file.fileno())
+                    scales_file.flush()
+                    os.fsync(scales_file.fileno())
+                # 行号升序重排为 0..n-1，新行号不大于旧行号，逐行更新不会冲突
+                self._conn.executemany(
+                    "UPDATE rows SET row = ? WHERE row = ?",
+                    [(new_row, old_row) for new_row, old_row in enumerate(rows) if new_row != old_row]
+                )
+                self._set_meta("next_row", len(rows))
+                self._set_meta("generation", generation + 1)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._vectors = self._scales = None
+            self._mapped_rows = 0
+        for path in self._paths(generation):
+            try:
+                os.remove(path)
+            except OSError:
+                # 其他进程仍映射着旧文件（Windows 下无法删除），保留到下次压缩
+                logging.warning(f"旧向量文件暂时无法删除: {path}")
+        logging.info(f"已压缩向量存储: {self.db_path} ({self.collection_name})，{before['rows']} -> {len(rows)} 行")
+        return {"before": before, "after": self.storage_stats()}
+
+    def close(self):
+        with self._lock:
+            self._vectors = self._scales = None
+            self._mapped_rows = 0
+            self._conn.close()
+
+
+def get_mmap_store(db_path: str, collection_name: str, embedding: Optional[Embeddings] = None) -> MmapVectorStore:
+    """获取集合的量化向量存储（同一集合在进程内共享一个实例）"""
+    key = (os.path.abspath(db_path), collection_name)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = MmapVectorStore(db_path, collection_name, embedding)
+            _stores[key] = store
+        return store
+
+
+def close_mmap_stores(db_path: str):
+    """关闭某个集合目录下的向量存储（删除集合目录前调用）"""
+    prefix = os.path.abspath(db_path)
+    with _stores_lock:
+        for key in [key for key in _stores if key[0] == prefix]:
+            _stores.pop(key).close()
@@ -1,4 +1,5 @@
 import asyncio
+import hashlib
 import os
 import json
 import logging
@@ -9,11 +10,14 @@ from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_mcp_adapters.client import MultiServerMCPClient
 
-from adapter.openai_api import model
+from adapter.openai_api import embeddings, model
 from database.memory_session import get_session_history
 from database.models.mcp import McpTool
+from utils.chunking import token_length
+from utils.semantic_cache import cache_scope, semantic_cache
 from utils.tools.interpreter import Interpreter, getTime
-from utils.tools.retriever import get_retriever_tool
+from utils.tools.retriever import get_retriever_tool, get_federated_retriever_tool, get_hybrid_retriever
+from utils.vectorstore import COLLECTION_NAME
 from utils.tools.code_assistant import (
     code_analyzer,
     code_generator,
@@ -71,8 +75,14 @@ def convert_mcp_config(config: Dict[str, Any]) -> Dict[str, Any]:
     
     return converted
 
-# 默认知识库工具 - 只作为备用
-default_retriever_tool = get_retriever_tool(path="./vector_db/know_db")
+# 默认知识库路径
+DEFAULT_KNOWLEDGE_PATH = "./vector_db/know_db"
+
+# 知识库检索工具名称，只调用了该工具的回答可以写入语义缓存
+KNOWLEDGE_TOOL_NAME = "knowledge_base"
+
+# 语义缓存命中时按片段回放回答，每个片段的字符数
+CACHED_ANSWER_CHUNK_CHARS = 16
 
 # 基础工具集，不包含知识库检索工具
 base_tools = [
@@ -108,6 +118,11 @@ SYSTEM_PROMPT = """你是一个智能代码助手，擅长编程和解决技术
 当需要使用特定领域的知识时，你会调用相应的专家代理来协助处理。
 """
 
+# 系统提示词版本（含模型名称），提示词或模型变化后语义缓存中的旧回答不再命中
+SYSTEM_PROMPT_VERSION = hashlib.sha256(
+    f"{model.model_name}\0{SYSTEM_PROMPT}".encode("utf-8")
+).hexdigest()[:16]
+
 # 专家代理系统提示
 EXPERT_SYSTEM_PROMPT = """你是一个专门的{expertise}专家代理。你的任务是协助主代理解决{expertise}相关的问题。
 请专注于你的专业领域，并提供准确、详细的解答。
@@ -175,27 +190,59 @@ async def load_mcp_tools(mcp_config_path: str = None, user_id: int = None) -> Li
         logging.error(f"加载MCP工具时出错: {e}")
         return []
 
-async def get_multi_agent_executor(user_id=None, collection_name=None, mcp_config_path=None):
+def resolve_knowledge_collections(user_id=None, collection_names=None):
     """
-    获取多代理执行器
+    确定本次对话检索的知识库集合：用户选择的集合中存在的部分，都不存在时为默认知识库
     :param user_id: 用户ID
-    :param collection_name: 知识库集合名称
+    :param collection_names: 知识库集合名称列表
+    :return: (向量数据库路径, 集合名称) 列表
+    """
+    collections = []
+    if user_id and collection_names:
+        # 用户特定知识库路径，只保留存在的集合
+        for collection_name in dict.fromkeys(collection_names):
+            user_kb_path = os.path.join("./vector_db", f"user_{user_id}", collection_name)
+            if os.path.exists(user_kb_path):
+                collections.append((user_kb_path, collection_name))
+    return collections or [(DEFAULT_KNOWLEDGE_PATH, COLLECTION_NAME)]
+
+def get_knowledge_retriever_tool(user_id=None, collection_names=None):
+    """
+    根据用户选择的知识库集合获取检索工具
+    选择多个集合时使用联合检索工具（仍只占用一个工具），都不存在时使用默认知识库
+    :param user_id: 用户ID
+    :param collection_names: 知识库集合名称列表
+    :return: 检索工具
+    """
+    collections = resolve_knowledge_collections(user_id, collection_names)
+    # 默认知识库与用户集合一样每次从检索器池获取，重排配置修改或释放检索器后立即生效
+    if len(collections) == 1:
+        path, collection_name = collections[0]
+        return get_retriever_tool(path=path, collection_name=collection_name)
+    return get_federated_retriever_tool(collections)
+
+def semantic_cache_scope(tools, user_id=None, collection_names=None):
+    """
+    计算语义缓存作用域：本次检索的各集合当前版本 + 系统提示词版本 + 可用工具集
+    用户集合的路径包含用户ID，不同用户的私有知识库互不命中；默认知识库为所有用户共享。
+    可用工具（含用户启用的MCP工具）不同的请求互不命中
+    :param tools: 本次对话的工具列表
+    """
+    collections = [
+        (os.path.abspath(path), collection_name, get_hybrid_retriever(path, collection_name).lexical_index.version())
+        for path, collection_name in resolve_knowledge_collections(user_id, collection_names)
+    ]
+    return cache_scope(SYSTEM_PROMPT_VERSION, collections, [(tool.name, tool.description) for tool in tools])
+
+async def get_agent_tools(user_id=None, collection_names=None, mcp_config_path=None) -> List[Any]:
+    """
+    获取本次对话可用的工具：基础工具、知识库检索工具与MCP工具
+    :param user_id: 用户ID
+    :param collection_names: 知识库集合名称列表
     :param mcp_config_path: MCP配置文件路径
-    :return: 配置好的代理执行器
+    :return: 工具列表
     """
-    # 确定使用的检索工具
-    if user_id and collection_name:
-        # 用户特定知识库路径
-        user_kb_path = os.path.join("./vector_db", f"user_{user_id}", collection_name)
-        if os.path.exists(user_kb_path):
-            # 用户特定知识库存在，使用用户的知识库
-            retriever_tool = get_retriever_tool(path=user_kb_path, collection_name=collection_name)
-        else:
-            # 用户特定知识库不存在，使用默认知识库
-            retriever_tool = default_retriever_tool
-    else:
-        # 没有指定用户ID或集合名称，使用默认知识库
-        retriever_tool = default_retriever_tool
+    retriever_tool = get_knowledge_retriever_tool(user_id, collection_names)
 
     # 合并基础工具
     tools = base_tools + [retriever_tool]
@@ -210,7 +257,14 @@ async def get_multi_agent_executor(user_id=None, collection_name=None, mcp_confi
         mcp_tools = await load_mcp_tools(mcp_config_path)
 
     tools.extend(mcp_tools)
+    return tools
 
+def create_multi_agent_executor(tools):
+    """
+    用给定的工具创建多代理执行器
+    :param tools: 工具列表
+    :return: 配置好的代理执行器
+    """
     # 创建提示模板
     prompt = ChatPromptTemplate.from_messages(
         [
@@ -237,7 +291,22 @@ async def get_multi_agent_executor(user_id=None, collection_name=None, mcp_confi
 
     return agent_executor
 
-async def chat_with_multi_agent_original(msg, session_id, user_id=None, collection_name=None, mcp_config_path=None):
+async def get_multi_agent_executor(user_id=None, collection_name=None, mcp_config_path=None, collection_names=None):
+    """
+    获取多代理执行器
+    :param user_id: 用户ID
+    :param collection_name: 知识库集合名称
+    :param mcp_config_path: MCP配置文件路径
+    :param collection_names: 知识库集合名称列表，指定时同时检索这些集合
+    :return: 配置好的代理执行器
+    """
+    if not collection_names and collection_name:
+        collection_names = [collection_name]
+    tools = await get_agent_tools(user_id, collection_names, mcp_config_path)
+    return create_multi_agent_executor(tools)
+
+async def chat_with_multi_agent_original(msg, session_id, user_id=None, collection_name=None, mcp_config_path=None,
+                                         collection_names=None):
     """
     使用多代理与用户聊天
     :param msg: 用户消息
@@ -245,10 +314,11 @@ async def chat_with_multi_agent_original(msg, session_id, user_id=None, collecti
     :param user_id: 用户ID
     :param collection_name: 知识库集合名称
     :param mcp_config_path: MCP配置文件路径
+    :param collection_names: 知识库集合名称列表，指定时同时检索这些集合
     :return: 代理回复
     """
     # 获取多代理执行器
-    agent_executor = await get_multi_agent_executor(user_id, collection_name, mcp_config_path)
+    agent_executor = await get_multi_agent_executor(user_id, collection_name, mcp_config_path, collection_names)
 
     # 添加聊天历史
     agent_with_chat_history = RunnableWithMessageHistory(
@@ -267,7 +337,8 @@ async def chat_with_multi_agent_original(msg, session_id, user_id=None, collecti
     return res['output']
 
 # 改进的流式版本的聊天函数，利用LangChain的事件系统实现真正的流式输出
-async def stream_chat_with_multi_agent(msg, session_id, user_id=None, collection_name=None, mcp_config_path=None):
+async def stream_chat_with_multi_agent(msg, session_id, user_id=None, collection_name=None, mcp_config_path=None,
+                                       collection_names=None):
     """
     使用多代理与用户聊天（优化的流式版本）
     使用LangChain的事件系统实现真正的字符级流式输出
@@ -276,10 +347,36 @@ async def stream_chat_with_multi_agent(msg, session_id, user_id=None, collection
     :param user_id: 用户ID
     :param collection_name: 知识库集合名称
     :param mcp_config_path: MCP配置文件路径
+    :param collection_names: 知识库集合名称列表，指定时同时检索这些集合
     :yield: 代理回复的流式数据，区分工具调用和模型响应
     """
-    # 获取多代理执行器
-    agent_executor = await get_multi_agent_executor(user_id, collection_name, mcp_config_path)
+    if not collection_names and collection_name:
+        collection_names = [collection_name]
+
+    # 工具集参与语义缓存作用域的计算，先于缓存查找加载
+    tools = await get_agent_tools(user_id, collection_names, mcp_config_path)
+
+    # 语义缓存：首轮提问先在同一作用域内查找相似问题的回答，命中时直接回放，不创建代理执行器
+    cache_entry = None  # (作用域, 问题向量)，本轮回答可以写入缓存时设置
+    history = get_session_history(session_id)
+    if semantic_cache is not None and not history.messages:
+        try:
+            scope = await asyncio.to_thread(semantic_cache_scope, tools, user_id, collection_names)
+            question_vector = await embeddings.aembed_query(msg)
+            cached = semantic_cache.lookup(scope, question_vector)
+        except Exception as e:
+            logging.warning(f"语义缓存查找失败，按正常流程回答: {e}")
+        else:
+            if cached is not None:
+                logging.info(f"语义缓存命中（相似度 {cached.similarity:.3f}）: {msg}")
+                history.add_messages([HumanMessage(content=msg), AIMessage(content=cached.answer)])
+                for start in range(0, len(cached.answer), CACHED_ANSWER_CHUNK_CHARS):
+                    yield f"[MODEL_RESPONSE]{cached.answer[start:start + CACHED_ANSWER_CHUNK_CHARS]}"
+                return
+            cache_entry = (scope, question_vector)
+
+    # 创建多代理执行器
+    agent_executor = create_multi_agent_executor(tools)
 
     # 添加聊天历史
     agent_with_chat_history = RunnableWithMessageHistory(
@@ -293,6 +390,8 @@ async def stream_chat_with_multi_agent(msg, session_id, user_id=None, collection
     tool_calls = []
     streaming_text = ""
     is_streaming_response = False
+    final_answer = ""  # 代理的最终回答
+    used_tokens = 0  # 接口返回的 token 用量
     
     try:
         # 使用LangChain的高级事件API进行更精细的流式控制
@@ -413,12 +512,19 @@ async def stream_chat_with_multi_agent(msg, session_id, user_id=None, collection
                     }
                     yield f"[INTERMEDIATE_START]{json.dumps(intermediate_info)}[INTERMEDIATE_END]"
             
+            elif event_type == "on_chat_model_end":
+                # 记录 token 用量，语义缓存命中时计入节省量
+                usage = getattr(event_data.get("output"), "usage_metadata", None)
+                if usage:
+                    used_tokens += usage.get("total_tokens", 0)
+            
             elif event_type == "on_chain_end":
                 # 链结束，检查是否是agent_executor的最终输出
                 if event_name == "AgentExecutor":
                     output = event_data.get("output", {})
                     if isinstance(output, dict) and "output" in output:
                         final_output = output["output"]
+                        final_answer = final_output
                         # 如果没有通过流式获取到内容，使用最终输出
                         if not streaming_text and final_output:
                             # 实现字符级流式输出
@@ -435,6 +541,17 @@ async def stream_chat_with_multi_agent(msg, session_id, user_id=None, collection
             }
             # 注意：这里不再yield，避免出现在用户消息中
             logging.info(f"工具调用总结: {len(tool_calls)} 个工具被调用")
+        
+        # 首轮提问且只调用了知识库检索（其结果由作用域中的集合版本约束）的回答写入语义缓存
+        if (cache_entry is not None and isinstance(final_answer, str) and final_answer
+                and all(tool_call.get("name") == KNOWLEDGE_TOOL_NAME for tool_call in tool_calls)):
+            if not used_tokens:
+                # 接口未返回用量时按系统提示词、问题、检索结果和回答估算
+                used_tokens = sum(
+                    token_length(text) for text in
+                    [SYSTEM_PROMPT, msg, final_answer] + [str(tool_call.get("output", "")) for tool_call in tool_calls]
+                )
+            semantic_cache.store(cache_entry[0], msg, cache_entry[1], final_answer, used_tokens)
     
     except Exception as e:
         logging.error(f"流式聊天过程中出错: {e}")
@@ -0,0 +1,118 @@
+"""
+PDF 文本并行提取
+
+把页码区间分片交给进程池提取（绕过 GIL），再按页码顺序合并。
+本模块只依赖 pypdf，进程池中的子进程导入它的开销很小。
+"""
+
+import math
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 提取进程数，默认 1（不并行）；多核机器上实测有加速后再调大
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "1"))
+PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", "32"))  # 每个分片的最少页数
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))  # 页数达到该值才并行提取
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    获取指定进程数的进程池（进程常驻复用）
+    使用 spawn 方式启动子进程，避免在多线程的服务进程中 fork 导致死锁。
+    """
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pools[workers] = pool
+        return pool
+
+
+def shutdown_pools():
+    """关闭所有进程池"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+
+
+def count_pages(path: str) -> int:
+    """PDF 总页数"""
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """
+    提取 [start, end) 页的文本（在子进程中执行）
+    :return: 各页文本，顺序与页码一致
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return [reader.pages[index].extract_text() for index in range(start, end)]
+
+
+def iter_page_texts(path: str, workers: Optional[int] = None,
+                    pages_per_shard: int = PDF_PAGES_PER_SHARD) -> Iterator[Tuple[int, int, str]]:
+    """
+    按页码顺序逐页生成文本
+    页数较少或只有一个进程时在当前进程中顺序提取；否则分片提交到进程池，
+    同时在途的分片数不超过进程数的两倍。
+    :param path: PDF 文件路径
+    :param workers: 进程数，默认为 PDF_EXTRACT_WORKERS
+    :param pages_per_shard: 每个分片的最少页数
+    :return: 生成 (页码, 总页数, 文本)，页码从 0 开始
+    """
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    total_pages = count_pages(path)
+
+    if workers <= 1 or total_pages < PDF_PARALLEL_MIN_PAGES:
+        from pypdf import PdfReader
+
+        reader = PdfReader(path)
+        for index in range(total_pages):
+            yield index, total_pages, reader.pages[index].extract_text()
+        return
+
+    # 每个分片都要在子进程中重新打开文件（解析交叉引用表和页树，开销随文件增大），
+    # 分片过小时打开开销会抵消并行收益，因此分片至少覆盖总页数的 1/(4*进程数)
+    shard_size = max(pages_per_shard, math.ceil(total_pages / (workers * 4)))
+    pool = _get_pool(workers)
+    shards = iter([
+        (start, min(start + shard_size, total_pages))
+        for start in range(0, total_pages, shard_size)
+    ])
+    pending = deque()
+
+    def submit_next():
+        shard = next(shards, None)
+        if shard is not None:
+            pending.append((shard[0], pool.submit(extract_page_range, path, *shard)))
+
+    try:
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            start, future = pending.popleft()
+            texts = future.result()
+            submit_next()
+            for offset, text in enumerate(texts):
+                yield start + offset, total_pages, text
+    finally:
+        # 提前停止迭代时取消尚未开始的分片
+        for _, future in pending:
+            future.cancel()
@@ -5,10 +5,13 @@ from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.tools import tool
 
-from adapter.openai_api import model
+from adapter.openai_api import cached_model, model
 
 logging.basicConfig(level=logging.INFO)
 
+# 整套出题使用的模型（提示词固定，命中响应缓存）
+question_model = cached_model("question_generation")
+
 # Python题目生成专家提示
 QUESTION_GENERATOR_PROMPT = """你是一名Python编程教育专家，专门负责生成编程练习题目。
 
@@ -23,6 +26,40 @@ QUESTION_GENERATOR_PROMPT = """你是一名Python编程教育专家，专门负
 
 请直接生成题目，不要使用工具。用中文描述题目。"""
 
+# 各难度等级对应的考察方向
+DIFFICULTY_TOPICS = {
+    1: "基础语法（变量、运算符、简单函数）",
+    2: "字符串或列表操作",
+    3: "循环和条件判断的综合应用",
+    4: "算法思维（递归、排序等）",
+    5: "面向对象或复杂数据结构",
+}
+
+# 按难度小批量生成题目的请求模板
+BATCH_GENERATION_REQUEST = """
+请生成{count}道难度为{difficulty}的Python编程题目，考察方向：{topic}。
+题目之间不要重复，按以下格式返回JSON：
+
+```json
+[
+  {{
+    "title": "题目标题",
+    "description": "详细的题目描述，说明要求实现什么功能",
+    "difficulty": {difficulty},
+    "example_input": "示例输入",
+    "example_output": "示例输出",
+    "template_code": "包含空函数模板和基本测试的Python代码，函数体只有pass，不要提供实现"
+  }}
+]
+```
+
+重要要求：
+1. template_code中的函数体必须只包含 pass 语句，绝对不要提供实现代码
+2. 不要在任何地方暴露答案的实现思路或逻辑
+3. 确保所有代码都是语法正确的Python代码
+4. 尽量选择新颖的题目，避免“数字相加”“字符串反转”这类常见题
+"""
+
 @tool
 def validate_python_code(code: str) -> Dict[str, Any]:
     """验证Python代码的语法正确性"""
@@ -93,13 +130,13 @@ if __name__ == "__main__":
 """
         
         try:
-            # 直接使用模型生成
+            # 直接使用模型生成；提示词固定，缓存保留期内复用同一套题目
             messages = [
                 {"role": "system", "content": QUESTION_GENERATOR_PROMPT},
                 {"role": "user", "content": generation_request}
             ]
             
-            response = model.invoke(messages)
+            response = question_model.invoke(messages)
             agent_output = response.content if hasattr(response, 'content') else str(response)
             
             # 解析JSON结果
@@ -125,6 +162,47 @@ if __name__ == "__main__":
             # 返回备用题目
             return self._get_fallback_questions()
     
+    async def generate_question_batch(self, difficulty: int, count: int) -> List[Dict[str, Any]]:
+        """
+        按指定难度小批量生成题目（供题库后台补充使用）
+        
+        Args:
+            difficulty: 难度等级 1-5
+            count: 本批生成数量
+            
+        Returns:
+            通过验证的题目列表，生成失败时返回空列表
+        """
+        generation_request = BATCH_GENERATION_REQUEST.format(
+            count=count,
+            difficulty=difficulty,
+            topic=DIFFICULTY_TOPICS.get(difficulty, DIFFICULTY_TOPICS[1])
+        )
+        
+        try:
+            messages = [
+                {"role": "system", "content": QUESTION_GENERATOR_PROMPT},
+                {"role": "user", "content": generation_request}
+            ]
+            
+            response = await model.ainvoke(messages)
+            agent_output = response.content if hasattr(response, 'content') else str(response)
+            
+            validated_questions = []
+            for question in self._parse_questions(agent_output):
+                if self._validate_question(question):
+                    # 以请求的难度为准，避免模型标注错误
+                    question["difficulty"] = difficulty
+                    validated_questions.append(question)
+                else:
+                    logging.warning(f"题目验证失败: {question.get('title', 'Unknown')}")
+            
+            return validated_questions[:count]
+            
+        except Exception as e:
+            logging.error(f"难度{difficulty}题目批量生成出错: {e}")
+            return []
+    
     def _parse_questions(self, agent_output: str) -> List[Dict[str, Any]]:
         """解析智能体输出的题目"""
         try:
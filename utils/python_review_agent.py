@@ -1,17 +1,22 @@
 import asyncio
 import json
 import logging
+import os
+from collections import Counter
 from typing import Dict, List, Any, Optional
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage
 
-from adapter.openai_api import model
+from adapter.openai_api import cached_model, model
 from utils.tools.python_tester import execute_python_code, run_python_tests
 from utils.tools.code_reviewer import code_quality_check, security_review, best_practices_advisor
 
 logging.basicConfig(level=logging.INFO)
 
+# 代码审查使用的模型（相同题目与代码的重复审查命中响应缓存）
+review_model = cached_model("code_review")
+
 # Python代码审查专家提示
 PYTHON_EXPERT_PROMPT = """你是一名资深的Python开发专家，专门负责代码审查和技能评估。你的任务是：
 
@@ -36,6 +41,34 @@ PYTHON_EXPERT_PROMPT = """你是一名资深的Python开发专家，专门负责
 5. 推荐的学习资源或方向
 """
 
+# 会话报告的输出要求（单次模式和汇总模式共用）
+SESSION_REPORT_REQUIREMENTS = """
+1. 总体技能水平评估（入门/初级/中级/高级）
+2. 各难度等级的表现分析
+3. 编程能力强项和弱项
+4. 学习建议和改进方向
+5. 推荐的进阶学习路径
+
+请用JSON格式返回结果，包含：
+- overall_skill_level: 总体技能等级
+- skill_score: 综合技能分数(0-100)
+- difficulty_performance: 各难度表现分析
+- strengths: 编程强项
+- improvement_areas: 需改进领域  
+- learning_path: 推荐学习路径
+- detailed_feedback: 详细反馈
+"""
+
+# 会话报告配置
+SESSION_REPORT_MODE = os.getenv("SESSION_REPORT_MODE", "map_reduce")  # map_reduce 或 single
+SESSION_REPORT_CONCURRENCY = int(os.getenv("SESSION_REPORT_CONCURRENCY", "4"))  # 逐题摘要的并发上限
+SESSION_REPORT_MAX_CHARS = int(os.getenv("SESSION_REPORT_MAX_CHARS", "6000"))  # 汇总请求中所有摘要的总长度上限
+# 单题摘要至少保留的长度，题目多到均分后不足这个长度时，超出部分不再逐题列出而是按难度汇总
+SESSION_REPORT_SUMMARY_MIN_CHARS = int(os.getenv("SESSION_REPORT_SUMMARY_MIN_CHARS", "300"))
+SUMMARY_TITLE_MAX_CHARS = 60  # 摘要标题行中题目名称的长度上限，保证标题行完整
+AGGREGATE_LINE_MAX_CHARS = 200  # 按难度汇总时每行的长度上限
+SUMMARY_CODE_MAX_CHARS = 4000  # 单题摘要请求中代码的长度上限
+
 class PythonCodeReviewAgent:
     """Python代码审查智能体"""
     
@@ -96,16 +129,14 @@ class PythonCodeReviewAgent:
 """
         
         try:
-            # 直接调用模型，不使用复杂的agent executor
-            from adapter.openai_api import model
-            
+            # 直接调用模型，不使用复杂的agent executor；相同代码的重复审查命中响应缓存
             messages = [
                 {"role": "system", "content": PYTHON_EXPERT_PROMPT},
                 {"role": "user", "content": review_request}
             ]
             
             # 使用模型直接生成回复
-            response = model.invoke(messages)
+            response = review_model.invoke(messages)
             agent_output = response.content if hasattr(response, 'content') else str(response)
             
             # 解析结果
@@ -116,24 +147,34 @@ class PythonCodeReviewAgent:
             # 返回基础分析作为备用
             return self._basic_analysis(user_code, test_results, question_difficulty)
     
-    async def generate_session_report(self, session_data: List[Dict]) -> Dict[str, Any]:
+    async def generate_session_report(self, session_data: List[Dict], mode: Optional[str] = None) -> Dict[str, Any]:
         """
         生成整个测试会话的综合报告
         
         Args:
             session_data: 会话数据，包含所有题目的提交信息
+            mode: 报告模式，map_reduce（逐题并发摘要后汇总）或 single（单次请求），
+                  默认读取环境变量 SESSION_REPORT_MODE
             
         Returns:
             综合报告
         """
+        mode = mode or SESSION_REPORT_MODE
+        if mode == "single":
+            return await self._generate_single_pass_report(session_data)
+        return await self._generate_map_reduce_report(session_data)
+    
+    async def _generate_single_pass_report(self, session_data: List[Dict]) -> Dict[str, Any]:
+        """单次请求生成会话报告"""
         # 构建会话报告请求
         session_summary = []
         for i, submission in enumerate(session_data, 1):
+            code_lines = len(submission.get('user_code', '').split('\n'))
             session_summary.append(f"""
 题目 {i}: {submission.get('question_title', f'题目{i}')}
 - 难度: {submission.get('difficulty', 'unknown')}/5
 - 测试通过: {submission.get('test_passed', 0)}/{submission.get('test_total', 0)}
-- 代码长度: {len(submission.get('user_code', '').split('\n'))} 行
+- 代码长度: {code_lines} 行
 """)
         
         report_request = f"""
@@ -148,22 +189,7 @@ class PythonCodeReviewAgent:
 
 **详细代码分析：**
 请分析每道题目的代码质量和实现方式，然后给出：
-
-1. 总体技能水平评估（入门/初级/中级/高级）
-2. 各难度等级的表现分析
-3. 编程能力强项和弱项
-4. 学习建议和改进方向
-5. 推荐的进阶学习路径
-
-请用JSON格式返回结果，包含：
-- overall_skill_level: 总体技能等级
-- skill_score: 综合技能分数(0-100)
-- difficulty_performance: 各难度表现分析
-- strengths: 编程强项
-- improvement_areas: 需改进领域  
-- learning_path: 推荐学习路径
-- detailed_feedback: 详细反馈
-"""
+{SESSION_REPORT_REQUIREMENTS}"""
         
         try:
             # 直接使用模型生成，避免复杂的智能体调用
@@ -172,7 +198,7 @@ class PythonCodeReviewAgent:
                 {"role": "user", "content": report_request}
             ]
             
-            response = model.invoke(messages)
+            response = await model.ainvoke(messages)
             agent_output = response.content if hasattr(response, 'content') else str(response)
             
             # 解析结果
@@ -183,6 +209,163 @@ class PythonCodeReviewAgent:
             # 返回基础报告作为备用
             return self._basic_session_report(session_data)
     
+    async def _generate_map_reduce_report(self, session_data: List[Dict]) -> Dict[str, Any]:
+        """
+        map-reduce 模式生成会话报告：
+        先并发为每道题生成简短摘要（已有审查结果的直接复用），再用一次小请求汇总。
+        汇总请求只包含摘要，摘要总长度不超过 SESSION_REPORT_MAX_CHARS，与代码长度无关。
+        每道题的摘要至少保留 SESSION_REPORT_SUMMARY_MIN_CHARS 个字符：题目较少时全部逐题列出；
+        题目多于预算能容纳的数量时，按难度轮流选出部分题目逐题列出，其余题目按难度汇总为
+        题数、通过数、平均分与常见不足各一行，这些题目不再调用模型生成摘要。
+        """
+        semaphore = asyncio.Semaphore(SESSION_REPORT_CONCURRENCY)
+        
+        # 选出逐题列出的题目，其余按难度汇总
+        numbered = list(enumerate(session_data, 1))
+        max_items = max(1, SESSION_REPORT_MAX_CHARS // SESSION_REPORT_SUMMARY_MIN_CHARS)
+        aggregated = ""
+        if len(numbered) > max_items:
+            difficulties = {submission.get('difficulty', 'unknown') for submission in session_data}
+            reserved = len(difficulties) * (AGGREGATE_LINE_MAX_CHARS + 1)
+            max_items = max(1, (SESSION_REPORT_MAX_CHARS - reserved) // SESSION_REPORT_SUMMARY_MIN_CHARS)
+            numbered, rest = self._select_individual(numbered, max_items)
+            aggregated = self._aggregate_submissions(rest)
+        
+        # map：逐题摘要
+        summaries = await asyncio.gather(*[
+            self._summarize_submission(semaphore, i, submission)
+            for i, submission in numbered
+        ])
+        
+        # 扣除汇总部分与换行后，按剩余预算均分每道题摘要的长度，总长度不超过预算
+        budget = SESSION_REPORT_MAX_CHARS - (len(aggregated) + 1 if aggregated else 0) - (len(summaries) - 1)
+        per_item_chars = max(budget // max(len(summaries), 1), 0)
+        summaries = [summary[:per_item_chars] for summary in summaries]
+        if aggregated:
+            summaries.append(aggregated)
+        
+        # 题目分布按难度计数，长度不随题目数量增长
+        difficulty_counts = Counter(submission.get('difficulty', 'unknown') for submission in session_data)
+        
+        # reduce：汇总生成报告
+        report_request = f"""
+请基于以下Python测试会话中各题目的评估摘要生成综合技能评估报告：
+
+**会话概览：**
+- 总题目数：{len(session_data)}
+- 题目分布：{', '.join([f"难度{difficulty} {number}题" for difficulty, number in sorted(difficulty_counts.items(), key=lambda item: str(item[0]))])}
+
+**各题目评估摘要：**
+{chr(10).join(summaries)}
+
+请综合以上摘要给出：
+{SESSION_REPORT_REQUIREMENTS}"""
+        
+        try:
+            messages = [
+                {"role": "system", "content": PYTHON_EXPERT_PROMPT},
+                {"role": "user", "content": report_request}
+            ]
+            
+            response = await model.ainvoke(messages)
+            agent_output = response.content if hasattr(response, 'content') else str(response)
+            
+            return self._parse_session_report(agent_output, session_data)
+            
+        except Exception as e:
+            logging.error(f"汇总会话报告出错: {e}")
+            return self._basic_session_report(session_data)
+    
+    @staticmethod
+    def _select_individual(numbered: List, max_items: int):
+        """
+        按难度轮流选出至多 max_items 道逐题列出的题目，保证各难度都有代表
+        :param numbered: (题号, 提交数据) 列表
+        :return: (逐题列出的题目, 其余题目)，均保持原顺序
+        """
+        groups: Dict[Any, List] = {}
+        for item in numbered:
+            groups.setdefault(item[1].get('difficulty', 'unknown'), []).append(item)
+        queues = [iter(group) for _, group in sorted(groups.items(), key=lambda pair: str(pair[0]))]
+        selected = set()
+        while len(selected) < max_items and queues:
+            for queue in list(queues):
+                item = next(queue, None)
+                if item is None:
+                    queues.remove(queue)
+                elif len(selected) < max_items:
+                    selected.add(item[0])
+        return (
+            [item for item in numbered if item[0] in selected],
+            [item for item in numbered if item[0] not in selected]
+        )
+    
+    @staticmethod
+    def _aggregate_submissions(numbered: List) -> str:
+        """把未逐题列出的题目按难度汇总，每个难度一行：题数、通过数、平均分与出现最多的不足"""
+        groups: Dict[Any, List[Dict]] = {}
+        for _, submission in numbered:
+            groups.setdefault(submission.get('difficulty', 'unknown'), []).append(submission)
+        lines = []
+        for difficulty, submissions in sorted(groups.items(), key=lambda pair: str(pair[0])):
+            passed = sum(1 for submission in submissions if submission.get('passed'))
+            average = sum(submission.get('score', 0) for submission in submissions) / len(submissions)
+            weaknesses = Counter(
+                str(weakness)
+                for submission in submissions
+                for weakness in ((submission.get('review_result') or {}).get('weaknesses') or [])
+            )
+            common = '；'.join(weakness for weakness, _ in weaknesses.most_common(3)) or '无'
+            line = (
+                f"其余难度 {difficulty}/5 的 {len(submissions)} 题：通过 {passed} 题，"
+                f"平均得分 {average:.0f}；常见不足: {common}"
+            )
+            lines.append(line[:AGGREGATE_LINE_MAX_CHARS])
+        return "\n".join(lines)
+    
+    async def _summarize_submission(self, semaphore: asyncio.Semaphore, index: int, submission: Dict) -> str:
+        """为单道题生成摘要，优先复用提交时已保存的审查结果"""
+        title = str(submission.get('question_title', f'题目{index}'))
+        if len(title) > SUMMARY_TITLE_MAX_CHARS:
+            title = title[:SUMMARY_TITLE_MAX_CHARS - 1] + "…"
+        header = (
+            f"题目 {index}: {title}"
+            f"（难度 {submission.get('difficulty', 'unknown')}/5，"
+            f"得分 {submission.get('score', 0):.0f}，{'通过' if submission.get('passed') else '未通过'}）"
+        )
+        
+        review = submission.get('review_result') or {}
+        if review.get('skill_level') or review.get('strengths') or review.get('weaknesses'):
+            return "\n".join([
+                header,
+                f"- 技能等级: {review.get('skill_level', '未知')}",
+                f"- 优点: {'；'.join(map(str, review.get('strengths', [])[:3])) or '无'}",
+                f"- 不足: {'；'.join(map(str, review.get('weaknesses', [])[:3])) or '无'}",
+            ])
+        
+        # 没有可复用的审查结果时才调用模型，代码长度有上限
+        summary_request = f"""
+请用不超过100字概括以下Python代码的质量、体现的技能等级（入门/初级/中级/高级）和主要不足：
+
+题目：{submission.get('question_title', '')}
+代码：
+```python
+{submission.get('user_code', '')[:SUMMARY_CODE_MAX_CHARS]}
+```
+"""
+        try:
+            async with semaphore:
+                messages = [
+                    {"role": "system", "content": PYTHON_EXPERT_PROMPT},
+                    {"role": "user", "content": summary_request}
+                ]
+                response = await model.ainvoke(messages)
+            summary = response.content if hasattr(response, 'content') else str(response)
+            return f"{header}\n- 摘要: {summary.strip()}"
+        except Exception as e:
+            logging.error(f"生成题目摘要出错: {e}")
+            return header
+    
     def _parse_review_result(self, agent_output: str, test_results: Dict) -> Dict[str, Any]:
         """解析智能体输出的审查结果"""
         try:
@@ -0,0 +1,415 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+from typing import Dict, List, Any, Optional, Set
+
+from peewee import fn
+from dotenv import load_dotenv
+
+from database.models.python_test import PythonQuestion
+from utils.python_question_generator import question_generator, DIFFICULTY_TOPICS
+
+logging.basicConfig(level=logging.INFO)
+
+# 加载环境变量
+load_dotenv()
+
+# 题库配置
+QUESTION_BANK_TARGET_PER_LEVEL = int(os.getenv("QUESTION_BANK_TARGET_PER_LEVEL", "10"))  # 每个难度的目标库存
+QUESTION_BANK_BATCH_SIZE = int(os.getenv("QUESTION_BANK_BATCH_SIZE", "2"))  # 单次LLM调用生成的题目数
+QUESTION_BANK_CONCURRENCY = int(os.getenv("QUESTION_BANK_CONCURRENCY", "3"))  # 并发LLM调用上限
+QUESTION_BANK_REFILL_INTERVAL = int(os.getenv("QUESTION_BANK_REFILL_INTERVAL", "600"))  # 定期巡检间隔（秒）
+
+DIFFICULTY_LEVELS = sorted(DIFFICULTY_TOPICS.keys())
+
+
+def normalize_title(title: str) -> str:
+    """规范化题目标题：忽略大小写、空白和标点"""
+    return re.sub(r'[\W_]+', '', (title or '').lower())
+
+
+def normalize_template(template_code: str) -> str:
+    """规范化模板代码：去掉注释和所有空白，只保留代码骨架"""
+    code = re.sub(r'#.*?$', '', template_code or '', flags=re.MULTILINE)
+    return re.sub(r'\s+', '', code)
+
+
+def _digest(text: str) -> Optional[str]:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest() if text else None
+
+
+class _IdPool:
+    """支持 O(1) 增删和无放回随机抽样的ID集合（数组 + 位置索引，删除时与末尾交换）"""
+
+    def __init__(self):
+        self._ids: List[int] = []
+        self._positions: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, item_id: int):
+        if item_id in self._positions:
+            return
+        self._positions[item_id] = len(self._ids)
+        self._ids.append(item_id)
+
+    def remove(self, item_id: int):
+        position = self._positions.pop(item_id, None)
+        if position is None:
+            return
+        last_id = self._ids.pop()
+        if position < len(self._ids):
+            self._ids[position] = last_id
+            self._positions[last_id] = position
+
+    def sample(self, k: int, exclude: Set[int]) -> List[int]:
+        """
+        无放回抽取至多k个不在exclude中的ID
+        k 远小于可选数量时用拒绝采样，耗时只与k和exclude的大小相关；
+        k 接近可选数量时拒绝采样会反复抽中已选的ID，改为对可选ID列表直接 random.sample
+        """
+        available = len(self._ids) - sum(1 for item_id in exclude if item_id in self._positions)
+        k = min(k, available)
+        if k * 2 > available:
+            return random.sample([item_id for item_id in self._ids if item_id not in exclude], k)
+        picked: List[int] = []
+        seen: Set[int] = set()
+        while len(picked) < k:
+            item_id = self._ids[random.randrange(len(self._ids))]
+            if item_id in seen or item_id in exclude:
+                continue
+            seen.add(item_id)
+            picked.append(item_id)
+        return picked
+
+
+class QuestionIndex:
+    """
+    有效题目ID的内存索引，按难度分组
+    题目入库/下线时同步更新，创建测试会话时无需扫描题目表即可随机选题。
+    索引只反映本进程的修改，其他工作进程下线的题目由 QuestionBank.sample_questions 在抽题后校验发现。
+    """
+
+    def __init__(self):
+        self._by_difficulty: Dict[int, _IdPool] = {}
+        self._all = _IdPool()
+        self._loaded = False
+        # 抽题与重建可能在不同线程中进行
+        self._lock = threading.Lock()
+
+    def load(self):
+        """从数据库重建索引（只查询 id 和 difficulty 两列，会扫描题目表，在事件循环中需放到线程里调用）"""
+        by_difficulty: Dict[int, _IdPool] = {}
+        all_ids = _IdPool()
+        query = (PythonQuestion
+                 .select(PythonQuestion.id, PythonQuestion.difficulty)
+                 .where(PythonQuestion.is_active == True)
+                 .tuples())
+        for question_id, difficulty in query:
+            by_difficulty.setdefault(difficulty, _IdPool()).add(question_id)
+            all_ids.add(question_id)
+        with self._lock:
+            self._by_difficulty = by_difficulty
+            self._all = all_ids
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def add(self, question_id: int, difficulty: int):
+        self._ensure_loaded()
+        with self._lock:
+            self._by_difficulty.setdefault(difficulty, _IdPool()).add(question_id)
+            self._all.add(question_id)
+
+    def remove(self, question_id: int, difficulty: int):
+        self._ensure_loaded()
+        with self._lock:
+            pool = self._by_difficulty.get(difficulty)
+            if pool is not None:
+                pool.remove(question_id)
+            self._all.remove(question_id)
+
+    def clear(self):
+        with self._lock:
+            self._by_difficulty = {}
+            self._all = _IdPool()
+            self._loaded = True
+
+    def sample(self, difficulty_distribution: List[int]) -> List[int]:
+        """
+        按难度分布无放回抽题，某难度题目不足时从全部题目中随机补足
+        :param difficulty_distribution: 每道题的难度，如 [1, 2, 2, 3, 4]
+        :return: 题目ID列表
+        """
+        self._ensure_loaded()
+        with self._lock:
+            return self._sample(difficulty_distribution)
+
+    def _sample(self, difficulty_distribution: List[int]) -> List[int]:
+        total = len(difficulty_distribution)
+
+        # 每个难度一次性抽取所需数量，保证同难度题目不重复
+        needed: Dict[int, int] = {}
+        for difficulty in difficulty_distribution:
+            needed[difficulty] = needed.get(difficulty, 0) + 1
+        picked_by_difficulty = {
+            difficulty: self._by_difficulty[difficulty].sample(count, set())
+            if difficulty in self._by_difficulty else []
+            for difficulty, count in needed.items()
+        }
+
+        selected: List[int] = []
+        for difficulty in difficulty_distribution:
+            if picked_by_difficulty[difficulty]:
+                selected.append(picked_by_difficulty[difficulty].pop())
+
+        if len(selected) < total:
+            # 如果某些难度的题目不够，随机补充
+            selected.extend(self._all.sample(total - len(selected), set(selected)))
+
+        return selected
+
+
+class QuestionBank:
+    """
+    Python题库服务
+    为每个难度维护目标库存，由后台任务以小批量并发调用LLM补充，
+    并按规范化后的标题/模板哈希去重。创建测试会话只读取现有题库，不等待生成。
+    """
+
+    def __init__(self,
+                 target_per_level: int = QUESTION_BANK_TARGET_PER_LEVEL,
+                 batch_size: int = QUESTION_BANK_BATCH_SIZE,
+                 concurrency: int = QUESTION_BANK_CONCURRENCY,
+                 refill_interval: int = QUESTION_BANK_REFILL_INTERVAL):
+        self.target_per_level = target_per_level
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.refill_interval = refill_interval
+
+        self._title_hashes: Set[str] = set()
+        self._template_hashes: Set[str] = set()
+        self._fingerprints_loaded = False
+
+        self.index = QuestionIndex()
+
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._refill_lock: Optional[asyncio.Lock] = None
+
+    # ---------- 库存与去重 ----------
+
+    def inventory(self) -> Dict[int, int]:
+        """统计各难度的有效题目数量"""
+        counts = {level: 0 for level in DIFFICULTY_LEVELS}
+        query = (PythonQuestion
+                 .select(PythonQuestion.difficulty, fn.COUNT(PythonQuestion.id).alias('count'))
+                 .where(PythonQuestion.is_active == True)
+                 .group_by(PythonQuestion.difficulty))
+        for row in query:
+            counts[row.difficulty] = row.count
+        return counts
+
+    def deficits(self) -> Dict[int, int]:
+        """计算各难度距离目标库存的缺口"""
+        return {
+            level: self.target_per_level - count
+            for level, count in self.inventory().items()
+            if level in DIFFICULTY_TOPICS and count < self.target_per_level
+        }
+
+    def _load_fingerprints(self):
+        """从数据库加载现有有效题目的指纹"""
+        if self._fingerprints_loaded:
+            return
+        query = (PythonQuestion
+                 .select(PythonQuestion.title, PythonQuestion.template_code)
+                 .where(PythonQuestion.is_active == True))
+        for question in query:
+            self._remember(question.title, question.template_code)
+        self._fingerprints_loaded = True
+
+    def _remember(self, title: str, template_code: str):
+        title_hash = _digest(normalize_title(title))
+        template_hash = _digest(normalize_template(template_code))
+        if title_hash:
+            self._title_hashes.add(title_hash)
+        if template_hash:
+            self._template_hashes.add(template_hash)
+
+    def is_duplicate(self, question: Dict[str, Any]) -> bool:
+        """标题或模板规范化后与已有题目相同即视为重复"""
+        self._load_fingerprints()
+        title_hash = _digest(normalize_title(question.get("title", "")))
+        template_hash = _digest(normalize_template(question.get("template_code", "")))
+        return (title_hash in self._title_hashes) or (template_hash in self._template_hashes)
+
+    def add_questions(self, questions: List[Dict[str, Any]]) -> List[PythonQuestion]:
+        """
+        去重后将题目写入数据库
+        :param questions: 题目数据列表
+        :return: 实际创建的题目
+        """
+        created = []
+        for question_data in questions:
+            if self.is_duplicate(question_data):
+                logging.info(f"跳过重复题目: {question_data.get('title')}")
+                continue
+            try:
+                question = PythonQuestion.create(
+                    title=question_data.get("title", "未命名题目"),
+                    description=question_data.get("description", ""),
+                    difficulty=question_data.get("difficulty", 1),
+                    example_input=question_data.get("example_input", ""),
+                    example_output=question_data.get("example_output", ""),
+                    test_cases=json.dumps(question_data.get("test_cases", []), ensure_ascii=False),
+                    template_code=question_data.get("template_code", "")
+                )
+            except Exception as e:
+                logging.error(f"保存题目失败: {e}")
+                continue
+            self._remember(question.title, question.template_code)
+            self.index.add(question.id, question.difficulty)
+            created.append(question)
+        return created
+
+    def seed_fallback_questions(self) -> List[PythonQuestion]:
+        """写入内置备用题目，保证题库为空时也能立即开始测试"""
+        return self.add_questions(question_generator._get_fallback_questions())
+
+    def deactivate_all(self) -> int:
+        """下线所有题目（软删除，保留历史提交的关联）"""
+        count = PythonQuestion.update(is_active=False).where(PythonQuestion.is_active == True).execute()
+        self._title_hashes.clear()
+        self._template_hashes.clear()
+        self._fingerprints_loaded = False
+        self.index.clear()
+        return count
+
+    def deactivate_question(self, question_id: int) -> bool:
+        """下线单道题目并从索引中移除"""
+        question = PythonQuestion.get_or_none(PythonQuestion.id == question_id)
+        if question is None or not question.is_active:
+            return False
+        PythonQuestion.update(is_active=False).where(PythonQuestion.id == question_id).execute()
+        self.index.remove(question.id, question.difficulty)
+        # 指纹集合只增不减，下次加载时再按有效题目重建
+        self._fingerprints_loaded = False
+        self._title_hashes.clear()
+        self._template_hashes.clear()
+        return True
+
+    def _sample_active(self, difficulty_distribution: List[int]) -> List[int]:
+        """
+        从索引抽题，并用一次 id IN (...) 查询确认抽中的题目仍然有效
+        其他工作进程下线题目（如重新生成题库）后本进程的索引会过期，发现抽中已下线的题目时重建索引再抽一次
+        """
+        selected = self.index.sample(difficulty_distribution)
+        if not selected:
+            return selected
+        active = {
+            question_id for (question_id,) in PythonQuestion
+            .select(PythonQuestion.id)
+            .where(PythonQuestion.id.in_(selected) & (PythonQuestion.is_active == True))
+            .tuples()
+        }
+        if len(active) == len(selected):
+            return selected
+        logging.info(f"题目索引已过期（{len(selected) - len(active)} 道题目已下线），重建索引")
+        self.index.load()
+        return self.index.sample(difficulty_distribution)
+
+    async def sample_questions(self, difficulty_distribution: List[int]) -> List[int]:
+        """按难度分布从题库中随机抽题（数据库查询在线程中执行）"""
+        return await asyncio.to_thread(self._sample_active, difficulty_distribution)
+
+    # ---------- 后台补充 ----------
+
+    async def _generate_batch(self, semaphore: asyncio.Semaphore, difficulty: int, count: int) -> List[Dict[str, Any]]:
+        async with semaphore:
+            return await question_generator.generate_question_batch(difficulty, count)
+
+    async def replenish(self) -> int:
+        """
+        按缺口并发生成题目并入库
+        :return: 本轮新增题目数量
+        """
+        if self._refill_lock is None:
+            self._refill_lock = asyncio.Lock()
+
+        async with self._refill_lock:
+            deficits = self.deficits()
+            if not deficits:
+                return 0
+
+            logging.info(f"题库补充开始，各难度缺口: {deficits}")
+            semaphore = asyncio.Semaphore(self.concurrency)
+            batches = []
+            for difficulty, missing in deficits.items():
+                while missing > 0:
+                    count = min(self.batch_size, missing)
+                    batches.append(self._generate_batch(semaphore, difficulty, count))
+                    missing -= count
+
+            results = await asyncio.gather(*batches, return_exceptions=True)
+
+            created_count = 0
+            for result in results:
+                if isinstance(result, Exception):
+                    logging.error(f"题目批次生成失败: {result}")
+                    continue
+                created_count += len(self.add_questions(result))
+
+            logging.info(f"题库补充完成，新增 {created_count} 道题目")
+            return created_count
+
+    async def _run(self):
+        while True:
+            try:
+                # 定期重建索引，同步其他工作进程对题库的修改
+                await asyncio.to_thread(self.index.load)
+                await self.replenish()
+            except Exception as e:
+                logging.exception(f"题库补充出错: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        """启动后台补充任务（需在事件循环中调用）"""
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logging.info("题库后台补充任务已启动")
+
+    def request_replenish(self):
+        """唤醒后台任务立即检查库存，不等待生成完成"""
+        self.start()
+        self._wakeup.set()
+
+    async def stop(self):
+        """停止后台补充任务"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+# 全局实例
+question_bank = QuestionBank()
@@ -0,0 +1,254 @@
+"""
+检索结果重排与压缩
+
+在混合检索之后、放入提示词之前，对候选文本块重新打分，去掉近似重复的文本块，并按 token 预算截取：
+- 相关性 = 查询向量与文本块向量的余弦相似度 + 查询词覆盖率（词法重合度）。文本块向量直接读取
+  Chroma 中导入时已存好的嵌入，查询向量来自查询向量缓存；关键词快速路径没有查询向量时，用原排名代替；
+- 有查询向量时，相关性低于最佳候选一定比例的文本块丢弃；
+- 按 MMR（最大边际相关）依次选取，兼顾相关性与和已选文本块的差异，与已选文本块过于相似的直接丢弃；
+- 选中文本块的 token 总数不超过预算。
+不需要交叉编码器或额外的模型调用。配置按集合保存在集合目录下。
+
+离线评估见 benchmarks/bench_rerank.py（合成数据，或指定评估用例与集合）。
+"""
+
+import json
+import logging
+import math
+import os
+from typing import Dict, List, Optional, Sequence
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from utils.chunking import token_length
+from utils.lexical_index import analyze
+
+# 加载环境变量
+load_dotenv()
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"  # 新集合默认是否启用重排
+RERANK_TOKEN_BUDGET = int(os.getenv("RERANK_TOKEN_BUDGET", "1200"))  # 返回文本块的 token 总数上限
+RERANK_MMR_LAMBDA = float(os.getenv("RERANK_MMR_LAMBDA", "0.7"))  # MMR 中相关性的权重，越小越偏向多样性
+RERANK_DUPLICATE_THRESHOLD = float(os.getenv("RERANK_DUPLICATE_THRESHOLD", "0.95"))  # 视为近似重复的相似度
+RERANK_LEXICAL_WEIGHT = float(os.getenv("RERANK_LEXICAL_WEIGHT", "0.3"))  # 相关性中词法重合度的权重
+RERANK_MIN_SCORE_RATIO = float(os.getenv("RERANK_MIN_SCORE_RATIO", "0.5"))  # 相关性低于最高分的该比例时丢弃
+RERANK_CANDIDATE_FACTOR = int(os.getenv("RERANK_CANDIDATE_FACTOR", "2"))  # 启用重排时召回 k 的几倍作为候选
+
+# 集合目录下保存重排配置的文件名
+RERANK_CONFIG_FILENAME = "rerank.json"
+
+
+class RerankConfig:
+    """集合的重排配置"""
+
+    def __init__(
+        self,
+        enabled: bool = RERANK_ENABLED,
+        token_budget: int = RERANK_TOKEN_BUDGET,
+        mmr_lambda: float = RERANK_MMR_LAMBDA,
+        duplicate_threshold: float = RERANK_DUPLICATE_THRESHOLD,
+        lexical_weight: float = RERANK_LEXICAL_WEIGHT,
+        min_score_ratio: float = RERANK_MIN_SCORE_RATIO
+    ):
+        if token_budget <= 0:
+            raise ValueError("token_budget 必须大于 0")
+        if not 0 <= mmr_lambda <= 1:
+            raise ValueError("mmr_lambda 必须在 0 到 1 之间")
+        if not 0 < duplicate_threshold <= 1:
+            raise ValueError("duplicate_threshold 必须大于 0 且不超过 1")
+        if not 0 <= lexical_weight <= 1:
+            raise ValueError("lexical_weight 必须在 0 到 1 之间")
+        if not 0 <= min_score_ratio <= 1:
+            raise ValueError("min_score_ratio 必须在 0 到 1 之间")
+        self.enabled = bool(enabled)
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.lexical_weight = lexical_weight
+        self.min_score_ratio = min_score_ratio
+
+    def updated(self, **changes) -> "RerankConfig":
+        """返回覆盖了指定字段（值不为 None）的新配置"""
+        data = self.to_dict()
+        data.update({key: value for key, value in changes.items() if value is not None})
+        return RerankConfig.from_dict(data)
+
+    def to_dict(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "token_budget": self.token_budget,
+            "mmr_lambda": self.mmr_lambda,
+            "duplicate_threshold": self.duplicate_threshold,
+            "lexical_weight": self.lexical_weight,
+            "min_score_ratio": self.min_score_ratio
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RerankConfig":
+        return cls(
+            enabled=data.get("enabled", RERANK_ENABLED),
+            token_budget=data.get("token_budget", RERANK_TOKEN_BUDGET),
+            mmr_lambda=data.get("mmr_lambda", RERANK_MMR_LAMBDA),
+            duplicate_threshold=data.get("duplicate_threshold", RERANK_DUPLICATE_THRESHOLD),
+            lexical_weight=data.get("lexical_weight", RERANK_LEXICAL_WEIGHT),
+            min_score_ratio=data.get("min_score_ratio", RERANK_MIN_SCORE_RATIO)
+        )
+
+
+def load_rerank_config(db_path: str) -> RerankConfig:
+    """读取集合的重排配置，不存在时使用默认配置"""
+    config_path = os.path.join(db_path, RERANK_CONFIG_FILENAME)
+    if not os.path.exists(config_path):
+        return RerankConfig()
+    with open(config_path, "r", encoding="utf-8") as f:
+        return RerankConfig.from_dict(json.load(f))
+
+
+def save_rerank_config(db_path: str, config: RerankConfig):
+    """保存集合的重排配置"""
+    os.makedirs(db_path, exist_ok=True)
+    config_path = os.path.join(db_path, RERANK_CONFIG_FILENAME)
+    temp_path = f"{config_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(config.to_dict(), f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, config_path)
+
+
+def _normalize(vector: Optional[Sequence[float]]) -> Optional[List[float]]:
+    """归一化为单位向量，之后点积即余弦相似度"""
+    if vector is None:
+        return None
+    values = [float(value) for value in vector]
+    norm = math.sqrt(sum(value * value for value in values))
+    return [value / norm for value in values] if norm else None
+
+
+def _dot(left: List[float], right: List[float]) -> float:
+    return sum(a * b for a, b in zip(left, right))
+
+
+def _jaccard(left: set, right: set) -> float:
+    return len(left & right) / len(left | right) if left or right else 1.0
+
+
+class Reranker:
+    """
+    单个集合的重排器
+    文本块向量按ID从集合中读取（与导入时的确定性ID一致），读取失败的文本块改用词集合的 Jaccard 相似度判断重复。
+    """
+
+    def __init__(self, config: RerankConfig, collection=None):
+        """
+        :param config: 重排配置
+        :param collection: chromadb 集合对象（或 ScopedCollection、MmapVectorStore），用于读取文本块向量
+        """
+        self.config = config
+        self.collection = collection
+
+    def _chunk_embeddings(self, ids: List[str]) -> Dict[str, List[float]]:
+        """读取文本块导入时保存的向量"""
+        if self.collection is None or not ids:
+            return {}
+        try:
+            result = self.collection.get(ids=ids, include=["embeddings"])
+        except Exception as e:
+            logging.warning(f"读取文本块向量失败，按词法相似度去重: {str(e)}")
+            return {}
+        embeddings = result.get("embeddings")
+        if embeddings is None:
+            return {}
+        return {doc_id: _normalize(vector) for doc_id, vector in zip(result["ids"], embeddings)}
+
+    def rerank(
+        self,
+        query: str,
+        documents: List[Document],
+        ids: List[str],
+        k: int,
+        query_embedding: Optional[Sequence[float]] = None
+    ) -> List[Document]:
+        """
+        重排并压缩候选文本块
+        :param query: 查询文本
+        :param documents: 按检索排名排列的候选文本块
+        :param ids: 候选文本块的ID
+        :param k: 最多返回的文本块数
+        :param query_embedding: 查询向量，没有时相关性中的向量部分用原排名代替
+        :return: 选中的文本块，metadata["rerank_score"] 为重排分数
+        """
+        if not documents:
+            return []
+        config = self.config
+        query_terms = set(analyze(query))
+        chunk_terms = [set(analyze(document.page_content)) for document in documents]
+        vectors = self._chunk_embeddings(ids)
+        chunk_vectors = [vectors.get(doc_id) for doc_id in ids]
+        query_vector = _normalize(query_embedding)
+
+        relevance = []
+        for rank, (terms, vector) in enumerate(zip(chunk_terms, chunk_vectors)):
+            overlap = len(query_terms & terms) / len(query_terms) if query_terms else 0.0
+            if query_vector is not None and vector is not None:
+                semantic = _dot(query_vector, vector)
+            else:
+                semantic = 1.0 - rank / len(documents)
+            relevance.append((1 - config.lexical_weight) * semantic + config.lexical_weight * overlap)
+
+        def similarity(left: int, right: int) -> float:
+            if chunk_vectors[left] is not None and chunk_vectors[right] is not None:
+                return _dot(chunk_vectors[left], chunk_vectors[right])
+            return _jaccard(chunk_terms[left], chunk_terms[right])
+
+        # 相关性明显低于最佳候选的文本块不放入提示词；没有查询向量时相关性主要来自原排名，不按比例截断
+        cutoff = max(relevance) * config.min_score_ratio if query_vector is not None else float("-inf")
+        tokens = [token_length(document.page_content) for document in documents]
+        selected: List[int] = []
+        max_similarity = [0.0] * len(documents)
+        remaining = {i for i in range(len(documents)) if relevance[i] >= cutoff}
+        used_tokens = 0
+        while remaining and len(selected) < k:
+            best = max(
+                remaining,
+                key=lambda i: (config.mmr_lambda * relevance[i] - (1 - config.mmr_lambda) * max_similarity[i], -i)
+            )
+            remaining.discard(best)
+            if max_similarity[best] >= config.duplicate_threshold:
+                continue
+            # 超出预算的文本块跳过，继续尝试更短的候选；至少保留一个文本块
+            if selected and used_tokens + tokens[best] > config.token_budget:
+                continue
+            documents[best].metadata["rerank_score"] = round(relevance[best], 6)
+            selected.append(best)
+            used_tokens += tokens[best]
+            for i in remaining:
+                max_similarity[i] = max(max_similarity[i], similarity(best, i))
+
+        logging.debug(
+            f"重排 {len(documents)} 个候选，选中 {len(selected)} 个，共 {used_tokens} tokens: {query}"
+        )
+        return [documents[i] for i in selected]
+
+
+def evaluate(retriever, cases: List[Dict]) -> Dict:
+    """
+    离线评估检索质量与 token 数
+    :param retriever: 检索器（任何支持 invoke(query) 的对象）
+    :param cases: 评估用例，每个包含 query 与 expected（应被检索到的内容片段或来源文件名列表）
+    :return: 召回率（期望内容被检索到的比例）、平均文本块数与平均 token 数
+    """
+    found = expected = chunks = tokens = 0
+    for case in cases:
+        documents = retriever.invoke(case["query"])
+        chunks += len(documents)
+        tokens += sum(token_length(document.page_content) for document in documents)
+        for item in case["expected"]:
+            expected += 1
+            if any(item in document.page_content or item == document.metadata.get("source")
+                   for document in documents):
+                found += 1
+    return {
+        "recall": round(found / expected, 4) if expected else None,
+        "avg_chunks": round(chunks / len(cases), 2) if cases else 0,
+        "avg_tokens": round(tokens / len(cases), 1) if cases else 0
+    }
@@ -0,0 +1,84 @@
+"""
+知识库检索结果缓存
+
+按 (集合, 集合版本, 规范化查询哈希, 检索参数) 缓存检索结果。集合每次写入都会更新版本，
+旧版本的结果不会再被命中，过期条目随 LRU 淘汰。
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from adapter.embedding_cache import normalize_text
+
+# 加载环境变量
+load_dotenv()
+
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))  # 缓存的检索结果条数
+RETRIEVAL_CACHE_TTL = int(os.getenv("RETRIEVAL_CACHE_TTL", "600"))  # 单条结果的最长保留时间（秒）
+
+
+def query_hash(query: str) -> str:
+    """规范化查询文本后计算哈希，仅空白不同的查询共享缓存"""
+    return hashlib.sha256(normalize_text(query).encode("utf-8")).hexdigest()
+
+
+class RetrievalCache:
+    """进程内 LRU 检索结果缓存，条目带过期时间"""
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_SIZE, ttl: int = RETRIEVAL_CACHE_TTL):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple, Tuple[float, List[Document]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[List[Document]]:
+        """命中时返回结果副本，调用方修改文档不会影响缓存"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            documents = entry[1]
+        return [Document(page_content=doc.page_content, metadata=dict(doc.metadata)) for doc in documents]
+
+    def put(self, key: Tuple, documents: List[Document]):
+        stored = [Document(page_content=doc.page_content, metadata=dict(doc.metadata)) for doc in documents]
+        with self._lock:
+            self._entries[key] = (time.time(), stored)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """缓存统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+# 全局检索结果缓存实例，未启用时为 None
+retrieval_cache = RetrievalCache() if RETRIEVAL_CACHE_ENABLED else None
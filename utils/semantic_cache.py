@@ -0,0 +1,195 @@
+"""
+聊天语义缓存
+
+缓存首轮、未调用知识库检索以外工具的问题的回答。新问题嵌入后，在同一作用域
+（所用知识库集合的版本 + 系统提示词版本 + 可用工具集）内查找最相似的已缓存问题，相似度不低于阈值时直接返回其回答。
+集合每次写入都会更新版本，知识库变化后旧回答不会再被命中，过期条目随 LRU 淘汰。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from adapter.embedding_cache import normalize_text
+
+# 加载环境变量
+load_dotenv()
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))  # 命中所需的最低余弦相似度
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2000"))  # 缓存的回答条数
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "86400"))  # 单条回答的最长保留时间（秒）
+
+
+def cache_scope(prompt_version: str, collections: Sequence[Tuple[str, str, str]],
+                tools: Sequence[Tuple[str, str]] = ()) -> str:
+    """
+    计算缓存作用域
+    :param prompt_version: 系统提示词版本
+    :param collections: (集合路径, 集合名称, 集合版本) 列表
+    :param tools: 本次对话可用的 (工具名称, 工具描述) 列表，工具集不同的请求互不命中
+    :return: 作用域标识
+    """
+    payload = json.dumps(
+        {
+            "prompt": prompt_version,
+            "collections": sorted(list(item) for item in collections),
+            "tools": sorted(list(item) for item in tools)
+        },
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CachedAnswer:
+    """缓存的回答"""
+
+    def __init__(self, question: str, answer: str, tokens: int, similarity: float = 1.0):
+        self.question = question
+        self.answer = answer
+        self.tokens = tokens  # 生成该回答消耗的 token 数，命中时计入节省量
+        self.similarity = similarity
+
+
+class SemanticCache:
+    """
+    进程内语义缓存
+    条目按 (作用域, 规范化问题) 去重并按 LRU 淘汰；每个作用域的问题向量组成矩阵，查找时一次矩阵乘法。
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries: int = SEMANTIC_CACHE_SIZE,
+                 ttl: int = SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        # (作用域, 问题哈希) -> (写入时间, 单位化的问题向量, 回答)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, np.ndarray, CachedAnswer]]" = OrderedDict()
+        # 作用域 -> (条目键列表, 向量矩阵, 写入时间数组)，条目变化时置空，下次查找时重建；
+        # 作用域的最后一个条目被移除时连同键一起删除，过期的集合版本不会留下空作用域
+        self._matrices: Dict[str, Optional[Tuple[List[Tuple[str, str]], np.ndarray, np.ndarray]]] = {}
+        self._scope_sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.saved_tokens = 0
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm > 0 else array
+
+    def _matrix(self, scope: str) -> Optional[Tuple[List[Tuple[str, str]], np.ndarray, np.ndarray]]:
+        if scope not in self._scope_sizes:
+            return None
+        matrix = self._matrices.get(scope)
+        if matrix is None:
+            keys = [key for key in self._entries if key[0] == scope]
+            matrix = (
+                keys,
+                np.stack([self._entries[key][1] for key in keys]),
+                np.array([self._entries[key][0] for key in keys], dtype=np.float64)
+            )
+            self._matrices[scope] = matrix
+        return matrix
+
+    def _add(self, key: Tuple[str, str], entry: Tuple[float, np.ndarray, CachedAnswer]):
+        self._entries[key] = entry
+        self._scope_sizes[key[0]] = self._scope_sizes.get(key[0], 0) + 1
+        self._matrices[key[0]] = None
+
+    def _remove(self, key: Tuple[str, str]):
+        del self._entries[key]
+        scope = key[0]
+        self._scope_sizes[scope] -= 1
+        if self._scope_sizes[scope]:
+            self._matrices[scope] = None
+        else:
+            del self._scope_sizes[scope]
+            self._matrices.pop(scope, None)
+
+    def _live_matrix(self, scope: str) -> Optional[Tuple[List[Tuple[str, str]], np.ndarray, np.ndarray]]:
+        """作用域的向量矩阵，先移除已过期的条目，过期条目不会遮住次相似的有效条目"""
+        matrix = self._matrix(scope)
+        if matrix is None:
+            return None
+        keys, _, created_at = matrix
+        expired = np.flatnonzero(time.time() - created_at > self.ttl)
+        if not len(expired):
+            return matrix
+        for index in expired:
+            self._remove(keys[index])
+        return self._matrix(scope)
+
+    def lookup(self, scope: str, vector: Sequence[float]) -> Optional[CachedAnswer]:
+        """
+        查找作用域内与问题向量最相似的回答
+        :return: 相似度不低于阈值的回答，否则返回 None
+        """
+        query = self._unit(vector)
+        with self._lock:
+            matrix = self._live_matrix(scope)
+            best = None
+            if matrix is not None:
+                keys, vectors, _ = matrix
+                similarities = vectors @ query
+                index = int(np.argmax(similarities))
+                if similarities[index] >= self.threshold:
+                    best = keys[index], float(similarities[index])
+
+            if best is None:
+                self.misses += 1
+                return None
+            key, similarity = best
+            answer = self._entries[key][2]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_tokens += answer.tokens
+        return CachedAnswer(answer.question, answer.answer, answer.tokens, similarity)
+
+    def store(self, scope: str, question: str, vector: Sequence[float], answer: str, tokens: int):
+        """写入回答，同一作用域内规范化后相同的问题只保留最新的回答"""
+        key = (scope, hashlib.sha256(normalize_text(question).encode("utf-8")).hexdigest())
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._add(key, (time.time(), self._unit(vector), CachedAnswer(question, answer, tokens)))
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+            self._scope_sizes.clear()
+
+    def stats(self) -> Dict:
+        """缓存统计：命中率与命中回答累计节省的 token 数"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "scopes": len(self._scope_sizes),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "saved_tokens": self.saved_tokens
+            }
+
+
+# 全局语义缓存实例，未启用时为 None
+semantic_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
@@ -0,0 +1,303 @@
+"""
+代码分析引擎
+
+同一段代码只解析一次：一次 ast.parse 加一次遍历收集所有工具需要的结构信息，
+结果按代码哈希缓存。code_assistant 与 code_reviewer 中的工具都是基于同一份
+分析结果生成的视图，代理连续调用多个工具时不会重复解析。
+
+分析是增量的：代码按顶层定义切分为代码块，每个代码块按内容哈希单独缓存分析结果，
+整段代码的结果由各代码块的结果合并而成。用户反复修改同一个文件时，只有改动过的
+代码块需要重新解析。
+"""
+
+import ast
+import copy
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+# 分析结果缓存的最大条目数
+CODE_ANALYSIS_CACHE_SIZE = int(os.getenv("CODE_ANALYSIS_CACHE_SIZE", "128"))
+# 代码块分析结果缓存的最大条目数
+CODE_BLOCK_CACHE_SIZE = int(os.getenv("CODE_BLOCK_CACHE_SIZE", "2048"))
+
+# 顶层语句的起始行：顶格、不是注释、不是闭合括号，也不是 else/elif/except/finally 等续行子句
+_BLOCK_START = re.compile(r'^(?=[^\s#)\]}])(?!(?:else|elif|except|finally)\b)', re.MULTILINE)
+# 注释与字符串字面量，用于找出跨行的三引号字符串，避免在字符串内部切分
+_STRING_OR_COMMENT = re.compile(
+    r'#[^\n]*|"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+)
+
+
+def _has_docstring(node: ast.AST) -> bool:
+    """判断函数或类的第一条语句是否为文档字符串"""
+    return (
+        bool(node.body)
+        and isinstance(node.body[0], ast.Expr)
+        and isinstance(node.body[0].value, ast.Constant)
+        and isinstance(node.body[0].value.value, str)
+    )
+
+
+def _walk(tree: ast.AST) -> Iterator[Tuple[ast.AST, int]]:
+    """与 ast.walk 相同的广度优先遍历，同时给出节点深度"""
+    todo = deque([(tree, 0)])
+    while todo:
+        node, depth = todo.popleft()
+        todo.extend((child, depth + 1) for child in ast.iter_child_nodes(node))
+        yield node, depth
+
+
+def split_blocks(code: str) -> List[Tuple[int, int, str]]:
+    """
+    按顶层语句把代码切分为连续的代码块
+    装饰器与被装饰的定义归入同一块，顶格注释归入前一块，跨行的三引号字符串内部不切分。
+    切分只看文本，切在括号内部时对应代码块无法单独解析，由调用方回退到整体解析。
+    :param code: 代码字符串
+    :return: [(起始行偏移, 起始字符偏移, 代码块文本)]，各块以换行连接即为原代码
+    """
+    multiline_strings = [
+        match.span() for match in _STRING_OR_COMMENT.finditer(code)
+        if '\n' in match.group(0)
+    ]
+    string_index = 0
+
+    starts = [0]
+    in_decorator = False
+    for match in _BLOCK_START.finditer(code):
+        position = match.start()
+        while string_index < len(multiline_strings) and multiline_strings[string_index][1] <= position:
+            string_index += 1
+        if string_index < len(multiline_strings) and multiline_strings[string_index][0] < position:
+            continue
+        is_decorator = code.startswith('@', position)
+        if position and not in_decorator:
+            starts.append(position)
+        in_decorator = is_decorator
+
+    blocks = []
+    line_offset = 0
+    for index, start in enumerate(starts):
+        end = starts[index + 1] - 1 if index + 1 < len(starts) else len(code)
+        text = code[start:end]
+        blocks.append((line_offset, start, text))
+        line_offset += text.count('\n') + 1
+    return blocks
+
+
+class CodeAnalysis:
+    """
+    单段代码的分析结果
+    构造时完成解析和遍历，各工具通过 view() 获取按需计算并缓存的视图。
+    """
+
+    def __init__(self, code: str, incremental: bool = True):
+        self.code = code
+        self.lines = code.split('\n')
+
+        # 结构信息（code_analyzer）
+        self.functions: List[Dict[str, Any]] = []
+        self.classes: List[Dict[str, Any]] = []
+        self.imports: List[str] = []
+        self.variables: List[Dict[str, Any]] = []
+
+        # 文档信息（code_documentation）
+        self.doc_functions: List[Dict[str, Any]] = []
+        self.doc_classes: List[Dict[str, Any]] = []
+
+        # 依赖信息（dependency_analyzer）
+        self.import_packages: List[str] = []
+
+        self.error: Optional[str] = None
+
+        # 代码块：[(起始行偏移, 起始字符偏移, 代码块分析结果)]，未切分时只有自身
+        self.blocks: List[Tuple[int, int, "CodeAnalysis"]] = [(0, 0, self)]
+
+        # 遍历记录：(节点深度, 结果列表名, 条目)，按 ast.walk 的顺序排列
+        self._entries: List[Tuple[int, str, Any]] = []
+
+        self._views: Dict[Hashable, Any] = {}
+        self._views_lock = threading.RLock()
+
+        self._analyze(incremental)
+        for _, attribute, entry in self._entries:
+            getattr(self, attribute).append(entry)
+
+    def _analyze(self, incremental: bool):
+        if incremental:
+            blocks = split_blocks(self.code)
+            if len(blocks) > 1:
+                self.blocks = [
+                    (line_offset, char_offset, _analyze_block(text))
+                    for line_offset, char_offset, text in blocks
+                ]
+                if all(block.error is None for _, _, block in self.blocks):
+                    self._merge_blocks()
+                    return
+
+        # 未切分或某个代码块无法单独解析（如切在多行字符串内部），整体解析
+        try:
+            tree = ast.parse(self.code)
+            for node, depth in _walk(tree):
+                self._visit(node, depth)
+        except Exception as e:
+            self.error = str(e)
+
+    def _merge_blocks(self):
+        """
+        合并各代码块的遍历记录
+        整体遍历是广度优先的，同一深度内按代码块先后排列，
+        因此按 (深度, 代码块序号, 块内顺序) 排序即可还原整体解析的结果顺序。
+        """
+        merged = []
+        for index, (line_offset, _, block) in enumerate(self.blocks):
+            for order, (depth, attribute, entry) in enumerate(block._entries):
+                if line_offset and isinstance(entry, dict) and "lineno" in entry:
+                    entry = dict(entry, lineno=entry["lineno"] + line_offset)
+                merged.append(((depth, index, order), attribute, entry))
+        merged.sort(key=lambda item: item[0])
+        self._entries = [(key[0], attribute, entry) for key, attribute, entry in merged]
+
+    def _visit(self, node: ast.AST, depth: int):
+        """处理单个节点，一次遍历收集所有工具需要的信息"""
+        def record(attribute: str, entry: Any):
+            self._entries.append((depth, attribute, entry))
+
+        if isinstance(node, ast.Import):
+            for name in node.names:
+                record("imports", name.name)
+                record("import_packages", name.name.split('.')[0])
+
+        elif isinstance(node, ast.ImportFrom):
+            for name in node.names:
+                record("imports", f"{node.module}.{name.name}")
+            if node.module:
+                record("import_packages", node.module.split('.')[0])
+
+        elif isinstance(node, ast.FunctionDef):
+            args = [arg.arg for arg in node.args.args]
+            record("functions", {
+                "name": node.name,
+                "args": args,
+                "decorators": [ast.unparse(decorator) for decorator in node.decorator_list],
+                "lineno": node.lineno
+            })
+            record("doc_functions", {
+                "name": node.name,
+                "args": args,
+                "has_docstring": _has_docstring(node)
+            })
+
+        elif isinstance(node, ast.ClassDef):
+            methods = []
+            doc_methods = []
+            for item in node.body:
+                if isinstance(item, ast.FunctionDef):
+                    args = [arg.arg for arg in item.args.args]
+                    methods.append({
+                        "name": item.name,
+                        "args": args,
+                        "decorators": [ast.unparse(decorator) for decorator in item.decorator_list]
+                    })
+                    doc_methods.append({
+                        "name": item.name,
+                        "args": args,
+                        "has_docstring": _has_docstring(item)
+                    })
+
+            record("classes", {
+                "name": node.name,
+                "bases": [ast.unparse(base) for base in node.bases],
+                "methods": methods,
+                "lineno": node.lineno
+            })
+            record("doc_classes", {
+                "name": node.name,
+                "methods": doc_methods,
+                "has_docstring": _has_docstring(node)
+            })
+
+        elif isinstance(node, ast.Assign) and all(isinstance(target, ast.Name) for target in node.targets):
+            for target in node.targets:
+                record("variables", {
+                    "name": target.id,
+                    "value": ast.unparse(node.value),
+                    "lineno": node.lineno
+                })
+
+    def view(self, key: Hashable, build: Callable[["CodeAnalysis"], Any]) -> Any:
+        """
+        获取基于本分析结果的视图，首次访问时计算并缓存
+        :param key: 视图标识，如 "structure" 或 ("quality", "python")
+        :param build: 计算视图的函数
+        :return: 视图的副本，调用方修改不会影响缓存
+        """
+        return copy.deepcopy(self.memo(key, build))
+
+    def memo(self, key: Hashable, build: Callable[["CodeAnalysis"], Any]) -> Any:
+        """
+        与 view() 相同但不复制，用于视图之间共享的只读中间结果（如规则扫描结果）
+        :param key: 结果标识
+        :param build: 计算结果的函数
+        :return: 缓存的结果本身，调用方不得修改
+        """
+        with self._views_lock:
+            if key not in self._views:
+                self._views[key] = build(self)
+            return self._views[key]
+
+
+_cache: "OrderedDict[str, CodeAnalysis]" = OrderedDict()
+_block_cache: "OrderedDict[str, CodeAnalysis]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def code_hash(code: str) -> str:
+    """计算代码内容哈希，作为缓存键"""
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+
+def _get_or_create(cache: "OrderedDict[str, CodeAnalysis]", size: int, code: str,
+                   factory: Callable[[str], CodeAnalysis]) -> CodeAnalysis:
+    """按内容哈希从 LRU 缓存中获取分析结果，未命中时创建"""
+    key = code_hash(code)
+    with _cache_lock:
+        analysis = cache.get(key)
+        if analysis is not None:
+            cache.move_to_end(key)
+            return analysis
+
+    analysis = factory(code)
+
+    with _cache_lock:
+        cache[key] = analysis
+        while len(cache) > size:
+            cache.popitem(last=False)
+    return analysis
+
+
+def _analyze_block(code: str) -> CodeAnalysis:
+    """获取单个代码块的分析结果，内容未变的代码块直接复用"""
+    return _get_or_create(
+        _block_cache, CODE_BLOCK_CACHE_SIZE, code,
+        lambda text: CodeAnalysis(text, incremental=False)
+    )
+
+
+def analyze_code(code: str) -> CodeAnalysis:
+    """
+    获取代码的分析结果，相同内容的代码只分析一次
+    :param code: 代码字符串
+    :return: CodeAnalysis 实例
+    """
+    return _get_or_create(_cache, CODE_ANALYSIS_CACHE_SIZE, code, CodeAnalysis)
+
+
+def clear_analysis_cache():
+    """清空分析结果缓存（包括代码块缓存）"""
+    with _cache_lock:
+        _cache.clear()
+        _block_cache.clear()
@@ -1,23 +1,51 @@
 import logging
-import re
 from typing import Dict, List, Optional
 from langchain_core.tools import tool
 
+from utils.tools.code_analysis import CodeAnalysis, analyze_code
+from utils.tools.review_rules import ALL, PRESENCE, RuleMatch, RuleScanner, get_scanner
+
 logging.basicConfig(level=logging.INFO)
 
-@tool
-def code_quality_check(code: str, language: str = "python") -> Dict:
+def _scan_rules(analysis: CodeAnalysis, language: str) -> Dict[str, List[RuleMatch]]:
+    """获取代码的规则扫描结果，三个审查工具共享同一次扫描"""
+    scanner = get_scanner(language)
+    if scanner is None:
+        return {}
+    return analysis.memo(("rules", scanner.language), lambda analysis: _scan_with_blocks(analysis, scanner))
+
+def _scan_with_blocks(analysis: CodeAnalysis, scanner: RuleScanner) -> Dict[str, List[RuleMatch]]:
     """
-    检查代码质量，并提供改进建议。
-    
-    Args:
-        code: 要检查的代码
-        language: 编程语言，默认为 python
-        
-    Returns:
-        Dict: 包含代码质量评估结果和改进建议
+    按行检查的规则在各代码块上扫描并复用未改动代码块的结果，
+    可能跨越代码块的全文检查在整段代码上扫描
     """
-    logging.info(f"Tool: code_quality_check - 检查{language}代码质量")
+    results = scanner.scan(analysis.code, PRESENCE)
+    for line_offset, char_offset, block in analysis.blocks:
+        block_results = block.memo(
+            ("rules", scanner.language, ALL),
+            lambda block: scanner.scan(block.code, ALL)
+        )
+        for name, matches in block_results.items():
+            results.setdefault(name, []).extend(
+                RuleMatch(match.line + line_offset, match.start + char_offset, match.text, match.groups)
+                for match in matches
+            )
+    return results
+
+def _long_lines(analysis: CodeAnalysis) -> List[int]:
+    """超过100个字符的行号，按代码块缓存"""
+    long_lines = []
+    for line_offset, _, block in analysis.blocks:
+        block_lines = block.memo(
+            "long_lines",
+            lambda block: [i + 1 for i, line in enumerate(block.lines) if len(line.strip()) > 100]
+        )
+        long_lines.extend(line + line_offset for line in block_lines)
+    return long_lines
+
+def _check_quality(analysis: CodeAnalysis, language: str) -> Dict:
+    """检查代码质量（基于分析结果的视图）"""
+    matches = _scan_rules(analysis, language)
     
     result = {
         "issues": [],
@@ -27,56 +55,52 @@ def code_quality_check(code: str, language: str = "python") -> Dict:
     
     if language.lower() == "python":
         # 检查行长度
-        lines = code.split('\n')
-        for i, line in enumerate(lines):
-            if len(line.strip()) > 100:
-                result["issues"].append({
-                    "line": i + 1,
-                    "issue": "行长度超过100个字符",
-                    "suggestion": "将长行拆分为多行，提高可读性"
-                })
-        
-        # 检查命名规范
-        variable_pattern = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]*\s*=')
-        function_pattern = re.compile(r'def\s+([a-zA-Z_][a-zA-Z0-9_]*)\s*\(')
-        class_pattern = re.compile(r'class\s+([a-zA-Z_][a-zA-Z0-9_]*)')
+        for line_number in _long_lines(analysis):
+            result["issues"].append({
+                "line": line_number,
+                "issue": "行长度超过100个字符",
+                "suggestion": "将长行拆分为多行，提高可读性"
+            })
         
-        for i, line in enumerate(lines):
+        # 检查命名规范（同一行内按变量、函数、类的顺序报告）
+        naming_issues = []
+        for var_match in matches["variable_name"]:
             # 变量命名检查
-            for var_match in variable_pattern.finditer(line):
-                var_name = var_match.group(0).split('=')[0].strip()
-                if var_name.isupper() and '_' not in var_name and len(var_name) > 1:
-                    continue  # 全大写的常量命名是符合规范的
-                if not var_name.islower() and '_' in var_name:
-                    result["issues"].append({
-                        "line": i + 1,
-                        "issue": f"变量名 '{var_name}' 不符合 snake_case 命名规范",
-                        "suggestion": f"使用小写字母和下划线，如 '{var_name.lower()}'"
-                    })
-            
+            var_name = var_match.group(0).split('=')[0].strip()
+            if var_name.isupper() and '_' not in var_name and len(var_name) > 1:
+                continue  # 全大写的常量命名是符合规范的
+            if not var_name.islower() and '_' in var_name:
+                naming_issues.append((var_match.line, 0, var_match.start, {
+                    "line": var_match.line,
+                    "issue": f"变量名 '{var_name}' 不符合 snake_case 命名规范",
+                    "suggestion": f"使用小写字母和下划线，如 '{var_name.lower()}'"
+                }))
+        
+        for func_match in matches["function_name"]:
             # 函数命名检查
-            for func_match in function_pattern.finditer(line):
-                func_name = func_match.group(1)
-                if not func_name.islower() and '_' in func_name:
-                    result["issues"].append({
-                        "line": i + 1,
-                        "issue": f"函数名 '{func_name}' 不符合 snake_case 命名规范",
-                        "suggestion": f"使用小写字母和下划线，如 '{func_name.lower()}'"
-                    })
-            
+            func_name = func_match.group(1)
+            if not func_name.islower() and '_' in func_name:
+                naming_issues.append((func_match.line, 1, func_match.start, {
+                    "line": func_match.line,
+                    "issue": f"函数名 '{func_name}' 不符合 snake_case 命名规范",
+                    "suggestion": f"使用小写字母和下划线，如 '{func_name.lower()}'"
+                }))
+        
+        for class_match in matches["class_name"]:
             # 类命名检查
-            for class_match in class_pattern.finditer(line):
-                class_name = class_match.group(1)
-                if not class_name[0].isupper() or '_' in class_name:
-                    result["issues"].append({
-                        "line": i + 1,
-                        "issue": f"类名 '{class_name}' 不符合 PascalCase 命名规范",
-                        "suggestion": f"使用大写字母开头且不含下划线，如 '{''.join(word.capitalize() for word in class_name.split('_'))}'"
-                    })
+            class_name = class_match.group(1)
+            if not class_name[0].isupper() or '_' in class_name:
+                naming_issues.append((class_match.line, 2, class_match.start, {
+                    "line": class_match.line,
+                    "issue": f"类名 '{class_name}' 不符合 PascalCase 命名规范",
+                    "suggestion": f"使用大写字母开头且不含下划线，如 '{''.join(word.capitalize() for word in class_name.split('_'))}'"
+                }))
+        
+        naming_issues.sort(key=lambda item: item[:3])
+        result["issues"].extend(issue for *_, issue in naming_issues)
         
         # 检查文档字符串
-        docstring_pattern = re.compile(r'"""[\s\S]*?"""')
-        if not docstring_pattern.search(code):
+        if not matches["docstring"]:
             result["suggestions"].append("代码缺少文档字符串，为函数和类添加描述性文档可提高代码可读性")
         
         # 计算质量得分
@@ -88,39 +112,32 @@ def code_quality_check(code: str, language: str = "python") -> Dict:
     
     elif language.lower() in ["javascript", "typescript", "js", "ts"]:
         # 检查行长度
-        lines = code.split('\n')
-        for i, line in enumerate(lines):
-            if len(line.strip()) > 100:
-                result["issues"].append({
-                    "line": i + 1,
-                    "issue": "行长度超过100个字符",
-                    "suggestion": "将长行拆分为多行，提高可读性"
-                })
+        for line_number in _long_lines(analysis):
+            result["issues"].append({
+                "line": line_number,
+                "issue": "行长度超过100个字符",
+                "suggestion": "将长行拆分为多行，提高可读性"
+            })
         
         # 检查命名规范
-        variable_pattern = re.compile(r'\b(var|let|const)\s+([a-zA-Z_$][a-zA-Z0-9_$]*)\s*=')
-        function_pattern = re.compile(r'function\s+([a-zA-Z_$][a-zA-Z0-9_$]*)')
-        class_pattern = re.compile(r'class\s+([a-zA-Z_$][a-zA-Z0-9_$]*)')
-        
-        for i, line in enumerate(lines):
+        for var_match in matches["variable_name"]:
             # 变量命名检查
-            for var_match in variable_pattern.finditer(line):
-                var_name = var_match.group(2)
-                if var_name[0] == '_':
-                    result["issues"].append({
-                        "line": i + 1,
-                        "issue": f"变量名 '{var_name}' 以下划线开头，这在 JavaScript 中不是常见做法",
-                        "suggestion": f"移除前导下划线，使用驼峰命名法 '{var_name.lstrip('_')}'"
-                    })
-                if var_name.isupper() and var_name != var_name.upper():
-                    result["issues"].append({
-                        "line": i + 1,
-                        "issue": f"变量名 '{var_name}' 大小写混用但不是驼峰式",
-                        "suggestion": "使用驼峰命名法 (camelCase)"
-                    })
+            var_name = var_match.group(2)
+            if var_name[0] == '_':
+                result["issues"].append({
+                    "line": var_match.line,
+                    "issue": f"变量名 '{var_name}' 以下划线开头，这在 JavaScript 中不是常见做法",
+                    "suggestion": f"移除前导下划线，使用驼峰命名法 '{var_name.lstrip('_')}'"
+                })
+            if var_name.isupper() and var_name != var_name.upper():
+                result["issues"].append({
+                    "line": var_match.line,
+                    "issue": f"变量名 '{var_name}' 大小写混用但不是驼峰式",
+                    "suggestion": "使用驼峰命名法 (camelCase)"
+                })
         
         # 检查注释
-        if not re.search(r'^\s*\/\*\*[\s\S]*?\*\/', code, re.MULTILINE):
+        if not matches["jsdoc"]:
             result["suggestions"].append("代码缺少 JSDoc 风格注释，为函数和类添加 JSDoc 注释可提高代码可读性")
         
         # 计算质量得分
@@ -137,19 +154,9 @@ def code_quality_check(code: str, language: str = "python") -> Dict:
     
     return result
 
-@tool
-def security_review(code: str, language: str = "python") -> Dict:
-    """
-    对代码进行安全性审查，检查常见的安全漏洞。
-    
-    Args:
-        code: 要检查的代码
-        language: 编程语言，默认为 python
-        
-    Returns:
-        Dict: 包含安全漏洞和修复建议
-    """
-    logging.info(f"Tool: security_review - 审查{language}代码安全性")
+def _check_security(analysis: CodeAnalysis, language: str) -> Dict:
+    """审查代码安全性（基于分析结果的视图）"""
+    matches = _scan_rules(analysis, language)
     
     result = {
         "vulnerabilities": [],
@@ -158,15 +165,15 @@ def security_review(code: str, language: str = "python") -> Dict:
     
     if language.lower() == "python":
         # 检查SQL注入
-        sql_patterns = [
-            (r'cursor\.execute\([^,)]*\%[^,)]*\)', "可能的SQL注入风险"),
-            (r'cursor\.execute\([^,)]*\+[^,)]*\)', "可能的SQL注入风险"),
-            (r'cursor\.execute\(f["\']', "可能的SQL注入风险 (f-string)"),
-            (r'execute\(\s*["\'][^"\']*\{\s*[^}]*\}\s*["\']', "可能的SQL注入风险 (字符串格式化)")
+        sql_rules = [
+            ("sql_percent", "可能的SQL注入风险"),
+            ("sql_concat", "可能的SQL注入风险"),
+            ("sql_fstring", "可能的SQL注入风险 (f-string)"),
+            ("sql_format", "可能的SQL注入风险 (字符串格式化)")
         ]
         
-        for pattern, message in sql_patterns:
-            if re.search(pattern, code):
+        for rule_name, message in sql_rules:
+            if matches[rule_name]:
                 result["vulnerabilities"].append({
                     "type": "SQL注入",
                     "description": message,
@@ -174,7 +181,7 @@ def security_review(code: str, language: str = "python") -> Dict:
                 })
         
         # 检查不安全的反序列化
-        if re.search(r'pickle\.loads?\(|yaml\.load\((?!.*Loader=yaml\.SafeLoader)', code):
+        if matches["unsafe_deserialization"]:
             result["vulnerabilities"].append({
                 "type": "不安全的反序列化",
                 "description": "使用了不安全的反序列化方法",
@@ -182,7 +189,7 @@ def security_review(code: str, language: str = "python") -> Dict:
             })
         
         # 检查命令注入
-        if re.search(r'os\.system\(|subprocess\.call\(|subprocess\.Popen\(|eval\(|exec\(', code):
+        if matches["command_execution"]:
             result["vulnerabilities"].append({
                 "type": "命令注入",
                 "description": "直接执行系统命令或动态代码",
@@ -190,7 +197,7 @@ def security_review(code: str, language: str = "python") -> Dict:
             })
         
         # 检查敏感信息硬编码
-        if re.search(r'password\s*=|api_key\s*=|secret\s*=|token\s*=', code, re.IGNORECASE):
+        if matches["hardcoded_secret"]:
             result["vulnerabilities"].append({
                 "type": "硬编码敏感信息",
                 "description": "代码中可能包含硬编码的密码或API密钥",
@@ -198,7 +205,7 @@ def security_review(code: str, language: str = "python") -> Dict:
             })
         
         # 检查不安全的随机数生成
-        if re.search(r'random\.(random|randint|choice)', code) and not re.search(r'secrets\.|cryptography', code):
+        if matches["insecure_random"] and not matches["secure_random"]:
             result["vulnerabilities"].append({
                 "type": "不安全的随机数",
                 "description": "使用了不加密的随机数生成方法",
@@ -207,7 +214,7 @@ def security_review(code: str, language: str = "python") -> Dict:
             
     elif language.lower() in ["javascript", "typescript", "js", "ts"]:
         # 检查XSS漏洞
-        if re.search(r'innerHTML|outerHTML|document\.write\(', code):
+        if matches["dom_write"]:
             result["vulnerabilities"].append({
                 "type": "XSS漏洞",
                 "description": "直接操作DOM可能导致XSS攻击",
@@ -215,7 +222,7 @@ def security_review(code: str, language: str = "python") -> Dict:
             })
         
         # 检查不安全的eval
-        if re.search(r'eval\(|new Function\(', code):
+        if matches["dynamic_eval"]:
             result["vulnerabilities"].append({
                 "type": "不安全的动态代码执行",
                 "description": "使用eval()或Function构造函数执行动态代码",
@@ -223,7 +230,7 @@ def security_review(code: str, language: str = "python") -> Dict:
             })
         
         # 检查不安全的HTTP
-        if re.search(r'http://', code) and not re.search(r'localhost|127\.0\.0\.1', code):
+        if matches["plain_http"] and not matches["localhost"]:
             result["vulnerabilities"].append({
                 "type": "不安全的HTTP",
                 "description": "使用了非加密的HTTP协议",
@@ -231,7 +238,7 @@ def security_review(code: str, language: str = "python") -> Dict:
             })
         
         # 检查硬编码敏感信息
-        if re.search(r'password\s*=|apiKey\s*=|secret\s*=|token\s*=', code, re.IGNORECASE):
+        if matches["hardcoded_secret"]:
             result["vulnerabilities"].append({
                 "type": "硬编码敏感信息",
                 "description": "代码中可能包含硬编码的密码或API密钥",
@@ -249,28 +256,17 @@ def security_review(code: str, language: str = "python") -> Dict:
     
     return result
 
-@tool
-def best_practices_advisor(code: str, language: str = "python") -> List[Dict]:
-    """
-    根据编程语言的最佳实践，提供代码改进建议。
-    
-    Args:
-        code: 要分析的代码
-        language: 编程语言，默认为 python
-        
-    Returns:
-        List[Dict]: 最佳实践建议列表
-    """
-    logging.info(f"Tool: best_practices_advisor - 提供{language}最佳实践建议")
+def _check_best_practices(analysis: CodeAnalysis, language: str) -> List[Dict]:
+    """提供最佳实践建议（基于分析结果的视图）"""
+    code = analysis.code
+    matches = _scan_rules(analysis, language)
     
     suggestions = []
     
     if language.lower() == "python":
         # 检查不必要的if-else
-        if_else_count = len(re.findall(r'\bif\s+.*:\s*\n.*\belse\s*:', code))
-        if if_else_count > 0:
-            has_ternary = len(re.findall(r'\w+\s+if\s+.*\s+else\s+', code)) > 0
-            if not has_ternary:
+        if matches["if_else"]:
+            if not matches["ternary"]:
                 suggestions.append({
                     "type": "简化条件语句",
                     "description": "代码中有多个if-else语句可能适合使用三元表达式简化",
@@ -278,8 +274,7 @@ def best_practices_advisor(code: str, language: str = "python") -> List[Dict]:
                 })
         
         # 检查列表推导式用法
-        for_in_list = len(re.findall(r'for\s+\w+\s+in\s+.*:.*\.append\(', code))
-        if for_in_list > 0 and 'lambda' not in code:
+        if matches["append_loop"] and 'lambda' not in code:
             suggestions.append({
                 "type": "使用列表推导式",
                 "description": "使用for循环构建列表可以用列表推导式简化",
@@ -295,7 +290,7 @@ def best_practices_advisor(code: str, language: str = "python") -> List[Dict]:
             })
         
         # 检查字典获取值方式
-        if re.search(r'if\s+\w+\s+in\s+\w+:\s*\n\s*.*=\s*\w+\[\w+\]', code):
+        if matches["dict_membership"]:
             suggestions.append({
                 "type": "使用字典get方法",
                 "description": "使用字典的get方法可以简化键存在性检查",
@@ -312,7 +307,7 @@ def best_practices_advisor(code: str, language: str = "python") -> List[Dict]:
             
     elif language.lower() in ["javascript", "typescript", "js", "ts"]:
         # 检查var的使用
-        if re.search(r'\bvar\b', code):
+        if matches["var_keyword"]:
             suggestions.append({
                 "type": "使用let和const",
                 "description": "避免使用var声明变量，优先使用const，其次使用let",
@@ -320,8 +315,7 @@ def best_practices_advisor(code: str, language: str = "python") -> List[Dict]:
             })
         
         # 检查箭头函数使用
-        function_count = len(re.findall(r'function\s*\([^)]*\)', code))
-        if function_count > 0 and '=>' not in code:
+        if matches["function_expression"] and '=>' not in code:
             suggestions.append({
                 "type": "使用箭头函数",
                 "description": "考虑使用箭头函数替代传统函数表达式",
@@ -329,8 +323,8 @@ def best_practices_advisor(code: str, language: str = "python") -> List[Dict]:
             })
         
         # 检查解构赋值
-        if re.search(r'\w+\[\d+\]|\w+\.\w+\s*=', code) and '{' in code and '}' in code:
-            if not re.search(r'const\s*\{\s*\w+\s*\}', code):
+        if matches["member_access"] and '{' in code and '}' in code:
+            if not matches["destructuring"]:
                 suggestions.append({
                     "type": "使用解构赋值",
                     "description": "使用解构赋值简化对象和数组的处理",
@@ -354,4 +348,52 @@ def best_practices_advisor(code: str, language: str = "python") -> List[Dict]:
                 "example": "async function fetchData() {\n  const result = await fetch(url);\n  return await result.json();\n}"
             })
     
-    return suggestions
\ No newline at end of file
+    return suggestions
+
+@tool
+def code_quality_check(code: str, language: str = "python") -> Dict:
+    """
+    检查代码质量，并提供改进建议。
+    
+    Args:
+        code: 要检查的代码
+        language: 编程语言，默认为 python
+        
+    Returns:
+        Dict: 包含代码质量评估结果和改进建议
+    """
+    logging.info(f"Tool: code_quality_check - 检查{language}代码质量")
+    
+    return analyze_code(code).view(("quality", language.lower()), lambda analysis: _check_quality(analysis, language))
+
+@tool
+def security_review(code: str, language: str = "python") -> Dict:
+    """
+    对代码进行安全性审查，检查常见的安全漏洞。
+    
+    Args:
+        code: 要检查的代码
+        language: 编程语言，默认为 python
+        
+    Returns:
+        Dict: 包含安全漏洞和修复建议
+    """
+    logging.info(f"Tool: security_review - 审查{language}代码安全性")
+    
+    return analyze_code(code).view(("security", language.lower()), lambda analysis: _check_security(analysis, language))
+
+@tool
+def best_practices_advisor(code: str, language: str = "python") -> List[Dict]:
+    """
+    根据编程语言的最佳实践，提供代码改进建议。
+    
+    Args:
+        code: 要分析的代码
+        language: 编程语言，默认为 python
+        
+    Returns:
+        List[Dict]: 最佳实践建议列表
+    """
+    logging.info(f"Tool: best_practices_advisor - 提供{language}最佳实践建议")
+    
+    return analyze_code(code).view(("best_practices", language.lower()), lambda analysis: _check_best_practices(analysis, language))
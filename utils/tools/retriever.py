@@ -1,9 +1,23 @@
 import os
+import re
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
-from langchain_chroma import Chroma
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from langchain_core.tools import create_retriever_tool
 
-from adapter.openai_api import embeddings
+from utils.rerank import RERANK_CANDIDATE_FACTOR, Reranker, load_rerank_config
+from utils.retrieval_cache import query_hash, retrieval_cache
+from utils.vectorstore import (
+    chunk_id, get_collection, get_collection_lexical_index, open_vectorstore, scope_filter
+)
 
 # 加载环境变量
 load_dotenv()
@@ -12,36 +26,359 @@ load_dotenv()
 PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "vector_db")
 COLLECTION_NAME = os.getenv("CHROMA_COLLECTION_NAME", "knowledge_base")
 
+# 混合检索配置
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "5"))  # 返回的文档数
+RETRIEVER_FETCH_K = int(os.getenv("RETRIEVER_FETCH_K", "20"))  # 词法与向量检索各自召回的候选数
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))  # 倒数排名融合的平滑常数
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))  # 融合时词法检索的权重
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))  # 融合时向量检索的权重
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "true").lower() == "true"  # 关键词查询只走词法检索
+
+# 多集合联合检索配置
+RETRIEVER_POOL_SIZE = int(os.getenv("RETRIEVER_POOL_SIZE", "32"))  # 常驻的集合检索器（Chroma与全文索引句柄）数
+FEDERATED_MAX_WORKERS = int(os.getenv("FEDERATED_MAX_WORKERS", "8"))  # 单次联合检索并发检索集合的线程数
+FEDERATED_LATENCY_BUDGET_MS = int(os.getenv("FEDERATED_LATENCY_BUDGET_MS", "1500"))  # 单次联合检索的耗时上限
+
+# 标识符特征：下划线、点号、数字、驼峰或全大写缩写
+_IDENTIFIER_PATTERN = re.compile(r"[A-Za-z]\w*[_.\d]\w*|[a-z]+[A-Z]\w*|\b[A-Z]{2,}\b")
+# 引号中的短语
+_QUOTED_PATTERN = re.compile(r"[\"'`“‘「].+?[\"'`”’」]")
+# 查询中的词（英文单词或连续的中文）
+_QUERY_TERM_PATTERN = re.compile(r"[A-Za-z0-9_.]+|[一-鿿]+")
+# 短关键词查询的词数与字数上限
+KEYWORD_QUERY_MAX_TERMS = 3
+KEYWORD_QUERY_MAX_CHARS = 12
+
+
+def is_keyword_query(query: str) -> bool:
+    """
+    判断是否为关键词查询：包含标识符/引号短语，或是不带问句的少量短词
+    这类查询靠字面匹配就能找准，不需要语义向量。
+    """
+    if _IDENTIFIER_PATTERN.search(query) or _QUOTED_PATTERN.search(query):
+        return True
+    terms = _QUERY_TERM_PATTERN.findall(query)
+    return (
+        0 < len(terms) <= KEYWORD_QUERY_MAX_TERMS
+        and sum(len(term) for term in terms) <= KEYWORD_QUERY_MAX_CHARS
+        and not re.search(r"[?？吗呢]", query)
+    )
+
+
+def _fusion_key(document: Document) -> str:
+    """融合时识别同一文本块：与导入时的确定性ID算法相同"""
+    return chunk_id(document.metadata.get("source", ""), document.page_content)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    词法（BM25）与向量混合检索
+    两路各召回 fetch_k 个候选，按加权倒数排名融合（RRF）后取前 k 个；
+    关键词查询且词法检索有完整命中时直接返回词法结果，不调用嵌入服务。
+    结果按集合版本缓存，集合有新的写入后自动失效。
+    返回文档的 metadata["relevance_score"] 为融合分数，各集合之间可以直接比较。
+    设置了 reranker 时融合后保留 k 的若干倍候选，由重排器去重并按 token 预算选出不超过 k 个。
+    """
+
+    vectorstore: Any
+    lexical_index: Any
+    k: int = RETRIEVER_K
+    fetch_k: int = RETRIEVER_FETCH_K
+    rrf_k: int = HYBRID_RRF_K
+    lexical_weight: float = HYBRID_LEXICAL_WEIGHT
+    vector_weight: float = HYBRID_VECTOR_WEIGHT
+    lexical_fast_path: bool = LEXICAL_FAST_PATH
+    cache: Any = None
+    vector_filter: Optional[Dict] = None  # 共享存储模式下限定租户与集合的元数据过滤条件
+    reranker: Any = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if self.cache is None:
+            return self._search(query)
+        # 先读取版本再检索：检索期间集合被写入时，结果记在旧版本下，之后不会被命中
+        key = (
+            self.lexical_index.path, self.lexical_index.collection_name, self.lexical_index.version(),
+            query_hash(query), self.k, self.fetch_k,
+            self.rrf_k, self.lexical_weight, self.vector_weight, self.lexical_fast_path,
+            tuple(self.reranker.config.to_dict().items()) if self.reranker is not None else None
+        )
+        documents = self.cache.get(key)
+        if documents is None:
+            documents = self._search(query)
+            self.cache.put(key, documents)
+        return documents
+
+    def _search(self, query: str) -> List[Document]:
+        if self.lexical_fast_path and is_keyword_query(query):
+            exact_hits = self.lexical_index.search(query, k=self.k, require_all=True)
+            if exact_hits:
+                # 完整命中不足 k 个时用部分命中补足
+                documents = [document for document, _ in exact_hits]
+                if len(documents) < self.k:
+                    seen = {_fusion_key(document) for document in documents}
+                    for document, _ in self.lexical_index.search(query, k=self.k * 2):
+                        if len(documents) >= self.k:
+                            break
+                        if _fusion_key(document) not in seen:
+                            seen.add(_fusion_key(document))
+                            documents.append(document)
+                logging.debug(f"关键词查询走词法检索: {query}")
+                # 全部查询词都命中的结果视为两路检索中排名相同，分数与融合结果可比
+                for rank, document in enumerate(documents, start=1):
+                    document.metadata["relevance_score"] = (
+                        (self.lexical_weight + self.vector_weight) / (self.rrf_k + rank)
+                    )
+                # 快速路径不计算查询向量，重排时相关性只用原排名与词法重合度
+                return self._rerank(query, documents, None)
+
+        lexical_documents = [document for document, _ in self.lexical_index.search(query, k=self.fetch_k)]
+        vector_documents = self.vectorstore.similarity_search(query, k=self.fetch_k, filter=self.vector_filter)
+        documents = self._fuse(lexical_documents, vector_documents)
+        if self.reranker is None:
+            return documents
+        # 向量检索刚计算过查询向量，这里命中查询向量缓存，不会再次调用嵌入服务
+        return self._rerank(query, documents, self.vectorstore.embeddings.embed_query(query))
+
+    def _rerank(self, query: str, documents: List[Document], query_embedding) -> List[Document]:
+        if self.reranker is None:
+            return documents
+        ids = [_fusion_key(document) for document in documents]
+        return self.reranker.rerank(query, documents, ids, self.k, query_embedding)
+
+    def _fuse(self, lexical_documents: List[Document], vector_documents: List[Document]) -> List[Document]:
+        """加权倒数排名融合：score = Σ weight / (rrf_k + rank)，启用重排时多保留一些候选"""
+        scores = {}
+        documents = {}
+        for weight, ranked in ((self.lexical_weight, lexical_documents), (self.vector_weight, vector_documents)):
+            for rank, document in enumerate(ranked, start=1):
+                key = _fusion_key(document)
+                scores[key] = scores.get(key, 0.0) + weight / (self.rrf_k + rank)
+                documents.setdefault(key, document)
+        limit = self.k * RERANK_CANDIDATE_FACTOR if self.reranker is not None else self.k
+        ranked_keys = sorted(scores, key=scores.get, reverse=True)[:limit]
+        for key in ranked_keys:
+            documents[key].metadata["relevance_score"] = scores[key]
+        return [documents[key] for key in ranked_keys]
+
+
+class _Stragglers:
+    """
+    超过耗时上限后仍在运行的集合检索（线程无法中止，只能等它自己结束），按集合计数
+    某个集合仍有这样的检索在运行时，新的联合检索直接跳过该集合，慢集合最多只占一个线程
+    """
+
+    def __init__(self):
+        self._running: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def busy(self, key: Tuple[str, str]) -> bool:
+        with self._lock:
+            return key in self._running
+
+    def add(self, key: Tuple[str, str], future):
+        with self._lock:
+            self._running[key] = self._running.get(key, 0) + 1
+        future.add_done_callback(lambda _: self._finished(key))
+
+    def _finished(self, key: Tuple[str, str]):
+        with self._lock:
+            self._running[key] -= 1
+            if not self._running[key]:
+                del self._running[key]
+
+
+_stragglers = _Stragglers()
+
+
+def _collection_key(retriever) -> Tuple[str, str]:
+    return retriever.lexical_index.path, retriever.lexical_index.collection_name
+
+
+class FederatedRetriever(BaseRetriever):
+    """
+    多集合联合检索
+    查询并发分发到各集合的混合检索器，按融合分数合并取全局前 k 个；
+    超过耗时上限仍未返回的集合不再等待，只返回已完成集合的结果。
+    每次检索使用自己的线程池（线程数不超过 FEDERATED_MAX_WORKERS），超时的检索继续占用的只是本次的线程，
+    不会挤占其他请求；超时仍在运行的集合在其结束前被后续检索跳过（记为未等待），不会在慢集合上越积越多。
+    """
+
+    retrievers: List[Tuple[str, Any]]
+    k: int = RETRIEVER_K
+    latency_budget: float = FEDERATED_LATENCY_BUDGET_MS / 1000
+
+    def _submit(self, query: str):
+        """
+        提交各集合的检索
+        :return: (线程池, 任务 -> (集合名称, 集合键), 被跳过的集合名称)
+        """
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(len(self.retrievers), FEDERATED_MAX_WORKERS)),
+            thread_name_prefix="federated-search"
+        )
+        futures, skipped = {}, []
+        for name, retriever in self.retrievers:
+            key = _collection_key(retriever)
+            if _stragglers.busy(key):
+                skipped.append(name)
+                continue
+            futures[executor.submit(retriever.invoke, query)] = (name, key)
+        return executor, futures, skipped
+
+    @staticmethod
+    def _release(executor: ThreadPoolExecutor, futures: Dict, not_done) -> List[str]:
+        """关闭本次的线程池（不等待），超时的检索登记为仍在运行；返回超时的集合名称"""
+        executor.shutdown(wait=False, cancel_futures=True)
+        for future in not_done:
+            _stragglers.add(futures[future][1], future)
+        return [futures[future][0] for future in not_done]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        started = time.perf_counter()
+        executor, futures, skipped = self._submit(query)
+        done, not_done = wait(futures, timeout=self.latency_budget)
+        timed_out = self._release(executor, futures, not_done)
+        results = [(futures[future][0], future.exception(), None if future.exception() else future.result())
+                   for future in done]
+        return self._merge(query, results, skipped + timed_out, started)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        started = time.perf_counter()
+        executor, futures, skipped = self._submit(query)
+        tasks = {asyncio.wrap_future(future): future for future in futures}
+        done = set()
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=self.latency_budget)
+            for task in pending:
+                # 线程中的检索会继续完成并写入结果缓存，这里只是不再等待
+                task.cancel()
+        timed_out = self._release(executor, futures, [future for task, future in tasks.items() if task not in done])
+        results = [(futures[tasks[task]][0], task.exception(), None if task.exception() else task.result())
+                   for task in done]
+        return self._merge(query, results, skipped + timed_out, started)
+
+    def _merge(self, query, results, timed_out, started) -> List[Document]:
+        """合并各集合结果，标注来源集合"""
+        merged = []
+        for name, error, documents in results:
+            if error is not None:
+                logging.warning(f"集合 {name} 检索失败: {str(error)}")
+                continue
+            for document in documents:
+                document.metadata["collection"] = name
+                merged.append(document)
+        if timed_out:
+            logging.warning(
+                f"联合检索超过 {self.latency_budget * 1000:.0f}ms 上限或上次超时的检索仍在运行，未等待的集合: {', '.join(timed_out)}"
+            )
+        merged.sort(key=lambda document: document.metadata.get("relevance_score", 0.0), reverse=True)
+        logging.debug(
+            f"联合检索 {len(self.retrievers)} 个集合耗时 {(time.perf_counter() - started) * 1000:.0f}ms: {query}"
+        )
+        return merged[:self.k]
+
+
+# 集合检索器句柄池：(数据库绝对路径, 集合名称) -> 混合检索器，按最近使用淘汰
+_retriever_pool: "OrderedDict[Tuple[str, str], HybridRetriever]" = OrderedDict()
+_retriever_pool_lock = threading.Lock()
+
+
+def get_hybrid_retriever(path, collection_name):
+    """
+    从句柄池获取集合的混合检索器，不存在时打开Chroma集合与全文索引并放入池中
+    :param path: 向量数据库路径
+    :param collection_name: 集合名称
+    :return: 混合检索器
+    """
+    key = (os.path.abspath(path), collection_name)
+    with _retriever_pool_lock:
+        retriever = _retriever_pool.get(key)
+        if retriever is not None:
+            _retriever_pool.move_to_end(key)
+            return retriever
+
+    # 加载向量库（按存储后端与存储模式为独立的Chroma目录、共享实例或量化向量文件）
+    db = open_vectorstore(path, collection_name)
+
+    # 加载集合的全文索引
+    collection = get_collection(path, collection_name)
+    lexical_index = get_collection_lexical_index(path, collection_name)
+    lexical_index.ensure_synced(collection)
+
+    # 集合启用了重排时，重排器从同一集合读取文本块向量
+    rerank_config = load_rerank_config(path)
+    reranker = Reranker(rerank_config, collection) if rerank_config.enabled else None
+
+    # 创建混合检索器，返回前 RETRIEVER_K 个最相关的文档，结果按集合版本缓存
+    retriever = HybridRetriever(
+        vectorstore=db,
+        lexical_index=lexical_index,
+        cache=retrieval_cache,
+        vector_filter=scope_filter(path, collection_name),
+        reranker=reranker
+    )
+
+    with _retriever_pool_lock:
+        retriever = _retriever_pool.setdefault(key, retriever)
+        _retriever_pool.move_to_end(key)
+        while len(_retriever_pool) > RETRIEVER_POOL_SIZE:
+            _retriever_pool.popitem(last=False)
+    return retriever
+
+
+def release_retrievers(path):
+    """从句柄池移除某个集合目录下的检索器（删除集合目录前或修改集合的重排配置后调用）"""
+    prefix = os.path.abspath(path)
+    with _retriever_pool_lock:
+        for key in [key for key in _retriever_pool if key[0] == prefix]:
+            del _retriever_pool[key]
+
+
 def get_retriever_tool(path=None, collection_name=None):
     """
-    创建基于Chroma的检索工具
+    创建基于Chroma与本地全文索引的混合检索工具
     :param path: 向量数据库路径，默认使用环境变量中的配置
     :param collection_name: 集合名称，默认使用环境变量中的配置
     :return: 检索工具
     """
     if path is None:
         path = PERSIST_DIRECTORY
-    
+
     if collection_name is None:
         collection_name = COLLECTION_NAME
-    
-    # 加载Chroma数据库
-    db = Chroma(
-        persist_directory=path,
-        embedding_function=embeddings,
-        collection_name=collection_name
-    )
-    
-    # 创建检索器
-    retriever = db.as_retriever(
-        search_kwargs={"k": 5}  # 检索前5个最相关的文档
-    )
-    
+
+    retriever = get_hybrid_retriever(path, collection_name)
+
     # 创建检索工具，将名称改为符合OpenAI API规范的英文
     retriever_tool = create_retriever_tool(
         retriever,
         "knowledge_base",  # 修改为英文名称
         "这里存储着有关于问题的背景资料，you must use this tool!"
     )
-    
+
     return retriever_tool
+
+
+def get_federated_retriever_tool(collections):
+    """
+    创建同时检索多个集合的检索工具（对模型而言仍是一个 knowledge_base 工具）
+    :param collections: (向量数据库路径, 集合名称) 列表
+    :return: 检索工具
+    """
+    retriever = FederatedRetriever(
+        retrievers=[(collection_name, get_hybrid_retriever(path, collection_name))
+                    for path, collection_name in collections]
+    )
+
+    names = "、".join(collection_name for _, collection_name in collections)
+    return create_retriever_tool(
+        retriever,
+        "knowledge_base",
+        f"这里存储着有关于问题的背景资料（知识库: {names}），you must use this tool!"
+    )
@@ -0,0 +1,189 @@
+"""
+代码审查规则引擎
+
+code_reviewer 中的所有正则检查在这里注册为模块加载时预编译的规则，每种语言一个扫描器。
+扫描时逐条规则在全文上各匹配一遍（没有合并为一个大正则：实测合并后的单一模式约慢 4 倍），
+一次扫描得到三个审查工具需要的全部匹配结果，三个工具共用，并随代码分析结果一起缓存。
+每条规则记录命中次数和耗时，便于定位慢规则。
+"""
+
+import bisect
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 规则模式：
+# PRESENCE 只关心是否出现，找到第一个匹配后即停止扫描该规则（对应 re.search）
+# ALL 收集所有不重叠的匹配（对应 re.finditer），这类规则都按行检查，可以分代码块扫描
+PRESENCE = "presence"
+ALL = "all"
+
+_NEWLINE = re.compile("\n")
+
+
+class Rule:
+    """单条预编译规则"""
+
+    def __init__(self, name: str, pattern: str, mode: str = PRESENCE, flags: int = 0):
+        self.name = name
+        self.pattern = pattern
+        self.mode = mode
+        self.flags = flags
+        self.regex = re.compile(pattern, flags)
+
+
+class RuleMatch:
+    """规则匹配结果（行号从1开始）"""
+
+    __slots__ = ("line", "start", "text", "groups")
+
+    def __init__(self, line: int, start: int, text: str, groups: Tuple):
+        self.line = line
+        self.start = start
+        self.text = text
+        self.groups = groups
+
+    def group(self, index: int = 0) -> Optional[str]:
+        return self.text if index == 0 else self.groups[index - 1]
+
+
+class RuleScanner:
+    """
+    规则扫描器
+    规则预编译，扫描时每条规则各在整段代码上运行一遍（PRESENCE 规则用 search 找到第一个匹配即停止，
+    ALL 规则用 finditer），按行检查的规则也直接在全文上匹配，再根据偏移量换算行号，
+    避免逐行循环调用正则。
+    """
+
+    def __init__(self, language: str, rules: List[Rule]):
+        self.language = language
+        self.rules = rules
+        self._lock = threading.Lock()
+
+        self._stats = {
+            rule.name: {"hits": 0, "seconds": 0.0} for rule in rules
+        }
+        self._scan_stats = {"scans": 0, "chars": 0, "seconds": 0.0}
+
+    def scan(self, text: str, mode: Optional[str] = None) -> Dict[str, List[RuleMatch]]:
+        """
+        扫描文本：依次用每条规则匹配全文，每条规则一遍
+        :param text: 待扫描的代码
+        :param mode: 只运行指定模式的规则，默认运行全部规则
+        :return: 规则名 -> 匹配列表（PRESENCE 规则至多一个匹配）
+        """
+        started = time.perf_counter()
+        results: Dict[str, List[RuleMatch]] = {}
+        local_stats: Dict[str, Tuple[int, float]] = {}
+
+        line_starts = [0]
+        line_starts.extend(match.end() for match in _NEWLINE.finditer(text))
+
+        for rule in self.rules:
+            if mode is not None and rule.mode != mode:
+                continue
+            rule_started = time.perf_counter()
+            if rule.mode == PRESENCE:
+                match = rule.regex.search(text)
+                matches = [match] if match is not None else []
+            else:
+                matches = list(rule.regex.finditer(text))
+            results[rule.name] = [
+                RuleMatch(
+                    line=bisect.bisect_right(line_starts, match.start()),
+                    start=match.start(),
+                    text=match.group(0),
+                    groups=match.groups()
+                )
+                for match in matches
+            ]
+            local_stats[rule.name] = (len(matches), time.perf_counter() - rule_started)
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            for name, (hits, seconds) in local_stats.items():
+                self._stats[name]["hits"] += hits
+                self._stats[name]["seconds"] += seconds
+            self._scan_stats["scans"] += 1
+            self._scan_stats["chars"] += len(text)
+            self._scan_stats["seconds"] += elapsed
+
+        return results
+
+    def stats(self) -> Dict:
+        """返回扫描器和各规则的累计计数"""
+        with self._lock:
+            return {
+                "language": self.language,
+                "scanner": dict(self._scan_stats),
+                "rules": {name: dict(values) for name, values in self._stats.items()}
+            }
+
+
+# Python 规则：按行检查的规则用 [^\S\n] 代替 \s，保证在全文上匹配时不会跨行
+# 纯字面量的检查（如 'open('、'=>'）直接用 in 判断，比正则更快，不在此注册
+PYTHON_RULES = [
+    # 代码质量
+    Rule("variable_name", r'\b[a-zA-Z_][a-zA-Z0-9_]*[^\S\n]*=', ALL),
+    Rule("function_name", r'def[^\S\n]+([a-zA-Z_][a-zA-Z0-9_]*)[^\S\n]*\(', ALL),
+    Rule("class_name", r'class[^\S\n]+([a-zA-Z_][a-zA-Z0-9_]*)', ALL),
+    Rule("docstring", r'"""[\s\S]*?"""'),
+    # 安全审查
+    Rule("sql_percent", r'cursor\.execute\([^,)]*\%[^,)]*\)'),
+    Rule("sql_concat", r'cursor\.execute\([^,)]*\+[^,)]*\)'),
+    Rule("sql_fstring", r'cursor\.execute\(f["\']'),
+    Rule("sql_format", r'execute\(\s*["\'][^"\']*\{\s*[^}]*\}\s*["\']'),
+    Rule("unsafe_deserialization", r'pickle\.loads?\(|yaml\.load\((?!.*Loader=yaml\.SafeLoader)'),
+    Rule("command_execution", r'os\.system\(|subprocess\.call\(|subprocess\.Popen\(|eval\(|exec\('),
+    Rule("hardcoded_secret", r'password\s*=|api_key\s*=|secret\s*=|token\s*=', flags=re.IGNORECASE),
+    Rule("insecure_random", r'random\.(random|randint|choice)'),
+    Rule("secure_random", r'secrets\.|cryptography'),
+    # 最佳实践
+    Rule("if_else", r'\bif\s+.*:\s*\n.*\belse\s*:'),
+    Rule("ternary", r'\w+\s+if\s+.*\s+else\s+'),
+    Rule("append_loop", r'for\s+\w+\s+in\s+.*:.*\.append\('),
+    Rule("dict_membership", r'if\s+\w+\s+in\s+\w+:\s*\n\s*.*=\s*\w+\[\w+\]'),
+]
+
+JAVASCRIPT_RULES = [
+    # 代码质量
+    Rule("variable_name", r'\b(var|let|const)[^\S\n]+([a-zA-Z_$][a-zA-Z0-9_$]*)[^\S\n]*=', ALL),
+    Rule("jsdoc", r'^\s*\/\*\*[\s\S]*?\*\/', flags=re.MULTILINE),
+    # 安全审查
+    Rule("dom_write", r'innerHTML|outerHTML|document\.write\('),
+    Rule("dynamic_eval", r'eval\(|new Function\('),
+    Rule("plain_http", r'http://'),
+    Rule("localhost", r'localhost|127\.0\.0\.1'),
+    Rule("hardcoded_secret", r'password\s*=|apiKey\s*=|secret\s*=|token\s*=', flags=re.IGNORECASE),
+    # 最佳实践
+    Rule("var_keyword", r'\bvar\b'),
+    Rule("function_expression", r'function\s*\([^)]*\)'),
+    Rule("member_access", r'\w+\[\d+\]|\w+\.\w+\s*='),
+    Rule("destructuring", r'const\s*\{\s*\w+\s*\}'),
+]
+
+# 每种语言一个扫描器
+SCANNERS = {
+    "python": RuleScanner("python", PYTHON_RULES),
+    "javascript": RuleScanner("javascript", JAVASCRIPT_RULES),
+}
+
+# 语言别名
+LANGUAGE_ALIASES = {
+    "python": "python",
+    "javascript": "javascript",
+    "typescript": "javascript",
+    "js": "javascript",
+    "ts": "javascript",
+}
+
+
+def get_scanner(language: str) -> Optional[RuleScanner]:
+    """获取语言对应的扫描器，不支持的语言返回 None"""
+    return SCANNERS.get(LANGUAGE_ALIASES.get(language.lower()))
+
+
+def get_rule_stats() -> Dict[str, Dict]:
+    """获取所有扫描器的规则计数"""
+    return {language: scanner.stats() for language, scanner in SCANNERS.items()}
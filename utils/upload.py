@@ -0,0 +1,240 @@
+"""
+流式文件上传
+
+直接解析 multipart 请求体：文件分段按块写入目标目录，同时计算 sha256 摘要并累计大小，
+超过上限时在接收过程中立即中止，不会先把整个文件接收下来再检查。
+写入的文件就是后续加载器读取的文件，不再经过临时文件到目标文件的二次复制。
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import Request, status
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:
+    # python-multipart 0.0.13 之前的包名
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# 加载环境变量
+load_dotenv()
+
+KNOWLEDGE_UPLOAD_MAX_BYTES = int(os.getenv("KNOWLEDGE_UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))  # 知识库文件大小上限（字节）
+MCP_CONFIG_MAX_BYTES = int(os.getenv("MCP_CONFIG_MAX_BYTES", str(1024 * 1024)))  # MCP 配置文件大小上限（字节）
+UPLOAD_FIELD_MAX_BYTES = int(os.getenv("UPLOAD_FIELD_MAX_BYTES", str(64 * 1024)))  # 单个普通表单字段的大小上限（字节）
+
+# 请求体中文件以外部分（表单字段、分隔符与分段头）允许的额外大小，用于按 Content-Length 提前拒绝
+_FORM_OVERHEAD_BYTES = 1024 * 1024
+
+
+class UploadError(Exception):
+    """上传请求无效，status_code 为应返回的 HTTP 状态码"""
+
+    def __init__(self, message: str, status_code: int = status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadedFile:
+    """已接收到磁盘的上传文件"""
+
+    def __init__(self, filename: str, path: str):
+        self.filename = filename  # 客户端提供的原始文件名
+        self.path = path  # 磁盘上的文件路径
+        self.size = 0
+        self.digest: Optional[str] = None  # 文件内容的 sha256 十六进制摘要，接收完成后设置
+
+    @property
+    def extension(self) -> str:
+        return file_extension(self.filename)
+
+    def discard(self):
+        """删除已接收的文件"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class StreamedUpload:
+    """一次 multipart 上传的解析结果：普通表单字段与（至多一个）文件"""
+
+    def __init__(self, fields: Dict[str, str], file: Optional[UploadedFile]):
+        self.fields = fields
+        self.file = file
+
+    def discard(self):
+        if self.file is not None:
+            self.file.discard()
+
+
+def file_extension(filename: str) -> str:
+    """文件扩展名（小写，不含点）"""
+    return filename.split('.')[-1].lower()
+
+
+class _MultipartReceiver:
+    """
+    multipart 解析回调
+    解析器的回调是同步的：文件数据先暂存在 _pending，每喂入一块请求体后由 flush 在线程中写盘，
+    暂存的数据量不超过一块请求体。
+    """
+
+    def __init__(self, dest_dir: str, extensions: Iterable[str], max_bytes: int, file_field: str):
+        self.dest_dir = dest_dir
+        self.extensions = list(extensions)
+        self.max_bytes = max_bytes
+        self.file_field = file_field
+
+        self.fields: Dict[str, str] = {}
+        self.file: Optional[UploadedFile] = None
+
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._part_name: Optional[str] = None
+        self._part_is_file = False
+        self._value = bytearray()
+
+        self._pending: List[bytes] = []
+        self._handle = None
+        self._hash = hashlib.sha256()
+
+    def callbacks(self) -> Dict:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished
+        }
+
+    # ---------- 解析回调 ----------
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._part_name = None
+        self._part_is_file = False
+        self._value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        self._part_name = options.get(b"name", b"").decode("utf-8", errors="replace")
+        if b"filename" not in options:
+            return
+
+        filename = os.path.basename(options[b"filename"].decode("utf-8", errors="replace"))
+        if self._part_name != self.file_field or self.file is not None:
+            raise UploadError(f"只能在 {self.file_field} 字段上传一个文件")
+        if not filename:
+            raise UploadError("文件名不能为空")
+        extension = file_extension(filename)
+        if extension not in self.extensions:
+            raise UploadError(f"不支持的文件类型: {extension}。支持的类型: {', '.join(self.extensions)}")
+
+        self._part_is_file = True
+        self.file = UploadedFile(filename, os.path.join(self.dest_dir, f"{uuid.uuid4()}.{extension}"))
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._part_is_file:
+            self.file.size += end - start
+            if self.file.size > self.max_bytes:
+                raise UploadError(f"文件超过大小上限 {self.max_bytes} 字节", 413)
+            self._pending.append(data[start:end])
+        else:
+            self._value += data[start:end]
+            if len(self._value) > UPLOAD_FIELD_MAX_BYTES:
+                raise UploadError(f"表单字段 {self._part_name} 超过大小上限", 413)
+
+    def _on_part_end(self):
+        if not self._part_is_file and self._part_name:
+            self.fields[self._part_name] = self._value.decode("utf-8", errors="replace")
+
+    # ---------- 写盘 ----------
+
+    def flush(self):
+        """把暂存的文件数据写入磁盘并更新摘要（在线程中调用）"""
+        pending, self._pending = self._pending, []
+        if self._handle is None:
+            self._handle = open(self.file.path, "wb")
+        for block in pending:
+            self._hash.update(block)
+            self._handle.write(block)
+
+    def finish(self):
+        """关闭文件并记录摘要；请求中没有文件分段内容时也创建空文件"""
+        self.flush()
+        self._handle.close()
+        self._handle = None
+        self.file.digest = self._hash.hexdigest()
+
+    def abort(self):
+        """关闭并删除未接收完的文件"""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        if self.file is not None:
+            self.file.discard()
+
+
+async def receive_upload(request: Request, dest_dir: str, extensions: Iterable[str],
+                         max_bytes: int, file_field: str = "file") -> StreamedUpload:
+    """
+    按块接收 multipart/form-data 请求体，文件直接写入 dest_dir
+    :param request: 请求（请求体尚未读取）
+    :param dest_dir: 文件保存目录，文件名为 UUID 加原扩展名
+    :param extensions: 允许的文件扩展名（小写，不含点），在文件分段头解析后、接收内容前检查
+    :param max_bytes: 文件大小上限（字节），超过时立即中止接收
+    :param file_field: 文件所在的表单字段名
+    :return: 解析结果，其中的文件已写入磁盘并带有大小与 sha256 摘要
+    :raises UploadError: 请求格式无效、文件类型不支持或超过大小上限，已写入的部分会被删除
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError("请求必须是 multipart/form-data 格式")
+
+    # 声明了请求体大小时先检查，明显超限的请求不读取请求体
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + _FORM_OVERHEAD_BYTES:
+        raise UploadError(f"文件超过大小上限 {max_bytes} 字节", 413)
+
+    os.makedirs(dest_dir, exist_ok=True)
+    receiver = _MultipartReceiver(dest_dir, extensions, max_bytes, file_field)
+    parser = MultipartParser(boundary, receiver.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if receiver._pending:
+                await asyncio.to_thread(receiver.flush)
+        parser.finalize()
+        if receiver.file is None:
+            raise UploadError(f"缺少上传文件字段: {file_field}", 422)
+        await asyncio.to_thread(receiver.finish)
+    except BaseException as e:
+        # 包括客户端中途断开与任务取消
+        await asyncio.to_thread(receiver.abort)
+        if not isinstance(e, UploadError):
+            logging.warning(f"文件上传中止: {type(e).__name__} {str(e)}")
+        raise
+
+    logging.info(f"已接收上传文件 {receiver.file.filename}: {receiver.file.size} 字节")
+    return StreamedUpload(receiver.fields, receiver.file)
+
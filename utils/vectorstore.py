@@ -1,11 +1,18 @@
 from langchain_chroma import Chroma
-from langchain_text_splitters import CharacterTextSplitter
 import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
 from dotenv import load_dotenv
 import chromadb
 
-from adapter.openai_api import embeddings
+from adapter.openai_api import embeddings, embedding_model_name
 from utils.loader import text_loader
+from utils.chunking import chunker_for_file, load_chunking_config
+from utils.lexical_index import get_lexical_index
+from utils.mmap_store import close_mmap_stores, get_mmap_store
 
 # 加载环境变量
 load_dotenv()
@@ -14,14 +21,473 @@ load_dotenv()
 PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "vector_db")
 COLLECTION_NAME = os.getenv("CHROMA_COLLECTION_NAME", "knowledge_base")
 
+# 存储模式：directory 每个集合一个独立的 Chroma 目录；
+# shared 所有集合写入同一个 Chroma 实例的同一个集合，按租户/集合元数据隔离，集合目录只保存清单与分块配置
+STORAGE_MODE = os.getenv("CHROMA_STORAGE_MODE", "directory")
+SHARED_CHROMA_PATH = os.getenv("CHROMA_SHARED_PATH", os.path.join(PERSIST_DIRECTORY, "_shared"))
+SHARED_COLLECTION_NAME = os.getenv("CHROMA_SHARED_COLLECTION", "knowledge_shared")
+
+# 向量存储后端：chroma 使用上面的存储模式；mmap 每个集合目录中保存量化向量文件，检索时内存映射，
+# 多个工作进程共享页缓存（见 utils/mmap_store.py），不使用共享模式
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+# 共享模式下标识文本块所属租户与集合的元数据键
+TENANT_KEY = "kb_tenant"
+SCOPE_KEY = "kb_collection"
+
+# 同步写入时每批嵌入的文本块数
+ADD_BATCH_SIZE = 64
+
+# 集合目录下记录已导入文件的清单文件名
+MANIFEST_FILENAME = "manifest.json"
+_manifest_lock = threading.Lock()
+
+def file_digest(path):
+    """
+    计算文件内容的 sha256 摘要（分块读取）
+    :param path: 文件路径
+    :return: 十六进制摘要
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id(source, text):
+    """
+    由 (来源文件名, 文本块内容) 计算确定性的文本块ID，重复导入同一内容时ID不变
+    :param source: 来源文件名
+    :param text: 文本块内容
+    :return: 文本块ID
+    """
+    return hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+def load_manifest(db_path):
+    """
+    读取集合的导入清单：来源文件名 -> {digest, chunks, bytes, chunking, embedding_model, ingested_at}
+    :param db_path: 集合数据库路径
+    :return: 清单字典，不存在时为空
+    """
+    manifest_path = os.path.join(db_path, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def record_ingestion(db_path, source, digest, chunks, chunking=None, size=None):
+    """
+    在清单中记录已导入的文件（先写临时文件再替换，避免写入中断损坏清单）
+    清单同时是集合统计的来源，统计时不扫描向量库与全文索引。
+    :param db_path: 集合数据库路径
+    :param source: 来源文件名
+    :param digest: 文件内容摘要
+    :param chunks: 写入的文本块数
+    :param chunking: 导入时使用的分块配置（字典）
+    :param size: 源文件字节数
+    """
+    with _manifest_lock:
+        manifest = load_manifest(db_path)
+        manifest[source] = {
+            "digest": digest, "chunks": chunks, "bytes": size, "chunking": chunking,
+            "embedding_model": embedding_model_name, "ingested_at": time.time()
+        }
+        os.makedirs(db_path, exist_ok=True)
+        manifest_path = os.path.join(db_path, MANIFEST_FILENAME)
+        temp_path = f"{manifest_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, manifest_path)
+
+def remove_ingestion(db_path, source):
+    """
+    从清单中移除已删除的文件
+    :return: 清单中是否有该文件
+    """
+    with _manifest_lock:
+        manifest = load_manifest(db_path)
+        if manifest.pop(source, None) is None:
+            return False
+        manifest_path = os.path.join(db_path, MANIFEST_FILENAME)
+        temp_path = f"{manifest_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, manifest_path)
+        return True
+
+def is_unchanged(manifest_entry, digest, chunking):
+    """清单记录的文件内容摘要与分块配置都未变化时，无需重新导入"""
+    return (
+        manifest_entry is not None
+        and manifest_entry.get("digest") == digest
+        and manifest_entry.get("chunking") == chunking
+    )
+
+def delete_source_chunks(collection, source):
+    """删除 chromadb 集合中某个来源文件的全部文本块"""
+    collection.delete(where={"source": source})
+
+def source_chunk_ids(collection, source):
+    """集合中某个来源文件现有文本块的ID集合（文本块ID由内容决定，用于判断哪些文本块未变）"""
+    return set(collection.get(where={"source": source}, include=[])["ids"])
+
+def delete_stale_chunks(collection, lexical_index, stale_ids):
+    """删除新版本文件中已不存在的旧文本块"""
+    stale_ids = list(stale_ids)
+    for start in range(0, len(stale_ids), ADD_BATCH_SIZE * 8):
+        batch = stale_ids[start:start + ADD_BATCH_SIZE * 8]
+        collection.delete(ids=batch)
+        lexical_index.delete_ids(batch)
+    return len(stale_ids)
+
+def iter_chunks(documents, source, chunker=None):
+    """
+    逐个文档拆分为文本块，设置来源并按确定性ID去重
+    文档可以是列表或流式加载器返回的生成器，拆分过程不会一次性持有全部文本块。
+    :param documents: 文档列表或生成器
+    :param source: 来源文件名，写入每个文本块的 metadata["source"]
+    :param chunker: 分块器，默认按来源文件类型选择并使用默认分块配置
+    :return: 生成 (文本块, ID)
+    """
+    if chunker is None:
+        chunker = chunker_for_file(source)
+    seen = set()
+    for chunk in chunker.iter_chunks(documents):
+        doc_id = chunk_id(source, chunk.page_content)
+        if doc_id in seen:
+            continue
+        seen.add(doc_id)
+        chunk.metadata = {**chunk.metadata, "source": source}
+        yield chunk, doc_id
+
+def iter_batches(items, batch_size):
+    """将可迭代对象按批次分组"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iter_changed_chunks(chunks, existing_ids, current_ids):
+    """
+    跳过集合中已存在的文本块（确定性ID相同即内容未变），只生成需要嵌入写入的文本块
+    :param chunks: iter_chunks 生成的 (文本块, ID)
+    :param existing_ids: 集合中该文件已有的文本块ID
+    :param current_ids: 收集新版本全部文本块ID的集合，原地添加
+    """
+    for chunk, doc_id in chunks:
+        current_ids.add(doc_id)
+        if doc_id not in existing_ids:
+            yield chunk, doc_id
+
+def _add_in_batches(collection, documents, source, chunker=None, lexical_index=None, existing_ids=None):
+    """
+    按批次拆分、嵌入并写入向量集合与全文索引（按ID upsert）
+    :param existing_ids: 集合中该文件已有的文本块ID，这些文本块内容未变，不再嵌入写入
+    :return: (新版本的文本块ID集合, 新写入的文本块数)
+    """
+    current_ids = set()
+    chunks = iter_changed_chunks(iter_chunks(documents, source, chunker), existing_ids or set(), current_ids)
+    count = 0
+    for batch in iter_batches(chunks, ADD_BATCH_SIZE):
+        ids = [doc_id for _, doc_id in batch]
+        texts = [chunk.page_content for chunk, _ in batch]
+        metadatas = [chunk.metadata for chunk, _ in batch]
+        collection.upsert(
+            ids=ids,
+            embeddings=embeddings.embed_documents(texts),
+            documents=texts,
+            metadatas=metadatas
+        )
+        if lexical_index is not None:
+            lexical_index.upsert(ids, texts, metadatas)
+        count += len(ids)
+    return current_ids, count
+
+def collection_scope(db_path, collection_name):
+    """
+    共享模式下集合的 (租户, 集合标识)
+    租户为集合目录相对 PERSIST_DIRECTORY 的上级目录（如 user_1），集合标识为目录名，
+    目录名与集合名称不同时（如默认知识库 know_db/knowledge_base）两者都包含在内。
+    """
+    relative = os.path.relpath(os.path.abspath(db_path), os.path.abspath(PERSIST_DIRECTORY))
+    parent, base = os.path.split(relative)
+    tenant = parent.replace(os.sep, "/") or "default"
+    scope = base if base == collection_name else f"{base}/{collection_name}"
+    return tenant, scope
+
+def scope_filter(db_path, collection_name=None):
+    """检索向量时使用的元数据过滤条件，目录模式与 mmap 后端下为 None"""
+    if VECTOR_BACKEND == "mmap" or STORAGE_MODE != "shared":
+        return None
+    tenant, scope = collection_scope(db_path, collection_name or COLLECTION_NAME)
+    return {"$and": [{TENANT_KEY: tenant}, {SCOPE_KEY: scope}]}
+
+class ScopedCollection:
+    """
+    共享 Chroma 集合中某个租户集合的视图
+    接口与 chromadb 集合的 upsert/get/delete/count 相同：写入时补充租户元数据并给ID加上集合前缀
+    （不同集合中相同的文本块ID互不覆盖），读取与删除时自动限定在本集合内，返回的ID与元数据去掉这些附加内容。
+    """
+
+    def __init__(self, collection, tenant, scope):
+        self._collection = collection
+        self.tenant = tenant
+        self.scope = scope
+        self._prefix = f"{tenant}/{scope}/"
+
+    def _where(self, where=None):
+        conditions = [{TENANT_KEY: self.tenant}, {SCOPE_KEY: self.scope}]
+        if where:
+            conditions.append(where)
+        return {"$and": conditions}
+
+    def _strip(self, result):
+        result["ids"] = [doc_id[len(self._prefix):] for doc_id in result["ids"]]
+        if result.get("metadatas"):
+            result["metadatas"] = [
+                {key: value for key, value in (metadata or {}).items() if key not in (TENANT_KEY, SCOPE_KEY)}
+                for metadata in result["metadatas"]
+            ]
+        return result
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self._collection.upsert(
+            ids=[self._prefix + doc_id for doc_id in ids],
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=[{**(metadata or {}), TENANT_KEY: self.tenant, SCOPE_KEY: self.scope} for metadata in metadatas]
+        )
+
+    def get(self, ids=None, where=None, include=("metadatas", "documents"), limit=None, offset=None):
+        return self._strip(self._collection.get(
+            ids=[self._prefix + doc_id for doc_id in ids] if ids is not None else None,
+            where=self._where(where),
+            include=list(include),
+            limit=limit,
+            offset=offset
+        ))
+
+    def delete(self, ids=None, where=None):
+        if ids is not None:
+            self._collection.delete(ids=[self._prefix + doc_id for doc_id in ids])
+        else:
+            self._collection.delete(where=self._where(where))
+
+    def count(self):
+        return len(self._collection.get(where=self._where(), include=[])["ids"])
+
+def get_shared_collection():
+    """获取（不存在时创建）共享 Chroma 实例中存放所有集合的 chromadb 集合"""
+    os.makedirs(SHARED_CHROMA_PATH, exist_ok=True)
+    client = chromadb.PersistentClient(path=SHARED_CHROMA_PATH)
+    return client.get_or_create_collection(name=SHARED_COLLECTION_NAME)
+
+def get_scoped_collection(db_path, collection_name):
+    """共享 Chroma 实例中指定集合的视图（迁移工具在目录模式下也会用到）"""
+    return ScopedCollection(get_shared_collection(), *collection_scope(db_path, collection_name))
+
+def get_collection(db_path, collection_name=None):
+    """
+    获取（不存在时创建）Chroma集合，用于直接写入预先计算好的向量
+    :param db_path: 数据库路径（共享模式下仍用于保存导入清单与分块配置）
+    :param collection_name: 集合名称，默认为环境变量中配置的名称
+    :return: chromadb 集合对象，共享模式下为限定在该集合内的 ScopedCollection，mmap 后端下为 MmapVectorStore
+    """
+    if collection_name is None:
+        collection_name = COLLECTION_NAME
+
+    os.makedirs(db_path, exist_ok=True)
+    if VECTOR_BACKEND == "mmap":
+        return _open_mmap_store(db_path, collection_name)
+    if STORAGE_MODE == "shared":
+        return get_scoped_collection(db_path, collection_name)
+    client = chromadb.PersistentClient(path=db_path)
+    return client.get_or_create_collection(name=collection_name)
+
+def _open_mmap_store(db_path, collection_name):
+    """打开集合的量化向量存储，集合目录中有切换后端前的 Chroma 数据时首次打开会复制过来"""
+    store = get_mmap_store(db_path, collection_name, embeddings)
+    if os.path.exists(os.path.join(db_path, "chroma.sqlite3")):
+        store.ensure_imported(lambda: chromadb.PersistentClient(path=db_path).get_collection(collection_name))
+    return store
+
+def open_vectorstore(db_path, collection_name=None):
+    """
+    打开用于相似度检索的 LangChain 向量库
+    共享模式下返回共享集合，检索时需要带上 scope_filter 返回的过滤条件；mmap 后端下返回集合的 MmapVectorStore。
+    """
+    if collection_name is None:
+        collection_name = COLLECTION_NAME
+
+    if VECTOR_BACKEND == "mmap":
+        return _open_mmap_store(db_path, collection_name)
+    if STORAGE_MODE == "shared":
+        os.makedirs(SHARED_CHROMA_PATH, exist_ok=True)
+        client = chromadb.PersistentClient(path=SHARED_CHROMA_PATH)
+        collection_name = SHARED_COLLECTION_NAME
+    else:
+        client = chromadb.PersistentClient(path=db_path)
+    return Chroma(
+        client=client,
+        embedding_function=embeddings,
+        collection_name=collection_name
+    )
+
+def get_collection_lexical_index(db_path, collection_name=None):
+    """获取集合的全文索引：目录模式下在集合目录中，共享模式下所有集合共用共享目录中的一个索引文件"""
+    if collection_name is None:
+        collection_name = COLLECTION_NAME
+
+    if VECTOR_BACKEND != "mmap" and STORAGE_MODE == "shared":
+        tenant, scope = collection_scope(db_path, collection_name)
+        return get_lexical_index(SHARED_CHROMA_PATH, f"{tenant}/{scope}")
+    return get_lexical_index(db_path, collection_name)
+
+def drop_collection(db_path, collection_name=None):
+    """
+    删除集合的向量与全文索引（删除集合目录前调用）
+    目录模式下数据都在集合目录中，随目录一起删除，无需处理；mmap 后端需要先解除文件映射。
+    """
+    if VECTOR_BACKEND == "mmap":
+        close_mmap_stores(db_path)
+        return
+    if STORAGE_MODE != "shared":
+        return
+    get_collection(db_path, collection_name).delete()
+    get_collection_lexical_index(db_path, collection_name).clear()
+
+def _directory_bytes(path):
+    """目录下所有文件的总字节数"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+def _sqlite_stats(path):
+    """只读打开 SQLite 文件，返回文件大小与空闲页占比"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    return {
+        "bytes": os.path.getsize(path),
+        "free_ratio": round(freelist_count / page_count, 4) if page_count else 0.0
+    }
+
+def index_stats(db_path, collection_name=None):
+    """
+    向量库与全文索引的存储统计（含碎片程度）
+    mmap 后端统计已删除行占比；Chroma 目录模式统计 chroma.sqlite3 的空闲页占比；共享模式下向量库由所有集合共用，不单独统计。
+    """
+    if collection_name is None:
+        collection_name = COLLECTION_NAME
+
+    if VECTOR_BACKEND == "mmap":
+        vectors = _open_mmap_store(db_path, collection_name).storage_stats()
+    elif STORAGE_MODE == "shared":
+        vectors = {"backend": "chroma", "storage_mode": "shared"}
+    else:
+        chroma_path = os.path.join(db_path, "chroma.sqlite3")
+        vectors = {"backend": "chroma", "storage_mode": "directory"}
+        if os.path.exists(chroma_path):
+            vectors.update(_sqlite_stats(chroma_path))
+    return {
+        "vectors": vectors,
+        "lexical": get_collection_lexical_index(db_path, collection_name).storage_stats()
+    }
+
+def collection_stats(db_path, collection_name=None):
+    """
+    集合统计：文件数、文本块数、源文件字节数、嵌入模型与最近导入时间来自导入清单，版本来自全文索引，
+    另附集合目录占用的磁盘空间与索引的碎片程度
+    :param db_path: 集合数据库路径
+    :param collection_name: 集合名称，默认为环境变量中配置的名称
+    :return: 统计字典
+    """
+    if collection_name is None:
+        collection_name = COLLECTION_NAME
+
+    entries = list(load_manifest(db_path).values())
+    return {
+        "collection_name": collection_name,
+        "documents": len(entries),
+        "chunks": sum(entry.get("chunks") or 0 for entry in entries),
+        "source_bytes": sum(entry.get("bytes") or 0 for entry in entries),
+        "disk_bytes": _directory_bytes(db_path),
+        # 本功能上线前导入的文件没有记录嵌入模型，按当前配置的模型计
+        "embedding_models": sorted({entry.get("embedding_model") or embedding_model_name for entry in entries}),
+        "chunking": load_chunking_config(db_path).to_dict(),
+        "version": get_collection_lexical_index(db_path, collection_name).version(),
+        "last_ingested_at": max((entry.get("ingested_at") or 0 for entry in entries), default=None),
+        "index": index_stats(db_path, collection_name)
+    }
+
+def compact_collection(db_path, collection_name=None):
+    """
+    压缩集合的索引：mmap 后端重写向量文件去掉已删除的行并原子切换，全文索引合并分段并回收空闲页
+    Chroma 自身的存储需要停服后用 chroma utils vacuum 处理，这里不在运行中改写。
+    :return: 各索引压缩前后的统计
+    """
+    if collection_name is None:
+        collection_name = COLLECTION_NAME
+
+    result = {"lexical": get_collection_lexical_index(db_path, collection_name).compact()}
+    if VECTOR_BACKEND == "mmap":
+        result["vectors"] = _open_mmap_store(db_path, collection_name).compact()
+    return result
+
+def replace_source(db_path, documents, source, collection_name=None, chunker=None):
+    """
+    用新内容差量替换集合中的来源文件：内容未变的文本块（确定性ID相同）保留不重新嵌入，
+    只嵌入写入新增的文本块，最后删除新版本中已不存在的文本块；集合版本随写入与删除更新
+    :param db_path: 集合数据库路径
+    :param documents: 新版本文件的文档列表或生成器
+    :param source: 来源文件名
+    :param collection_name: 集合名称，默认为环境变量中配置的名称
+    :param chunker: 分块器，默认按来源文件类型与集合的分块配置选择
+    :return: {chunks: 新版本文本块数, written: 新写入数, deleted: 删除数}
+    """
+    if chunker is None:
+        chunker = chunker_for_file(source, load_chunking_config(db_path))
+    collection = get_collection(db_path, collection_name)
+    lexical_index = get_collection_lexical_index(db_path, collection_name)
+    lexical_index.ensure_synced(collection)
+
+    existing_ids = source_chunk_ids(collection, source)
+    current_ids, written = _add_in_batches(collection, documents, source, chunker, lexical_index, existing_ids)
+    deleted = delete_stale_chunks(collection, lexical_index, existing_ids - current_ids)
+    return {"chunks": len(current_ids), "written": written, "deleted": deleted}
+
+def delete_source(db_path, source, collection_name=None):
+    """
+    从集合中删除一个来源文件：删除其全部文本块、全文索引条目与清单记录，集合版本随之更新
+    :return: 集合中是否有该文件
+    """
+    collection = get_collection(db_path, collection_name)
+    lexical_index = get_collection_lexical_index(db_path, collection_name)
+    delete_source_chunks(collection, source)
+    lexical_index.delete_source(source)
+    return remove_ingestion(db_path, source)
+
 # 以某一系列文本创建以Chroma为后端的向量数据库
-def create_vector_db(data_path, db_path=None, loader=text_loader, collection_name=None):
+def create_vector_db(data_path, db_path=None, loader=text_loader, collection_name=None, source=None):
     """
     创建Chroma向量数据库
     :param data_path: 数据文件路径
     :param db_path: 数据库路径，默认为环境变量中配置的路径
-    :param loader: 加载器函数
+    :param loader: 加载器函数，可以返回文档列表或生成器
     :param collection_name: 集合名称，默认为环境变量中配置的名称
+    :param source: 来源文件名，默认为数据文件名
     :return: 创建的Chroma向量数据库
     """
     if db_path is None:
@@ -30,59 +496,59 @@ def create_vector_db(data_path, db_path=None, loader=text_loader, collection_nam
     if collection_name is None:
         collection_name = COLLECTION_NAME
 
-    # 确保目录存在
-    if not os.path.exists(db_path):
-        os.makedirs(db_path)
-        
-    # 加载文档
-    documents = loader(data_path)
+    if source is None:
+        source = os.path.basename(data_path)
     
-    # 拆分文档
-    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-    docs = text_splitter.split_documents(documents)
+    # 创建向量数据库（按存储模式为独立目录或共享实例中的集合）
+    collection = get_collection(db_path, collection_name)
     
-    # 创建向量数据库
-    client = chromadb.PersistentClient(path=db_path)
-    db = Chroma.from_documents(
-        documents=docs, 
-        embedding=embeddings,
-        collection_name=collection_name,
-        client=client
+    # 加载、按集合的分块配置拆分并按批次写入文档
+    chunking = load_chunking_config(db_path)
+    lexical_index = get_collection_lexical_index(db_path, collection_name)
+    lexical_index.ensure_synced(collection)
+    chunk_ids, _ = _add_in_batches(
+        collection, loader(data_path), source, chunker_for_file(source, chunking), lexical_index
+    )
+    record_ingestion(
+        db_path, source, file_digest(data_path), len(chunk_ids), chunking.to_dict(), os.path.getsize(data_path)
     )
     
-    return db
+    return open_vectorstore(db_path, collection_name)
 
-def merge_collections(base_db_path, new_data_path, loader=text_loader, collection_name=None):
+def merge_collections(base_db_path, new_data_path, loader=text_loader, collection_name=None, source=None):
     """
     将新数据合并到现有的Chroma集合中
+    文本块使用确定性ID写入（upsert），重复导入不会产生重复数据；
+    清单中记录的内容摘要与分块配置都未变的文件直接跳过，否则按文本块差量替换，只嵌入变化的文本块。
     :param base_db_path: 基础数据库路径
     :param new_data_path: 新数据文件路径
-    :param loader: 加载器函数
+    :param loader: 加载器函数，可以返回文档列表或生成器
     :param collection_name: 集合名称，默认为环境变量中配置的名称
+    :param source: 来源文件名，默认为数据文件名
     :return: 更新后的Chroma数据库
     """
     if collection_name is None:
         collection_name = COLLECTION_NAME
-        
-    # 加载现有数据库
-    client = chromadb.PersistentClient(path=base_db_path)
-    db = Chroma(
-        client=client,
-        embedding_function=embeddings,
-        collection_name=collection_name
-    )
-    
-    # 加载新文档
-    documents = loader(new_data_path)
     
-    # 拆分文档
-    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-    docs = text_splitter.split_documents(documents)
+    if source is None:
+        source = os.path.basename(new_data_path)
+    digest = file_digest(new_data_path)
+    chunking = load_chunking_config(base_db_path)
+    manifest_entry = load_manifest(base_db_path).get(source)
+        
+    # 内容与分块配置都未变的文件直接跳过
+    if is_unchanged(manifest_entry, digest, chunking.to_dict()):
+        return open_vectorstore(base_db_path, collection_name)
     
-    # 添加到现有集合
-    db.add_documents(docs)
+    # 加载、按集合的分块配置拆分，同名文件只写入新增的文本块并删除已不存在的文本块
+    result = replace_source(
+        base_db_path, loader(new_data_path), source, collection_name, chunker_for_file(source, chunking)
+    )
+    record_ingestion(
+        base_db_path, source, digest, result["chunks"], chunking.to_dict(), os.path.getsize(new_data_path)
+    )
     
-    return db
+    return open_vectorstore(base_db_path, collection_name)
 
 if __name__ == "__main__":
     # 创建数据库示例